@@ -1,63 +1,206 @@
-from fastapi import APIRouter, Depends, Query, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from typing import List, Optional
+from typing import Any, Awaitable, Callable, List, Literal, Optional
+from datetime import datetime
 import time
 import uuid
 
+from app.core.cache import response_cache, etag_matches, make_etag, CacheEntry, RESPONSE_CACHE_MAX_AGE
+from app.core import replicas, serialization
 from app.core.database import get_db
+from app.core.replicas import get_read_db
 from app.models import CryptoAsset, ETLStatus
-from app.core.database import get_db
-from app.models import CryptoAsset, ETLStatus
-from app.schemas.schemas import CryptoAssetResponse, ETLStatusResponse, PaginatedResponse, ETLStatsResponse
-from app.services import stats_service
-from app.ingestion import runner
-from fastapi.responses import PlainTextResponse
+from app.schemas.schemas import (
+    BatchLookupRequest, BatchLookupResponse, ETLStatusResponse, PaginatedResponse, ETLStatsResponse
+)
+from app.services import stats_service, data_service, export_service, history_service, search_service
+from app.ingestion import loader
+from app.ingestion.scheduler import scheduler, RunInProgress
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from app.services.stream_service import price_hub
 
 router = APIRouter()
 
+async def _cached(request: Request, name: str, build: Callable[[], Awaitable[Any]]):
+    """Looks up (or builds and caches) the encoded payload for this endpoint and query string."""
+    key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+
+    async def build_body() -> bytes:
+        return serialization.dumps(await build())
+
+    if replicas.wants_read_your_writes(request.headers.get(replicas.READ_YOUR_WRITES_HEADER)):
+        # A cached body may have been built from a replica that had not caught up
+        body = await build_body()
+        return CacheEntry(body, make_etag(body), response_cache.generation, 0.0), False
+    return await response_cache.get_or_build_async(name, key, build_body)
+
+def _cached_response(request: Request, entry: CacheEntry, hit: bool, body: bytes = None, weak: bool = False) -> Response:
+    """JSON response with validators; 304 when the client already has this version."""
+    headers = {
+        "ETag": ("W/" if weak else "") + entry.etag,
+        "Cache-Control": f"private, max-age={RESPONSE_CACHE_MAX_AGE}",
+        "X-Cache": "HIT" if hit else "MISS",
+    }
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body if body is None else body, media_type="application/json", headers=headers)
+
 @router.get("/data", response_model=PaginatedResponse)
-def get_data(
+async def get_data(
+    request: Request,
     page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1, le=100),
     symbol: Optional[str] = None,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page; replaces page"),
+    count: Optional[Literal["exact", "estimate", "none"]] = Query(
+        None, description="How to compute total (default: exact for page requests, none for cursor requests)"
+    ),
+    db: AsyncSession = Depends(get_read_db)
 ):
     start_time = time.time()
     request_id = str(uuid.uuid4())
 
-    query = db.query(CryptoAsset)
-    
-    if symbol:
-        query = query.filter(CryptoAsset.symbol == symbol)
-    
-    total = query.count()
-    offset = (page - 1) * limit
-    data = query.offset(offset).limit(limit).all()
-    
-    latency_ms = (time.time() - start_time) * 1000
+    if count is None:
+        count = "none" if cursor else "exact"
 
-    return {
-        "data": data,
-        "pagination": {
-            "page": page,
-            "limit": limit,
-            "total": total
-        },
-        "metadata": {
-            "request_id": request_id,
-            "api_latency_ms": latency_ms
+    async def build():
+        # The sync query code runs on asyncpg through run_sync's greenlet
+        data, next_cursor, total, estimated = await db.run_sync(
+            data_service.get_assets_page, limit, page=page, cursor=cursor, symbol=symbol, count=count
+        )
+        return {
+            # Rows come from validated loads, so they are encoded as they are
+            "data": [row._asdict() for row in data],
+            "pagination": {
+                "page": None if cursor else page,
+                "limit": limit,
+                "total": total,
+                "total_is_estimate": estimated,
+                "next_cursor": next_cursor
+            }
         }
-    }
+
+    try:
+        entry, hit = await _cached(request, "data", build)
+    except data_service.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    latency_ms = (time.time() - start_time) * 1000
+
+    # metadata is per request, so it is spliced onto the cached
+    # {"data", "pagination"} object and the ETag is weak
+    metadata = serialization.dumps({"request_id": request_id, "api_latency_ms": latency_ms})
+    body = entry.body[:-1] + b',"metadata":' + metadata + b"}"
+    return _cached_response(request, entry, hit, body=body, weak=True)
+
+@router.post("/data/batch", response_model=BatchLookupResponse)
+async def get_data_batch(body: BatchLookupRequest, db: AsyncSession = Depends(get_read_db)):
+    """
+    Looks up to 1000 symbols (case-insensitive) in one query; `fields`
+    limits the columns returned per asset.
+    """
+    data, unknown = await db.run_sync(data_service.get_assets_by_symbols, body.symbols, body.fields)
+    return Response(serialization.dumps({"data": data, "unknown": unknown}), media_type="application/json")
+
+@router.get("/history/{symbol}")
+async def get_history(
+    request: Request,
+    symbol: str,
+    start: Optional[datetime] = Query(None, description="Defaults to 7 days before end"),
+    end: Optional[datetime] = Query(None, description="Defaults to now"),
+    interval: str = Query("1h", description="Bucket size: <n>m, <n>h, <n>d or <n>w"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """OHLC price buckets for one asset, from asset_price_history."""
+    async def build():
+        return await db.run_sync(history_service.get_history, symbol, start, end, interval)
+
+    try:
+        entry, hit = await _cached(request, "history", build)
+    except history_service.InvalidHistoryQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _cached_response(request, entry, hit)
+
+@router.get("/search")
+async def search_assets(
+    q: str = Query(..., min_length=1, max_length=100, description="Symbol, name or id; prefix or approximate"),
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Autocomplete over assets: exact and prefix matches by market cap, then fuzzy (trigram) matches."""
+    try:
+        return await db.run_sync(search_service.search, q, limit)
+    except search_service.InvalidSearch as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except search_service.SearchUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+@router.get("/stream/prices")
+async def stream_prices(symbols: Optional[str] = Query(None, description="Comma-separated symbols; every asset when omitted")):
+    """
+    Server-Sent Events: a "prices" event with the assets that changed
+    (id, symbol, price_usd, market_cap, last_updated) after each ETL commit.
+    """
+    subscriber = price_hub.subscribe(symbols.split(",") if symbols else None)
+    return StreamingResponse(
+        price_hub.events(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/export")
+async def export_data(
+    dataset: Literal["assets", "history", "raw"] = Query("assets", description="raw needs a single source"),
+    format: Literal["csv", "arrow", "parquet"] = Query("csv"),
+    source: Optional[str] = Query(None, description="Comma-separated sources"),
+    symbol: Optional[str] = Query(None, description="Comma-separated symbols (case-insensitive)"),
+    updated_since: Optional[datetime] = Query(None, description="last_updated, ts or ingested_at >= this"),
+    until: Optional[datetime] = Query(None, description="last_updated, ts or ingested_at < this"),
+):
+    """
+    Streams a whole dataset (crypto_assets, asset_price_history or one raw
+    table) as CSV, an Arrow IPC stream or Parquet, chunk by chunk.
+    """
+    try:
+        export = export_service.export(
+            dataset, format,
+            sources=source.split(",") if source else None,
+            symbols=symbol.split(",") if symbol else None,
+            updated_since=updated_since,
+            until=until,
+        )
+    except export_service.InvalidExport as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        export.chunks,
+        media_type=export.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{export.filename}"'},
+    )
 
 @router.get("/health")
-def health_check(db: Session = Depends(get_db)):
+async def health_check(request: Request, db: AsyncSession = Depends(get_read_db)):
+    async def build():
+        return await db.run_sync(_health)
+
+    try:
+        entry, hit = await _cached(request, "health", build)
+    except DatabaseUnavailable as e:
+        # Never cache an outage; report it uncached until the DB is back
+        return {"database": f"disconnected: {e}", "etl": {"status": "unknown", "last_run": None, "error": None}}
+    return _cached_response(request, entry, hit)
+
+class DatabaseUnavailable(Exception):
+    pass
+
+def _health(db: Session) -> dict:
     # Check DB connectivity
     try:
         db.execute(text("SELECT 1"))
         db_status = "connected"
     except Exception as e:
-        db_status = f"disconnected: {e}"
+        raise DatabaseUnavailable(e) from e
 
     # Check ETL status
     etl_status_record = db.query(ETLStatus).order_by(ETLStatus.last_run.desc()).first()
@@ -73,32 +216,70 @@ def health_check(db: Session = Depends(get_db)):
         etl_info["last_run"] = etl_status_record.last_run
         etl_info["error"] = etl_status_record.error_message
 
-    return {
+    health = {
         "database": db_status,
         "etl": etl_info
     }
+    if replicas.router.replicas:
+        health["replicas"] = replicas.router.status()
+    return health
 
 @router.get("/stats", response_model=ETLStatsResponse)
-def get_stats(db: Session = Depends(get_db)):
-    return stats_service.get_etl_stats(db)
+async def get_stats(request: Request, db: AsyncSession = Depends(get_read_db)):
+    async def build():
+        return await db.run_sync(stats_service.get_etl_stats)
+
+    entry, hit = await _cached(request, "stats", build)
+    return _cached_response(request, entry, hit)
 
 @router.get("/metrics", response_class=PlainTextResponse)
-def get_metrics(db: Session = Depends(get_db)):
-    """Exposes Prometheus-style metrics."""
-    return stats_service.generate_prometheus_metrics(db)
+async def get_metrics():
+    """Exposes Prometheus metrics, rendered from memory without touching the database."""
+    return stats_service.generate_prometheus_metrics()
 
 @router.get("/runs")
-def get_runs(limit: int = 10, db: Session = Depends(get_db)):
+async def get_runs(limit: int = 10, db: AsyncSession = Depends(get_read_db)):
     """Lists past ETL runs."""
-    return stats_service.get_past_runs(db, limit)
+    return await db.run_sync(stats_service.get_past_runs, limit)
+
+@router.get("/runs/{run_id}/profile")
+async def get_run_profile(run_id: str, db: AsyncSession = Depends(get_read_db)):
+    """Span profile of a run, by status id or ETL run id."""
+    profile = await db.run_sync(stats_service.get_run_profile, run_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Run not found or not profiled")
+    return profile
+
+@router.get("/runs/{run_id}/drift")
+async def get_run_drift(run_id: str, db: AsyncSession = Depends(get_read_db)):
+    """Schema drift report of each source in a run, by status id or ETL run id."""
+    report = await db.run_sync(stats_service.get_run_drift, run_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Run not found or has no drift report")
+    return report
+
+@router.post("/drift/{source}/accept")
+def accept_drift(source: str, db: Session = Depends(get_db)):
+    """Accepts a source's last batch as its schema drift baseline, e.g. after an intended upstream change."""
+    if not loader.accept_drift_baseline(db, source):
+        raise HTTPException(status_code=404, detail="Source not found or not profiled yet")
+    return {"source": source, "message": "Last batch accepted as the drift baseline"}
 
 @router.get("/compare-runs")
-def compare_runs(run_id_1: int, run_id_2: int, db: Session = Depends(get_db)):
-    """Compares two ETL runs."""
-    return stats_service.compare_runs(db, run_id_1, run_id_2)
+async def compare_runs(run_id_1: int, run_id_2: int, db: AsyncSession = Depends(get_read_db)):
+    """Compares two ETL runs, overall and per pipeline stage."""
+    return await db.run_sync(stats_service.compare_runs, run_id_1, run_id_2)
 
 @router.post("/etl/run")
-def trigger_etl(background_tasks: BackgroundTasks):
-    """Triggers the ETL process in the background."""
-    background_tasks.add_task(runner.run_etl)
-    return {"message": "ETL process triggered in background"}
+def trigger_etl(source: Optional[List[str]] = Query(None, description="Only these sources (repeatable)")):
+    """
+    Triggers an ETL run in the background and returns its id; 409 while any
+    of its sources is already being run by this or another worker.
+    """
+    try:
+        run_id = scheduler.trigger(source)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RunInProgress as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "run_id": e.run_id, "sources": e.sources})
+    return {"message": "ETL process triggered in background", "run_id": run_id}
@@ -0,0 +1,185 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+# Read endpoints are cached per query string until the next ETL load commits
+# (see bump_generation), or for at most RESPONSE_CACHE_TTL_SECONDS, which
+# also bounds staleness should a worker miss an invalidation.
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "60"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 2**20)))
+# max-age sent to clients; 0 makes them revalidate every poll with If-None-Match
+RESPONSE_CACHE_MAX_AGE = int(os.getenv("RESPONSE_CACHE_MAX_AGE", "0"))
+
+# The process that committed new data NOTIFYs this channel; every other
+# worker's LISTEN connection (stream_service.PriceHub) then bumps its own
+# generation. The payload names the sender so it can skip its own notice.
+CACHE_INVALIDATION_CHANNEL = "cache_invalidation"
+
+@dataclass(frozen=True)
+class CacheEntry:
+    body: bytes
+    etag: str
+    generation: int
+    expires_at: float
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match semantics: weak comparison against a list of tags or '*'."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in tags)
+
+class ResponseCache:
+    """
+    TTL + LRU cache of encoded response bodies, bounded by entry count and
+    total body bytes.
+
+    Entries are stamped with the generation they were built in; bumping the
+    generation invalidates all of them at once without walking the cache.
+    Concurrent misses on one key are single-flighted so a burst of dashboard
+    polls after an ETL run triggers one rebuild, not one per client.
+    """
+
+    def __init__(self, ttl: float = None, max_entries: int = None, max_bytes: int = None):
+        self.ttl = RESPONSE_CACHE_TTL_SECONDS if ttl is None else ttl
+        self.max_entries = RESPONSE_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = RESPONSE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.generation = 0
+        self.bytes = 0
+        self.evictions = 0
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._building: Dict[Hashable, threading.Lock] = {}
+        self._building_async: Dict[Hashable, asyncio.Lock] = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def bump_generation(self) -> int:
+        """Invalidates every entry; call once new data is committed."""
+        with self._lock:
+            self.generation += 1
+            return self.generation
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _lookup(self, key: Hashable, now: float) -> Optional[CacheEntry]:
+        # Caller holds self._lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.generation != self.generation or entry.expires_at <= now:
+            self._discard(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _discard(self, key: Hashable):
+        entry = self._entries.pop(key)
+        self.bytes -= len(entry.body)
+
+    def _store(self, key: Hashable, entry: CacheEntry):
+        if len(entry.body) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._discard(key)
+        self._entries[key] = entry
+        self.bytes += len(entry.body)
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._discard(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _cached_hit(self, name: str, key: Hashable) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._lookup(key, time.monotonic())
+            if entry is not None:
+                self.hits[name] = self.hits.get(name, 0) + 1
+            return entry
+
+    def _start_build(self, name: str, key: Hashable) -> Tuple[Optional[CacheEntry], Optional[int]]:
+        """Re-checks under the build lock; returns (entry, None) on a hit, else (None, generation)."""
+        with self._lock:
+            entry = self._lookup(key, time.monotonic())
+            if entry is not None:
+                self.hits[name] = self.hits.get(name, 0) + 1
+                return entry, None
+            self.misses[name] = self.misses.get(name, 0) + 1
+            return None, self.generation
+
+    def _finish_build(self, key: Hashable, generation: int, body: bytes) -> CacheEntry:
+        entry = CacheEntry(body, make_etag(body), generation, time.monotonic() + self.ttl)
+        with self._lock:
+            # Don't cache a body built from data older than the current generation
+            if generation == self.generation:
+                self._store(key, entry)
+        return entry
+
+    def get_or_build(self, name: str, key: Hashable, build: Callable[[], bytes]) -> Tuple[CacheEntry, bool]:
+        """
+        Returns (entry, hit). On a miss `build()` produces the body, which is
+        cached unless the generation moved on while it ran.
+        """
+        key = (name, key)
+        entry = self._cached_hit(name, key)
+        if entry is not None:
+            return entry, True
+        with self._lock:
+            build_lock = self._building.setdefault(key, threading.Lock())
+
+        with build_lock:
+            entry, generation = self._start_build(name, key)
+            if entry is not None:
+                return entry, True
+            try:
+                body = build()
+            finally:
+                with self._lock:
+                    self._building.pop(key, None)
+            return self._finish_build(key, generation, body), False
+
+    async def get_or_build_async(self, name: str, key: Hashable, build: Callable[[], Awaitable[bytes]]) -> Tuple[CacheEntry, bool]:
+        """get_or_build for coroutine builders; waiting requests yield to the event loop."""
+        key = (name, key)
+        entry = self._cached_hit(name, key)
+        if entry is not None:
+            return entry, True
+        with self._lock:
+            build_lock = self._building_async.setdefault(key, asyncio.Lock())
+
+        async with build_lock:
+            entry, generation = self._start_build(name, key)
+            if entry is not None:
+                return entry, True
+            try:
+                body = await build()
+            finally:
+                with self._lock:
+                    self._building_async.pop(key, None)
+            return self._finish_build(key, generation, body), False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": dict(self.hits),
+                "misses": dict(self.misses),
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "generation": self.generation,
+            }
+
+response_cache = ResponseCache()
@@ -1,7 +1,10 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 import logging
 
@@ -37,14 +40,98 @@ if "@" in DATABASE_URL:
 else:
     logger.info(f"Connecting to database with URL: {DATABASE_URL}")
 
-engine = create_engine(DATABASE_URL)
+# Connection pool, applied to both the sync and the async engine (each
+# process gets its own pools). DB_POOL_DISABLED=true opens a connection per
+# session instead, e.g. behind PgBouncer.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true") == "true"
+DB_POOL_DISABLED = os.getenv("DB_POOL_DISABLED", "false") == "true"
+
+def engine_options() -> dict:
+    if DB_POOL_DISABLED:
+        return {"poolclass": NullPool}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+# libpq query options (?sslmode=require) become asyncpg.connect() keyword
+# arguments, which only exist for a few of them and sometimes under another name
+_ASYNCPG_RENAMED_OPTIONS = {"sslmode": "ssl"}
+_ASYNCPG_OPTIONS = {"ssl", "passfile", "target_session_attrs", "prepared_statement_cache_size"}
+
+def async_url(url: str) -> str:
+    """
+    Same database through the asyncpg driver. libpq-only query options are
+    translated (sslmode -> ssl) or dropped with a warning; asyncpg reads
+    certificates from PGSSLROOTCERT, PGSSLCERT and PGSSLKEY instead.
+    """
+    url = make_url(url)
+    query, dropped = {}, []
+    for key, value in url.query.items():
+        key = _ASYNCPG_RENAMED_OPTIONS.get(key, key)
+        if key in _ASYNCPG_OPTIONS:
+            query[key] = value
+        else:
+            dropped.append(key)
+    if dropped:
+        logger.warning(f"Ignoring connection options asyncpg does not take: {', '.join(sorted(dropped))}")
+    return url.set(drivername="postgresql+asyncpg", query=query).render_as_string(hide_password=False)
+
+engine = create_engine(DATABASE_URL, **engine_options())
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Read endpoints run on the event loop through asyncpg instead of holding a
+# threadpool slot for every DB round trip; the ETL keeps the sync engine.
+async_engine = create_async_engine(async_url(DATABASE_URL), **engine_options())
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
+def add_missing_columns(bind):
+    """
+    Adds nullable columns that were introduced after a table was created.
+
+    create_all() only creates missing tables, so databases from earlier
+    releases would otherwise lack new columns such as raw_*.run_id.
+    """
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                col_type = column.type.compile(dialect=bind.dialect)
+                logger.info(f"Adding column {table.name}.{column.name}")
+                conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS "{column.name}" {col_type}')
+                if column.index:
+                    conn.exec_driver_sql(
+                        f'CREATE INDEX IF NOT EXISTS ix_{table.name}_{column.name} ON {table.name} ("{column.name}")'
+                    )
+
+def add_missing_indexes(bind):
+    """Creates indexes declared after their table already existed."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind, checkfirst=True)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
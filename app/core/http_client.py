@@ -0,0 +1,118 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.core import metrics
+from app.core.resilience import CircuitOpenError, get_circuit_breaker, get_rate_limiter, RETRYABLE_STATUS
+
+logger = logging.getLogger(__name__)
+
+# Connection pool and default timeouts for every upstream call
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+class NotModified(Exception):
+    """Raised when an upstream confirms our cached copy is still current."""
+
+def get_session() -> requests.Session:
+    """Returns the process-wide session, so connections are pooled and kept alive."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def source_timeout(source: str) -> Tuple[float, float]:
+    """(connect, read) timeout, overridable with HTTP_<SOURCE>_CONNECT_TIMEOUT / _READ_TIMEOUT."""
+    prefix = f"HTTP_{source.upper()}_"
+    connect = float(os.getenv(prefix + "CONNECT_TIMEOUT", HTTP_CONNECT_TIMEOUT))
+    read = float(os.getenv(prefix + "READ_TIMEOUT", HTTP_READ_TIMEOUT))
+    return connect, read
+
+def _error_reason(error: requests.RequestException) -> str:
+    if isinstance(error, requests.Timeout):
+        return "timeout"
+    if isinstance(error, requests.ConnectionError):
+        return "connection"
+    return "request"
+
+def get_json(
+    url: str,
+    source: str,
+    params: Dict[str, Any] = None,
+    headers: Dict[str, str] = None,
+    validators: Dict[str, str] = None
+) -> Any:
+    """
+    GETs a JSON document through the shared session.
+
+    `validators` holds the ETag / Last-Modified of the previous response; they
+    are sent as If-None-Match / If-Modified-Since and refreshed in place from
+    the new response. A 304 raises NotModified.
+
+    Every call waits on the host's shared token bucket and goes through the
+    source's circuit breaker: connection errors, timeouts, 429 and 5xx count
+    as failures, and an open circuit raises CircuitOpenError without any
+    network traffic.
+
+    Latency is recorded in upstream_request_duration_seconds and failures
+    in upstream_errors_total, both labelled by source.
+    """
+    headers = dict(headers or {})
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    breaker = get_circuit_breaker(source)
+    try:
+        breaker.before_call()
+    except CircuitOpenError:
+        metrics.UPSTREAM_ERRORS.inc(source=source, reason="circuit_open")
+        raise
+    get_rate_limiter(urlsplit(url).hostname).acquire()
+    start = time.perf_counter()
+    try:
+        response = get_session().get(url, params=params, headers=headers, timeout=source_timeout(source))
+    except requests.RequestException as e:
+        breaker.record_failure()
+        metrics.UPSTREAM_REQUEST_DURATION.observe(time.perf_counter() - start, source=source, status="error")
+        metrics.UPSTREAM_ERRORS.inc(source=source, reason=_error_reason(e))
+        raise
+    metrics.UPSTREAM_REQUEST_DURATION.observe(time.perf_counter() - start, source=source, status=response.status_code)
+    if response.status_code in RETRYABLE_STATUS:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    if response.status_code >= 400:
+        metrics.UPSTREAM_ERRORS.inc(source=source, reason=f"http_{response.status_code}")
+
+    if response.status_code == 304:
+        raise NotModified(f"{source}: {url} not modified")
+    response.raise_for_status()
+
+    if validators is not None:
+        validators.pop("etag", None)
+        validators.pop("last_modified", None)
+        if response.headers.get("ETag"):
+            validators["etag"] = response.headers["ETag"]
+        if response.headers.get("Last-Modified"):
+            validators["last_modified"] = response.headers["Last-Modified"]
+    return response.json()
@@ -0,0 +1,355 @@
+"""
+In-process Prometheus metrics.
+
+Counters, gauges and histograms live in memory and are rendered in the text
+exposition format by render(); a scrape never touches the database. State
+owned by other modules (circuit breakers, the response cache, DB pools, ...)
+is read at scrape time through registered collectors.
+
+Multi-worker uvicorn: with PROMETHEUS_MULTIPROC_DIR set, every process
+writes a snapshot of its metrics to <dir>/<pid>.json every
+METRICS_FLUSH_INTERVAL_SECONDS, and the worker serving /metrics merges
+them: counters and histograms are summed (including those of exited
+workers), gauges follow their `mode` ("sum" and "max" over live workers,
+"latest" takes the most recently set value). Clear the directory when the
+service is (re)deployed.
+"""
+import atexit
+import bisect
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+METRICS_FLUSH_INTERVAL_SECONDS = float(os.getenv("METRICS_FLUSH_INTERVAL_SECONDS", "1"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, str, str, Dict[str, object], float]
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Labels, extra: Tuple[str, str] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, registry: "Registry" = None):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        self._values: Dict[Labels, object] = {}
+        (registry or REGISTRY).register(self)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"type": self.type, "help": self.documentation, "samples": [
+                [list(map(list, labels)), value] for labels, value in self._values.items()
+            ]}
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_labels(labels), 0)
+
+class Gauge(Metric):
+    """`mode` says how values from several workers combine: "sum", "max" or "latest"."""
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, mode: str = "sum", registry: "Registry" = None):
+        self.mode = mode
+        super().__init__(name, documentation, registry)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_labels(labels)] = [value, time.time()]
+
+    def inc(self, amount: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            current = self._values.get(key, [0, 0])[0]
+            self._values[key] = [current + amount, time.time()]
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> Optional[float]:
+        entry = self._values.get(_labels(labels))
+        return entry[0] if entry else None
+
+    def snapshot(self) -> dict:
+        snapshot = super().snapshot()
+        snapshot["mode"] = self.mode
+        return snapshot
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Iterable[float] = DEFAULT_BUCKETS, registry: "Registry" = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, registry)
+
+    def observe(self, value: float, **labels):
+        key = _labels(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket (non-cumulative) counts, plus +Inf; then sum
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(_labels(labels))
+        return sum(entry[0]) if entry else 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"type": self.type, "help": self.documentation, "buckets": list(self.buckets), "samples": [
+                [list(map(list, labels)), [list(counts), total]] for labels, (counts, total) in self._values.items()
+            ]}
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Tuple[Callable[[], Iterable[Sample]], Dict[str, str]]] = []
+
+    def register(self, metric: Metric):
+        self._metrics[metric.name] = metric
+
+    def collector(self, fn: Callable[[], Iterable[Sample]], modes: Dict[str, str] = None):
+        """
+        Registers fn, called on every scrape, yielding (name, type, help,
+        labels, value) samples read from in-memory state. `modes` maps gauge
+        names to their multi-worker mode (default "sum").
+        """
+        self._collectors.append((fn, modes or {}))
+        return fn
+
+    def snapshot(self) -> Dict[str, dict]:
+        """This process's metrics, as stored in multiprocess snapshot files."""
+        families = {name: metric.snapshot() for name, metric in self._metrics.items()}
+        now = time.time()
+        for collect, modes in self._collectors:
+            try:
+                samples = list(collect())
+            except Exception as e:
+                logger.warning(f"Metrics collector {collect.__name__} failed: {e}")
+                continue
+            for name, kind, documentation, labels, value in samples:
+                family = families.setdefault(name, {
+                    "type": kind, "help": documentation, "samples": [],
+                    "mode": modes.get(name, "sum"),
+                })
+                value = [value, now] if kind == "gauge" else value
+                family["samples"].append([list(map(list, _labels(labels))), value])
+        return families
+
+REGISTRY = Registry()
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _merge(snapshots: List[Tuple[int, Dict[str, dict]]]) -> Dict[str, dict]:
+    """Combines per-process snapshots into one {name: family} with merged samples."""
+    merged: Dict[str, dict] = {}
+    for pid, families in snapshots:
+        alive = _alive(pid)
+        for name, family in families.items():
+            target = merged.setdefault(name, {**family, "samples": {}})
+            kind, mode, samples = family["type"], family.get("mode", "sum"), target["samples"]
+            for labels, value in family["samples"]:
+                key = tuple(map(tuple, labels))
+                if kind == "counter":
+                    samples[key] = samples.get(key, 0) + value
+                elif kind == "histogram":
+                    counts, total = samples.get(key, ([0] * len(value[0]), 0.0))
+                    samples[key] = ([a + b for a, b in zip(counts, value[0])], total + value[1])
+                elif mode == "latest":
+                    if key not in samples or value[1] > samples[key][1]:
+                        samples[key] = value
+                elif alive:
+                    if key not in samples:
+                        samples[key] = value
+                    elif mode == "max":
+                        samples[key] = [max(samples[key][0], value[0]), value[1]]
+                    else:
+                        samples[key] = [samples[key][0] + value[0], value[1]]
+    return merged
+
+def _snapshot_path(pid: int = None) -> str:
+    return os.path.join(PROMETHEUS_MULTIPROC_DIR, f"{pid or os.getpid()}.json")
+
+def write_snapshot(registry: Registry = None):
+    """Atomically replaces this process's snapshot file."""
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return
+    path = _snapshot_path()
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump((registry or REGISTRY).snapshot(), f, separators=(",", ":"))
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"Could not write metrics snapshot {path}: {e}")
+
+def _read_snapshots() -> List[Tuple[int, Dict[str, dict]]]:
+    snapshots = []
+    for entry in os.scandir(PROMETHEUS_MULTIPROC_DIR):
+        if not entry.name.endswith(".json"):
+            continue
+        try:
+            pid = int(entry.name[:-5])
+        except ValueError:
+            continue
+        if pid == os.getpid():
+            continue
+        try:
+            with open(entry.path) as f:
+                snapshots.append((pid, json.load(f)))
+        except (OSError, ValueError):
+            # Being replaced right now; the next scrape picks it up
+            continue
+    return snapshots
+
+def render(registry: Registry = None) -> str:
+    """Text exposition of this process's metrics, merged with other workers' snapshots if configured."""
+    registry = registry or REGISTRY
+    snapshots = [(os.getpid(), registry.snapshot())]
+    if PROMETHEUS_MULTIPROC_DIR and os.path.isdir(PROMETHEUS_MULTIPROC_DIR):
+        snapshots += _read_snapshots()
+    lines = []
+    for name, family in sorted(_merge(snapshots).items()):
+        if not family["samples"]:
+            continue
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for labels, value in sorted(family["samples"].items()):
+            if family["type"] == "histogram":
+                counts, total = value
+                cumulative = 0
+                for bound, count in zip(family["buckets"] + [math.inf], counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels, ('le', _format_value(bound)))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+            else:
+                number = value[0] if family["type"] == "gauge" else value
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(number)}")
+    return "\n".join(lines) + "\n"
+
+_flusher: Optional[threading.Thread] = None
+
+def start_flusher():
+    """Writes this process's snapshot periodically (and at exit) when PROMETHEUS_MULTIPROC_DIR is set."""
+    global _flusher
+    if not PROMETHEUS_MULTIPROC_DIR or _flusher is not None:
+        return
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+    def flush_forever():
+        while True:
+            write_snapshot()
+            time.sleep(METRICS_FLUSH_INTERVAL_SECONDS)
+
+    _flusher = threading.Thread(target=flush_forever, name="metrics-flush", daemon=True)
+    _flusher.start()
+    atexit.register(write_snapshot)
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording http_request_duration_seconds per method,
+    route template (not raw path, to keep label cardinality bounded) and
+    status code.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status,
+            )
+
+# HTTP API
+HTTP_REQUEST_DURATION = Histogram("http_request_duration_seconds", "API request latency by route and status.")
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "API requests being served.")
+
+# ETL
+ETL_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+ETL_RUN_DURATION = Histogram("etl_run_duration_seconds", "Duration of ETL runs by outcome.", ETL_BUCKETS)
+ETL_STAGE_DURATION = Histogram("etl_stage_duration_seconds", "Time per pipeline stage call by stage and source.", ETL_BUCKETS)
+ETL_ROWS = Counter("etl_rows_total", "Rows handled by each pipeline stage, by source.")
+ETL_LAST_RUN_STATUS = Gauge("etl_last_run_status", "1 if the latest ETL status is success, else 0.", mode="latest")
+ETL_LAST_RUN_DURATION = Gauge("etl_last_run_duration_seconds", "Duration of the latest finished ETL run.", mode="latest")
+ETL_RECORDS_PROCESSED = Gauge("etl_records_processed", "Records processed per source in its latest run.", mode="latest")
+ETL_DRIFT_ISSUES = Gauge("etl_schema_drift_issues", "Schema drift findings in each source's latest batch, by kind.", mode="latest")
+
+# Upstream APIs
+UPSTREAM_REQUEST_DURATION = Histogram("upstream_request_duration_seconds", "Upstream API latency by source and status.")
+UPSTREAM_ERRORS = Counter("upstream_errors_total", "Failed upstream API calls by source and reason.")
+
+# /stream/prices
+STREAM_SUBSCRIBERS = Gauge("price_stream_subscribers", "Open price stream connections.")
+STREAM_DELTAS = Counter("price_stream_deltas_total", "Price changes received from LISTEN/NOTIFY.")
+STREAM_DROPPED = Counter("price_stream_dropped_total", "Price changes dropped for slow clients, by drop policy.")
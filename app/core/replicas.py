@@ -0,0 +1,181 @@
+import asyncio
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from fastapi import Request
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from app.core.database import AsyncSessionLocal, async_url, engine_options
+
+logger = logging.getLogger(__name__)
+
+# Optional read replicas for the API's read-only routes; the ETL always
+# writes (and reads) through the primary engine in database.py.
+READ_DATABASE_URLS = [
+    url.strip()
+    for url in (os.getenv("READ_DATABASE_URLS") or os.getenv("READ_DATABASE_URL") or "").split(",")
+    if url.strip()
+]
+# A replica is re-checked this often, and skipped while it is down or lags
+# further behind the primary than REPLICA_MAX_LAG_SECONDS.
+REPLICA_HEALTH_INTERVAL_SECONDS = float(os.getenv("REPLICA_HEALTH_INTERVAL_SECONDS", "5"))
+REPLICA_CHECK_TIMEOUT_SECONDS = float(os.getenv("REPLICA_CHECK_TIMEOUT_SECONDS", "2"))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "30"))
+
+# Requests sending this header (true/1/yes) see every write the ETL in this
+# process has committed, e.g. right after POST /etl/run finishes.
+READ_YOUR_WRITES_HEADER = "X-Read-Your-Writes"
+
+_HEALTH_QUERY = text("""
+    SELECT pg_is_in_recovery(),
+           CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END,
+           pg_last_wal_replay_lsn()::text
+""")
+
+def parse_lsn(lsn: Optional[str]) -> Optional[int]:
+    """'16/B374D848' -> comparable integer."""
+    if not lsn:
+        return None
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+# WAL position of the last ETL commit on the primary, see record_primary_write
+_last_write_lsn: Optional[int] = None
+_last_write_lock = threading.Lock()
+
+def record_primary_write(db: Session):
+    """Remembers the primary's WAL position after a commit, for read-your-writes."""
+    global _last_write_lsn
+    lsn = parse_lsn(db.execute(text("SELECT pg_current_wal_lsn()::text")).scalar())
+    with _last_write_lock:
+        _last_write_lsn = max(lsn, _last_write_lsn or 0)
+
+def last_write_lsn() -> Optional[int]:
+    return _last_write_lsn
+
+@dataclass
+class Replica:
+    name: str
+    engine: AsyncEngine
+    sessionmaker: async_sessionmaker
+    healthy: bool = True
+    in_recovery: bool = False
+    lag_seconds: float = 0.0
+    replay_lsn: Optional[int] = None
+    checked_at: float = field(default=float("-inf"))
+
+    def status(self) -> dict:
+        return {
+            "name": self.name,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag_seconds,
+            "standby": self.in_recovery,
+        }
+
+class ReplicaRouter:
+    """
+    Picks the session for a read: replicas in round-robin order, skipping
+    ones that failed their last health check or lag too far behind, and
+    the primary when no replica qualifies.
+    """
+
+    def __init__(self, urls: List[str], primary: async_sessionmaker = None):
+        self.primary = primary or AsyncSessionLocal
+        self.replicas = []
+        for url in urls:
+            replica_engine = create_async_engine(async_url(url), **engine_options())
+            self.replicas.append(Replica(
+                name=make_url(url).render_as_string(hide_password=True),
+                engine=replica_engine,
+                sessionmaker=async_sessionmaker(replica_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False),
+            ))
+        self._counter = itertools.count()
+
+    async def check(self, replica: Replica):
+        """Refreshes the replica's health, lag and replay position."""
+        replica.checked_at = time.monotonic()
+
+        async def probe():
+            async with replica.engine.connect() as conn:
+                return (await conn.execute(_HEALTH_QUERY)).one()
+
+        try:
+            in_recovery, lag, replay_lsn = await asyncio.wait_for(probe(), REPLICA_CHECK_TIMEOUT_SECONDS)
+        except Exception as e:
+            if replica.healthy:
+                logger.warning(f"Read replica {replica.name} is unavailable, using the primary instead: {e}")
+            replica.healthy = False
+            return
+        if not replica.healthy:
+            logger.info(f"Read replica {replica.name} is back")
+        replica.healthy = True
+        replica.in_recovery = bool(in_recovery)
+        replica.lag_seconds = float(lag or 0)
+        replica.replay_lsn = parse_lsn(replay_lsn)
+
+    async def _usable(self, replica: Replica, min_lsn: Optional[int]) -> bool:
+        if time.monotonic() - replica.checked_at >= REPLICA_HEALTH_INTERVAL_SECONDS:
+            await self.check(replica)
+        if not replica.healthy or replica.lag_seconds > REPLICA_MAX_LAG_SECONDS:
+            return False
+        if min_lsn is None:
+            return True
+        # Read-your-writes: only a standby that has replayed past our last
+        # commit will do; anything else could be missing it
+        if not replica.in_recovery:
+            return False
+        if replica.replay_lsn is None or replica.replay_lsn < min_lsn:
+            await self.check(replica)
+        return replica.healthy and replica.replay_lsn is not None and replica.replay_lsn >= min_lsn
+
+    async def choose(self, read_your_writes: bool = False) -> Optional[Replica]:
+        """Next usable replica, or None for the primary."""
+        if not self.replicas:
+            return None
+        min_lsn = None
+        if read_your_writes:
+            min_lsn = last_write_lsn()
+            if min_lsn is None:
+                # This process has no record of the last write; only the primary is safe
+                return None
+        start = next(self._counter)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if await self._usable(replica, min_lsn):
+                return replica
+        return None
+
+    @asynccontextmanager
+    async def session(self, read_your_writes: bool = False):
+        replica = await self.choose(read_your_writes)
+        sessionmaker = replica.sessionmaker if replica else self.primary
+        async with sessionmaker() as db:
+            yield db
+
+    def status(self) -> List[dict]:
+        return [replica.status() for replica in self.replicas]
+
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+router = ReplicaRouter(READ_DATABASE_URLS)
+
+def wants_read_your_writes(value: Optional[str]) -> bool:
+    return (value or "").strip().lower() in ("1", "true", "yes")
+
+async def get_read_db(request: Request):
+    """Session for read-only routes: a healthy replica when configured, else the primary."""
+    read_your_writes = wants_read_your_writes(request.headers.get(READ_YOUR_WRITES_HEADER))
+    async with router.session(read_your_writes) as db:
+        yield db
@@ -1,36 +1,279 @@
+import asyncio
+import email.utils
 import time
 import functools
 import logging
+import os
 import random
+import threading
+from typing import Dict, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
-def retry_with_backoff(retries: int = 3, backoff_factor: float = 2.0):
+# Upper bound for a single backoff sleep, including server-provided Retry-After
+RETRY_MAX_SLEEP = float(os.getenv("RETRY_MAX_SLEEP", "60"))
+
+# Status codes worth retrying; other 4xx responses are the caller's fault
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a source whose circuit breaker is open."""
+
+def _response_of(exc: Exception):
+    return getattr(exc, "response", None)
+
+def retry_after_seconds(exc: Exception) -> Optional[float]:
+    """Seconds requested by a Retry-After header on the exception's response, if any."""
+    response = _response_of(exc)
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        # Neither seconds nor an HTTP date (Python 3.10+ raises here, older versions return None)
+        return None
+    if retry_at is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+def _should_retry(exc: Exception) -> bool:
+    if isinstance(exc, CircuitOpenError):
+        return False
+    response = _response_of(exc)
+    if response is not None and getattr(response, "status_code", None) is not None:
+        return response.status_code in RETRYABLE_STATUS
+    return True
+
+def _next_sleep(exc: Exception, current_delay: float) -> float:
+    sleep_time = current_delay * (1 + random.random() * 0.1) # Add jitter
+    requested = retry_after_seconds(exc)
+    if requested is not None:
+        sleep_time = max(sleep_time, requested)
+    return min(sleep_time, RETRY_MAX_SLEEP)
+
+def retry_with_backoff(retries: int = 3, backoff_factor: float = 2.0, giveup: tuple = ()):
     """
     Decorator to retry a function call with exponential backoff.
-    
+
+    A Retry-After header on a failed response (429/503) overrides the
+    backoff delay. Client errors other than 408/425/429, open circuits and
+    `giveup` exceptions are raised immediately.
+
     Args:
         retries: Maximum number of retries.
         backoff_factor: Multiplier for the sleep time.
+        giveup: Exception types that are re-raised immediately, without retrying.
     """
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             attempt = 0
             current_delay = 1.0 # Start with 1 second
-            
+
             while attempt < retries:
                 try:
                     return func(*args, **kwargs)
+                except giveup:
+                    raise
                 except Exception as e:
                     attempt += 1
-                    if attempt >= retries:
-                        logger.error(f"Function {func.__name__} failed after {retries} attempts. Error: {e}")
+                    if attempt >= retries or not _should_retry(e):
+                        logger.error(f"Function {func.__name__} failed after {attempt} attempts. Error: {e}")
                         raise e
-                    
-                    sleep_time = current_delay * (1 + random.random() * 0.1) # Add jitter
+
+                    sleep_time = _next_sleep(e, current_delay)
                     logger.warning(f"Function {func.__name__} failed (Attempt {attempt}/{retries}). Retrying in {sleep_time:.2f}s... Error: {e}")
                     time.sleep(sleep_time)
                     current_delay *= backoff_factor
         return wrapper
     return decorator
+
+def async_retry_with_backoff(retries: int = 3, backoff_factor: float = 2.0, giveup: tuple = ()):
+    """Async variant of retry_with_backoff for coroutine functions."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            attempt = 0
+            current_delay = 1.0
+
+            while attempt < retries:
+                try:
+                    return await func(*args, **kwargs)
+                except giveup:
+                    raise
+                except Exception as e:
+                    attempt += 1
+                    if attempt >= retries or not _should_retry(e):
+                        logger.error(f"Function {func.__name__} failed after {attempt} attempts. Error: {e}")
+                        raise e
+
+                    sleep_time = _next_sleep(e, current_delay)
+                    logger.warning(f"Function {func.__name__} failed (Attempt {attempt}/{retries}). Retrying in {sleep_time:.2f}s... Error: {e}")
+                    await asyncio.sleep(sleep_time)
+                    current_delay *= backoff_factor
+        return wrapper
+    return decorator
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: float) -> float:
+        """Takes `tokens` (possibly going into debt) and returns how long to wait for them."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, tokens: float = 1.0):
+        """Blocks until `tokens` are available."""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: float = 1.0):
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+class CircuitBreaker:
+    """
+    Fails fast while a source is down.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls raise CircuitOpenError for `recovery_timeout` seconds. Then one
+    trial call is let through (half-open): success closes the circuit,
+    failure opens it again.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._state = self.CLOSED
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def before_call(self):
+        """Raises CircuitOpenError unless a call may go through now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.OPEN and time.monotonic() - self.opened_at < self.recovery_timeout:
+                raise CircuitOpenError(f"Circuit for {self.name} is open")
+            # Recovery timeout elapsed: allow a single trial call
+            if self._trial_in_flight:
+                raise CircuitOpenError(f"Circuit for {self.name} is half-open, trial call in flight")
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._state = self.CLOSED
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self._state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def call(self, func, *args, **kwargs):
+        self.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    async def call_async(self, func, *args, **kwargs):
+        self.before_call()
+        try:
+            result = await func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+# Requests per second and burst for known upstream hosts. CoinGecko's free
+# tier allows roughly 30 calls/minute. Override with
+# HTTP_RATE_LIMITS="host=rate/burst,other.host=rate/burst".
+DEFAULT_RATE_LIMIT: Tuple[float, float] = (5.0, 10.0)
+HOST_RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "api.coingecko.com": (0.5, 5.0),
+    "api.coinpaprika.com": (2.0, 5.0),
+}
+
+def _parse_rate_limits(value: str) -> Dict[str, Tuple[float, float]]:
+    limits = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        host, _, spec = entry.partition("=")
+        rate, _, burst = spec.partition("/")
+        limits[host.strip()] = (float(rate), float(burst or rate))
+    return limits
+
+HOST_RATE_LIMITS.update(_parse_rate_limits(os.getenv("HTTP_RATE_LIMITS", "")))
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RECOVERY_TIMEOUT = float(os.getenv("CIRCUIT_RECOVERY_TIMEOUT", "60"))
+
+_rate_limiters: Dict[str, TokenBucket] = {}
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+def get_rate_limiter(host: str) -> TokenBucket:
+    """Returns the token bucket shared by every thread talking to `host`."""
+    with _registry_lock:
+        if host not in _rate_limiters:
+            rate, burst = HOST_RATE_LIMITS.get(host, DEFAULT_RATE_LIMIT)
+            _rate_limiters[host] = TokenBucket(rate, burst)
+        return _rate_limiters[host]
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    with _registry_lock:
+        if name not in _circuit_breakers:
+            _circuit_breakers[name] = CircuitBreaker(name, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RECOVERY_TIMEOUT)
+        return _circuit_breakers[name]
+
+def circuit_breakers() -> Dict[str, CircuitBreaker]:
+    with _registry_lock:
+        return dict(_circuit_breakers)
@@ -0,0 +1,104 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models import CryptoAsset
+from app.schemas.schemas import CryptoAssetCreate
+
+# Unchanged assets are still rewritten once this many seconds have passed
+# since their last write, to keep last_updated fresh. 0 disables touching.
+ETL_TOUCH_INTERVAL_SECONDS = float(os.getenv("ETL_TOUCH_INTERVAL_SECONDS", "3600"))
+
+def fingerprint(price_usd, market_cap, name, source) -> str:
+    """Stable digest of the columns a load would write."""
+    key = f"{price_usd!r}|{market_cap!r}|{name}|{source}"
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+def asset_fingerprint(asset: CryptoAssetCreate) -> str:
+    return fingerprint(asset.price_usd, asset.market_cap, asset.name, asset.source)
+
+class ChangeTracker:
+    """
+    Remembers a fingerprint and last write time per asset id, so a run only
+    sends new or changed assets (plus ones due for a touch) to the loader.
+
+    State lives in memory for the life of the process; `seed` rebuilds it
+    from crypto_assets itself, which is what makes it survive restarts.
+    """
+
+    def __init__(self, touch_interval: float = None):
+        self.touch_interval = ETL_TOUCH_INTERVAL_SECONDS if touch_interval is None else touch_interval
+        self.seeded = False
+        self._state: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._state)
+
+    def seed(self, db: Session):
+        """Loads fingerprints of the rows already in crypto_assets."""
+        rows = db.query(
+            CryptoAsset.id, CryptoAsset.price_usd, CryptoAsset.market_cap,
+            CryptoAsset.name, CryptoAsset.source, CryptoAsset.last_updated
+        ).all()
+        with self._lock:
+            for row in rows:
+                written_at = row.last_updated.timestamp() if row.last_updated else 0.0
+                self._state[row.id] = (fingerprint(row.price_usd, row.market_cap, row.name, row.source), written_at)
+            self.seeded = True
+
+    def _classify(self, asset: CryptoAssetCreate, now: float) -> str:
+        previous = self._state.get(asset.id)
+        if previous is None:
+            return "new"
+        if previous[0] != asset_fingerprint(asset):
+            return "changed"
+        if self.touch_interval and now - previous[1] >= self.touch_interval:
+            return "touched"
+        return "unchanged"
+
+    def partition(self, assets: List[CryptoAssetCreate], now: float = None) -> Tuple[List[CryptoAssetCreate], Dict[str, Dict[str, int]]]:
+        """
+        Splits assets into the ones that need writing and per-source counts
+        of new / changed / unchanged / touched assets.
+        """
+        now = time.time() if now is None else now
+        to_write = []
+        counts: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            for asset in assets:
+                source_counts = counts.setdefault(asset.source, {"new": 0, "changed": 0, "unchanged": 0, "touched": 0})
+                kind = self._classify(asset, now)
+                source_counts[kind] += 1
+                if kind != "unchanged":
+                    to_write.append(asset)
+        return to_write, counts
+
+    def skipped(self, assets: List[CryptoAssetCreate], counts: Dict[str, Dict[str, int]], now: float = None):
+        """
+        Moves assets the loader did not write (e.g. held by a higher-priority
+        source) from their count in `counts`, as returned by partition, to
+        "skipped". Call before commit, which they must not go through.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            for asset in assets:
+                source_counts = counts[asset.source]
+                source_counts[self._classify(asset, now)] -= 1
+                source_counts["skipped"] = source_counts.get("skipped", 0) + 1
+
+    def commit(self, written: List[CryptoAssetCreate], now: float = None):
+        """Records assets as written; call only once their load has committed."""
+        now = time.time() if now is None else now
+        with self._lock:
+            for asset in written:
+                self._state[asset.id] = (asset_fingerprint(asset), now)
+
+    def clear(self):
+        with self._lock:
+            self._state.clear()
+            self.seeded = False
@@ -0,0 +1,131 @@
+"""
+Columnar transform path: normalizes a whole batch into pandas columns and
+validates it with vectorized masks instead of building and validating one
+Pydantic model per row. It applies the same rules as the row-wise
+transformers in transformer.py (see tests/test_columnar.py for parity).
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+from pandas.api.types import infer_dtype
+
+from app.schemas.schemas import CryptoAssetCreate
+
+UNIFIED_COLUMNS = ["id", "symbol", "name", "price_usd", "market_cap", "source"]
+
+@dataclass
+class AssetRow:
+    """
+    Already-validated unified asset with the same attributes as
+    CryptoAssetCreate, at a fraction of the cost of building one model per
+    row. unify_assets, the change tracker and the loader all accept it.
+    """
+    # Declared by hand: dataclass(slots=True) needs Python 3.10
+    __slots__ = ("id", "symbol", "name", "price_usd", "market_cap", "source")
+
+    id: str
+    symbol: str
+    name: str
+    price_usd: float
+    market_cap: Optional[float]
+    source: str
+
+@dataclass
+class ColumnarBatch:
+    """Valid rows in unified columns, plus rejected rows with a reason."""
+    frame: pd.DataFrame
+    rejects: pd.DataFrame
+
+    def _columns(self) -> List[list]:
+        # Column-wise tolist() + zip is several times faster than to_dict("records")
+        columns = [self.frame[name].tolist() for name in UNIFIED_COLUMNS]
+        market_cap = UNIFIED_COLUMNS.index("market_cap")
+        columns[market_cap] = [None if value != value else value for value in columns[market_cap]]
+        return columns
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """Unified rows as dicts, ready for loader.load_unified_data."""
+        return [dict(zip(UNIFIED_COLUMNS, values)) for values in zip(*self._columns())]
+
+    def records(self) -> List[AssetRow]:
+        return [AssetRow(*values) for values in zip(*self._columns())]
+
+    def assets(self) -> List[CryptoAssetCreate]:
+        # Rows already passed the masks, so skip re-validation
+        return [CryptoAssetCreate.model_construct(**row) for row in self.rows()]
+
+def _records(raw: List[Dict[str, Any]], keys: List[str]) -> pd.DataFrame:
+    """One column per key; missing keys and columns come back as NaN."""
+    return pd.DataFrame.from_records(raw, columns=keys) if raw else pd.DataFrame(columns=keys, dtype=object)
+
+def _is_str(series: pd.Series) -> pd.Series:
+    if infer_dtype(series, skipna=False) == "string":
+        return pd.Series(True, index=series.index)
+    return series.map(lambda value: isinstance(value, str)).astype(bool)
+
+def _upper(series: pd.Series) -> pd.Series:
+    return series.map(lambda value: value.upper() if isinstance(value, str) else value)
+
+def _to_float(series: pd.Series) -> pd.Series:
+    """Like float(): numbers and numeric strings convert, anything else is NaN."""
+    return pd.to_numeric(series, errors="coerce").astype(float)
+
+def _validate(frame: pd.DataFrame, source: str, price_raw: pd.Series, market_cap_raw: pd.Series, truthy_market_cap: bool) -> ColumnarBatch:
+    """Applies the CryptoAssetCreate rules as masks and splits off rejects."""
+    reasons = pd.Series(None, index=frame.index, dtype=object)
+
+    def reject(mask: pd.Series, reason: str):
+        reasons[mask & reasons.isna()] = reason
+
+    reject(~_is_str(frame["id"]), "invalid id")
+    reject(~_is_str(frame["symbol"]), "invalid symbol")
+    reject(~_is_str(frame["name"]), "invalid name")
+
+    price = _to_float(price_raw)
+    reject(price.isna() & price_raw.notna(), "invalid price_usd")
+    reject(price.isna(), "missing price_usd")
+    reject(~(price > 0), "price_usd must be > 0")
+
+    market_cap = _to_float(market_cap_raw)
+    unknown = market_cap_raw.isna()
+    if truthy_market_cap:
+        # `float(x) if x else None`: zero and empty values mean "unknown"
+        unknown |= market_cap_raw.map(lambda value: not value).astype(bool)
+    reject(market_cap.isna() & ~unknown, "invalid market_cap")
+    market_cap = market_cap.where(~unknown)
+
+    frame = frame.assign(price_usd=price, market_cap=market_cap, source=source)
+    rejected = reasons.notna()
+    rejects = pd.DataFrame({
+        "index": frame.index[rejected],
+        "id": frame.loc[rejected, "id"].tolist(),
+        "reason": reasons[rejected].tolist(),
+    })
+    return ColumnarBatch(frame.loc[~rejected, UNIFIED_COLUMNS].reset_index(drop=True), rejects)
+
+def transform_coinpaprika(raw: List[Dict[str, Any]]) -> ColumnarBatch:
+    usd = [((item.get("quotes") or {}).get("USD") or {}) for item in raw]
+    price = pd.Series([quote.get("price", 0) for quote in usd], dtype=object)
+    market_cap = pd.Series([quote.get("market_cap", 0) for quote in usd], dtype=object)
+    frame = _records(raw, ["id", "symbol", "name"])
+    return _validate(frame, "coinpaprika", price, market_cap, truthy_market_cap=False)
+
+def transform_coingecko(raw: List[Dict[str, Any]]) -> ColumnarBatch:
+    records = _records(raw, ["id", "symbol", "name", "current_price", "market_cap"])
+    frame = records[["id", "name"]].assign(symbol=_upper(records["symbol"]))
+    return _validate(frame, "coingecko", records["current_price"], records["market_cap"], truthy_market_cap=True)
+
+def transform_csv(raw: List[Dict[str, Any]]) -> ColumnarBatch:
+    records = _records(raw, ["symbol", "name", "price_usd", "market_cap"])
+    symbol = records["symbol"]
+    frame = records[["symbol", "name"]].assign(
+        id=symbol.map(lambda value: f"csv-{value.lower()}" if isinstance(value, str) else None)
+    )
+    return _validate(frame, "csv", records["price_usd"], records["market_cap"], truthy_market_cap=True)
+
+TRANSFORMS = {
+    "coinpaprika": transform_coinpaprika,
+    "coingecko": transform_coingecko,
+    "csv": transform_csv,
+}
@@ -0,0 +1,169 @@
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from sqlalchemy.orm import Session
+
+from app.core.http_client import NotModified
+from app.ingestion import columnar, extractor, transformer, loader
+from app.models import RawCoinGecko, RawCoinPaprika, RawCSV
+from app.schemas.schemas import CryptoAssetCreate
+
+logger = logging.getLogger(__name__)
+
+class SourceConnector(ABC):
+    """
+    An ingestion source: how to fetch it, land it raw, transform it into the
+    unified schema, and which keys its payload is expected to carry.
+
+    `priority` decides which source wins when several report the same
+    symbol; the highest priority overwrites the others.
+
+    A `streaming` connector is consumed through open_stream() chunk by chunk
+    instead of being fetched into memory in one go.
+
+    `raw_model` is the raw_* table load_raw() lands into; retention prunes it.
+
+    fetch, load_raw and transform are abstract, so a connector missing one
+    can't be instantiated (let alone registered).
+    """
+    name: str = ""
+    priority: int = 0
+    expected_keys: Set[str] = set()
+    streaming: bool = False
+    raw_model = None
+
+    @abstractmethod
+    def fetch(self, validators: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """
+        Returns the source's raw items. `validators` holds whatever the
+        previous successful fetch left there (ETag, Last-Modified, ...) and
+        may be updated in place; raise http_client.NotModified to skip the run.
+        """
+
+    def open_stream(self, validators: Dict[str, Any] = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Returns an iterator of item batches. Checks that need to fail fast
+        (such as NotModified) happen here, before the first batch is read.
+        Streaming connectors override it; by default it is fetch() as one batch.
+        """
+        return iter([self.fetch(validators)])
+
+    @abstractmethod
+    def load_raw(self, db: Session, data: List[Dict[str, Any]], run_id: str = None):
+        """Lands the items in the source's raw table, tagged with `run_id`."""
+
+    @abstractmethod
+    def transform(self, data: List[Dict[str, Any]]) -> List[CryptoAssetCreate]:
+        """Turns raw items into unified assets."""
+
+def _transform(source: str, data: List[Dict[str, Any]], rowwise) -> List[CryptoAssetCreate]:
+    """Runs the columnar transform for `source` unless ETL_TRANSFORM_MODE=rowwise."""
+    if transformer.ETL_TRANSFORM_MODE == "rowwise":
+        return rowwise(data)
+    batch = columnar.TRANSFORMS[source](data)
+    if len(batch.rejects):
+        reasons = batch.rejects["reason"].value_counts().to_dict()
+        logger.warning(f"Rejected {len(batch.rejects)} of {len(data)} {source} items: {reasons}")
+    return batch.records()
+
+_registry: Dict[str, SourceConnector] = {}
+
+def register(connector: SourceConnector) -> SourceConnector:
+    """Adds (or replaces) a connector in the registry."""
+    if not isinstance(connector, SourceConnector):
+        raise TypeError(f"{connector!r} is not a SourceConnector")
+    if not connector.name:
+        raise ValueError("Connector must define a name")
+    _registry[connector.name] = connector
+    return connector
+
+def unregister(name: str):
+    _registry.pop(name, None)
+
+def get_connector(name: str) -> Optional[SourceConnector]:
+    return _registry.get(name)
+
+def get_connectors() -> List[SourceConnector]:
+    """Registered connectors, highest priority first."""
+    return sorted(_registry.values(), key=lambda c: c.priority, reverse=True)
+
+def priorities() -> Dict[str, int]:
+    return {connector.name: connector.priority for connector in _registry.values()}
+
+class CoinPaprikaConnector(SourceConnector):
+    # /v1/tickers returns the whole market in one response, so there is
+    # nothing to paginate.
+    name = "coinpaprika"
+    priority = 20
+    raw_model = RawCoinPaprika
+    expected_keys = {"id", "name", "symbol", "rank", "circulating_supply", "total_supply", "max_supply", "beta_value", "first_data_at", "last_updated", "quotes"}
+
+    def fetch(self, validators=None):
+        return extractor.fetch_coinpaprika_data(validators=validators)
+
+    def load_raw(self, db, data, run_id=None):
+        loader.load_raw_coinpaprika(db, data, run_id=run_id)
+
+    def transform(self, data):
+        return _transform(self.name, data, transformer.transform_coinpaprika_data)
+
+class CoinGeckoConnector(SourceConnector):
+    name = "coingecko"
+    priority = 30
+    raw_model = RawCoinGecko
+    expected_keys = {"id", "symbol", "name", "image", "current_price", "market_cap", "market_cap_rank", "fully_diluted_valuation", "total_volume", "high_24h", "low_24h", "price_change_24h", "price_change_percentage_24h", "market_cap_change_24h", "market_cap_change_percentage_24h", "circulating_supply", "total_supply", "max_supply", "ath", "ath_change_percentage", "ath_date", "atl", "atl_change_percentage", "atl_date", "roi", "last_updated"}
+
+    def fetch(self, validators=None):
+        return extractor.fetch_coingecko_data(validators=validators)
+
+    def load_raw(self, db, data, run_id=None):
+        loader.load_raw_coingecko(db, data, run_id=run_id)
+
+    def transform(self, data):
+        return _transform(self.name, data, transformer.transform_coingecko_data)
+
+class CSVConnector(SourceConnector):
+    name = "csv"
+    priority = 10
+    raw_model = RawCSV
+    expected_keys = {"symbol", "name", "price_usd", "market_cap"}
+    streaming = True
+
+    def __init__(self, path: str = None):
+        # A path, glob pattern, or comma-separated list of either
+        self.path = path or os.getenv(
+            "CSV_SOURCE_PATH", os.path.join(os.path.dirname(__file__), "../data/source.csv")
+        )
+
+    def open_stream(self, validators=None):
+        paths = extractor.resolve_csv_paths(self.path)
+        if validators is not None:
+            # One size/mtime fingerprint per file; unchanged files are skipped
+            changed = []
+            for path in paths:
+                if not os.path.exists(path):
+                    changed.append(path)
+                    continue
+                current = extractor.csv_file_fingerprint(path)
+                if validators.get(path) != current:
+                    validators[path] = current
+                    changed.append(path)
+            if paths and not changed:
+                raise NotModified(f"csv: {self.path} not modified")
+            paths = changed
+        return (chunk.to_dict(orient="records") for chunk in extractor.iter_csv_chunks(paths))
+
+    def fetch(self, validators=None):
+        return [item for batch in self.open_stream(validators) for item in batch]
+
+    def load_raw(self, db, data, run_id=None):
+        loader.load_raw_csv(db, data, run_id=run_id)
+
+    def transform(self, data):
+        return _transform(self.name, data, transformer.transform_csv_data)
+
+register(CoinPaprikaConnector())
+register(CoinGeckoConnector())
+register(CSVConnector())
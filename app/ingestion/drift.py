@@ -1,47 +1,194 @@
 import difflib
+import functools
 import logging
-from typing import List, Dict, Any, Set
+import os
+from collections import Counter, defaultdict
+from itertools import repeat
+from typing import List, Dict, Any, Iterable, Optional
+from app.core import metrics
+from app.ingestion import connectors
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Expected keys for each source
-EXPECTED_KEYS = {
-    "coinpaprika": {"id", "name", "symbol", "rank", "circulating_supply", "total_supply", "max_supply", "beta_value", "first_data_at", "last_updated", "quotes"},
-    "coingecko": {"id", "symbol", "name", "image", "current_price", "market_cap", "market_cap_rank", "fully_diluted_valuation", "total_volume", "high_24h", "low_24h", "price_change_24h", "price_change_percentage_24h", "market_cap_change_24h", "market_cap_change_percentage_24h", "circulating_supply", "total_supply", "max_supply", "ath", "ath_change_percentage", "ath_date", "atl", "atl_change_percentage", "atl_date", "roi", "last_updated"},
-    "csv": {"symbol", "name", "price_usd", "market_cap"}
+# How far a field's presence ratio or null rate may move from the baseline
+# (and how short of 1.0 an expected key's presence may fall) before it is drift
+DRIFT_PRESENCE_TOLERANCE = float(os.getenv("DRIFT_PRESENCE_TOLERANCE", "0.05"))
+DRIFT_NULL_RATE_TOLERANCE = float(os.getenv("DRIFT_NULL_RATE_TOLERANCE", "0.05"))
+
+ISSUE_KINDS = ("missing", "unexpected", "new_fields", "type_changes", "presence_changes", "null_rate_changes")
+
+# JSON type of each Python value type; ints and floats are both numbers
+_TYPE_NAMES = {
+    str: "string", int: "number", float: "number", bool: "boolean",
+    type(None): "null", dict: "object", list: "array",
 }
 
-def detect_drift(source: str, data: List[Dict[str, Any]]) -> None:
+class _Missing:
+    pass
+
+_MISSING = _Missing()
+
+class SchemaProfile:
     """
-    Checks for schema drift in the provided data against expected keys.
-    Logs warnings if unexpected keys are found or expected keys are missing.
+    Per-field presence, null rate and observed types over every item
+    added, with nested objects flattened to dotted paths (quotes.USD.price).
+
+    Items are profiled a column at a time: one C-level pass per key (and
+    per nested object key) collects the value types, and the type counts
+    are only taken for fields with more than one type, nulls or gaps.
     """
-    if not data:
-        return
 
-    # Check the first item to infer schema
-    sample_item = data[0]
-    actual_keys = set(sample_item.keys())
-    expected = EXPECTED_KEYS.get(source, set())
+    def __init__(self):
+        self.items = 0
+        self._present = defaultdict(int)
+        self._types = defaultdict(Counter)
+
+    def add(self, items: List[Dict[str, Any]]):
+        self.items += len(items)
+        if set(map(type, items)) != {dict}:
+            items = [item for item in items if type(item) is dict]
+        if items:
+            self._add("", items)
+
+    def _add(self, prefix: str, objects: list):
+        # API batches are nearly always uniform, so start from the first
+        # object's keys and only take the union of all keys when some object
+        # lacks one of them or has more
+        keys = list(objects[0])
+        uniform = set(map(len, objects)) == {len(keys)}
+        for key in keys:
+            uniform = self._add_key(prefix, key, objects) and uniform
+        if not uniform:
+            for key in set().union(*objects).difference(keys):
+                self._add_key(prefix, key, objects)
+
+    def _add_key(self, prefix: str, key, objects: list) -> bool:
+        """Profiles one key across the objects; True when every object has it."""
+        values = list(map(dict.get, objects, repeat(key), repeat(_MISSING)))
+        kinds = set(map(type, values))
+        if len(kinds) == 1 and not kinds & {_Missing, type(None)}:
+            counts = {next(iter(kinds)): len(values)}
+        else:
+            counts = Counter(map(type, values))
+        path = prefix + str(key)
+        missing = counts.pop(_Missing, 0)
+        self._present[path] += len(values) - missing
+        for kind, count in counts.items():
+            self._types[path][_TYPE_NAMES.get(kind, kind.__name__)] += count
+        if dict in counts:
+            children = values if len(counts) == 1 and not missing else [value for value in values if type(value) is dict]
+            self._add(f"{path}.", children)
+        return not missing
+
+    def summary(self) -> dict:
+        """{"items": n, "fields": {path: {"presence", "null_rate", "types"}}}; JSON-safe, and the stored baseline format."""
+        fields = {}
+        for path in sorted(self._present):
+            seen = self._present[path]
+            types = self._types[path]
+            fields[path] = {
+                "presence": round(seen / self.items, 4),
+                "null_rate": round(types.get("null", 0) / seen, 4),
+                "types": sorted(name for name in types if name != "null"),
+            }
+        return {"items": self.items, "fields": fields}
+
+@functools.lru_cache(maxsize=4096)
+def _closest(name: str, candidates: frozenset) -> Optional[str]:
+    # Unknown keys tend to repeat run after run; match each one only once
+    matches = difflib.get_close_matches(name, sorted(candidates), n=1, cutoff=0.8)
+    return matches[0] if matches else None
+
+def _typos(names: Iterable[str], candidates_for) -> Dict[str, str]:
+    typos = {}
+    for name in names:
+        parent, _, leaf = name.rpartition(".")
+        candidates = candidates_for(parent)
+        match = _closest(leaf, frozenset(candidates)) if candidates else None
+        if match:
+            typos[name] = f"{parent}.{match}" if parent else match
+    return typos
 
-    if not expected:
+def check(source: str, summary: dict, baseline: dict = None) -> dict:
+    """
+    Compares a batch profile with the source connector's expected keys and
+    with its baseline profile (its last accepted batch), logs what drifted and
+    returns the report; the per-kind issue counts go to the metrics.
+    """
+    fields = summary["fields"]
+    connector = connectors.get_connector(source)
+    expected = connector.expected_keys if connector else set()
+    base_fields = (baseline or {}).get("fields") or {}
+    report = {"source": source, "items": summary["items"], **{kind: {} for kind in ISSUE_KINDS}, "typos": {}}
+
+    if not expected and not base_fields:
         logger.warning(f"No expected schema defined for source: {source}")
-        return
-
-    # Check for missing keys
-    missing_keys = expected - actual_keys
-    if missing_keys:
-        logger.warning(f"[{source}] Schema Drift Detected! Missing keys: {missing_keys}")
-
-    # Check for unexpected keys
-    unexpected_keys = actual_keys - expected
-    if unexpected_keys:
-        logger.warning(f"[{source}] Schema Drift Detected! Unexpected keys: {unexpected_keys}")
-        
-        # Fuzzy match to see if it's a typo
-        for unexpected in unexpected_keys:
-            matches = difflib.get_close_matches(unexpected, expected, n=1, cutoff=0.8)
-            if matches:
-                logger.warning(f"[{source}] Possible typo detected: '{unexpected}' might be '{matches[0]}'")
+
+    # Against the connector's contract (top-level keys)
+    for key in sorted(expected):
+        presence = fields.get(key, {}).get("presence", 0.0)
+        if presence < 1 - DRIFT_PRESENCE_TOLERANCE:
+            report["missing"][key] = presence
+    if expected:
+        for path, stats in fields.items():
+            if "." not in path and path not in expected:
+                report["unexpected"][path] = stats["presence"]
+
+    # Against the baseline, at every depth
+    if base_fields:
+        for path, base in base_fields.items():
+            current = fields.get(path)
+            if current is None:
+                if base["presence"] > DRIFT_PRESENCE_TOLERANCE:
+                    report["missing"].setdefault(path, 0.0)
+                continue
+            if abs(current["presence"] - base["presence"]) > DRIFT_PRESENCE_TOLERANCE:
+                report["presence_changes"][path] = {"baseline": base["presence"], "current": current["presence"]}
+            if current["null_rate"] - base["null_rate"] > DRIFT_NULL_RATE_TOLERANCE:
+                report["null_rate_changes"][path] = {"baseline": base["null_rate"], "current": current["null_rate"]}
+            if base["types"] and not set(current["types"]) <= set(base["types"]):
+                report["type_changes"][path] = {"baseline": base["types"], "current": current["types"]}
+        for path, stats in fields.items():
+            if path not in base_fields and path not in report["unexpected"]:
+                report["new_fields"][path] = stats["presence"]
+
+    siblings = defaultdict(set)
+    for path in set(base_fields) | set(expected):
+        parent, _, leaf = path.rpartition(".")
+        siblings[parent].add(leaf)
+    report["typos"] = _typos(list(report["unexpected"]) + list(report["new_fields"]), siblings.get)
+
+    _log(source, report)
+    for kind in ISSUE_KINDS:
+        metrics.ETL_DRIFT_ISSUES.set(len(report[kind]), source=source, kind=kind)
+    report["drift"] = any(report[kind] for kind in ISSUE_KINDS)
+    report["fields"] = fields
+    return report
+
+def _log(source: str, report: dict):
+    if report["missing"]:
+        logger.warning(f"[{source}] Schema Drift Detected! Missing keys: {set(report['missing'])}")
+    unexpected = set(report["unexpected"]) | set(report["new_fields"])
+    if unexpected:
+        logger.warning(f"[{source}] Schema Drift Detected! Unexpected keys: {unexpected}")
+    for unexpected, match in report["typos"].items():
+        logger.warning(f"[{source}] Possible typo detected: '{unexpected}' might be '{match}'")
+    for path, change in report["type_changes"].items():
+        logger.warning(f"[{source}] Schema Drift Detected! {path} types {change['baseline']} -> {change['current']}")
+    for kind, label in (("presence_changes", "presence"), ("null_rate_changes", "null rate")):
+        for path, change in report[kind].items():
+            logger.warning(f"[{source}] Schema Drift Detected! {path} {label} {change['baseline']} -> {change['current']}")
+
+def detect_drift(source: str, data: List[Dict[str, Any]], baseline: dict = None) -> Optional[dict]:
+    """
+    Profiles the whole batch and checks it for schema drift against the
+    source's expected keys and, when given, its baseline profile. Logs
+    warnings for what drifted and returns the report (None for no data).
+    """
+    if not data:
+        return None
+    profile = SchemaProfile()
+    profile.add(data)
+    return check(source, profile.summary(), baseline)
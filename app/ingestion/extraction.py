@@ -0,0 +1,90 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.core.http_client import NotModified
+
+logger = logging.getLogger(__name__)
+
+# Default time budget for a single source, including retries.
+DEFAULT_SOURCE_DEADLINE = float(os.getenv("ETL_SOURCE_DEADLINE_SECONDS", "60"))
+
+@dataclass
+class SourceResult:
+    """Outcome of fetching one source."""
+    source: str
+    data: List[Dict[str, Any]] = field(default_factory=list)
+    duration_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    error: Optional[str] = None
+    timed_out: bool = False
+    not_modified: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+def source_deadline(source: str) -> float:
+    """Deadline for a source, overridable with ETL_<SOURCE>_DEADLINE_SECONDS."""
+    value = os.getenv(f"ETL_{source.upper()}_DEADLINE_SECONDS")
+    return float(value) if value else DEFAULT_SOURCE_DEADLINE
+
+def _run_fetcher(source: str, fetcher: Callable[[], List[Dict[str, Any]]]) -> SourceResult:
+    start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        data = fetcher()
+        result = SourceResult(source, data or [], time.perf_counter() - start)
+    except NotModified:
+        result = SourceResult(source, [], time.perf_counter() - start, not_modified=True)
+    except Exception as e:
+        logger.error(f"[{source}] Extraction failed: {e}")
+        result = SourceResult(source, [], time.perf_counter() - start, error=str(e))
+    result.cpu_seconds = time.thread_time() - cpu_start
+    return result
+
+def extract_concurrently(
+    fetchers: Dict[str, Callable[[], List[Dict[str, Any]]]],
+    deadlines: Dict[str, float] = None
+) -> Iterator[SourceResult]:
+    """
+    Runs all source fetchers at once on a thread pool.
+
+    Results are yielded in completion order, so callers can transform and
+    load a healthy source while slower ones are still in flight. A source
+    that misses its deadline is yielded as a timed-out failure; its worker
+    thread is abandoned rather than waited for.
+    """
+    if not fetchers:
+        return
+    deadlines = deadlines or {}
+    executor = ThreadPoolExecutor(max_workers=len(fetchers), thread_name_prefix="extract")
+    start = time.perf_counter()
+    futures = {executor.submit(_run_fetcher, source, fetcher): source for source, fetcher in fetchers.items()}
+    expires_at = {
+        future: start + deadlines.get(source, source_deadline(source))
+        for future, source in futures.items()
+    }
+    pending = set(futures)
+    try:
+        while pending:
+            now = time.perf_counter()
+            for future in [f for f in pending if expires_at[f] <= now and not f.done()]:
+                pending.discard(future)
+                future.cancel()
+                source = futures[future]
+                logger.error(f"[{source}] Extraction exceeded its {expires_at[future] - start:.1f}s deadline")
+                yield SourceResult(source, [], now - start, error="deadline exceeded", timed_out=True)
+            if not pending:
+                break
+
+            timeout = max(0.0, min(expires_at[f] for f in pending) - time.perf_counter())
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                yield future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
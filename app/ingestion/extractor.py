@@ -1,54 +1,148 @@
-import requests
 import pandas as pd
+import glob
 import json
+import logging
+import math
 import os
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Dict, Any
 from app.core.resilience import retry_with_backoff
+from app.core.http_client import get_json, NotModified
 
 COINPAPRIKA_API_URL = "https://api.coinpaprika.com/v1/tickers"
-COINGECKO_API_URL = "https://api.coingecko.com/api/v3/coins/markets?vs_currency=usd&order=market_cap_desc&per_page=100&page=1&sparkline=false"
-
-@retry_with_backoff(retries=3, backoff_factor=2)
-def fetch_coinpaprika_data() -> List[Dict[str, Any]]:
-    """Fetches data from CoinPaprika API."""
-    try:
-        # CoinPaprika Free API doesn't strictly require a key, but if provided we use it.
-        # Paid plans use 'Authorization' header.
-        headers = {}
-        api_key = os.getenv("COINPAPRIKA_API_KEY")
-        if api_key:
-            headers["Authorization"] = api_key
-            
-        response = requests.get(COINPAPRIKA_API_URL, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
-        print(f"Error fetching data from CoinPaprika: {e}")
-        return []
-
-@retry_with_backoff(retries=3, backoff_factor=2)
-def fetch_coingecko_data() -> List[Dict[str, Any]]:
-    """Fetches data from CoinGecko API."""
-    try:
-        # CoinGecko Pro uses 'x-cg-pro-api-key' header or 'x_cg_pro_api_key' param.
-        # Demo uses 'x-cg-demo-api-key'. We'll support header injection.
-        headers = {}
-        api_key = os.getenv("COINGECKO_API_KEY")
-        if api_key:
-            headers["x-cg-demo-api-key"] = api_key
-            
-        response = requests.get(COINGECKO_API_URL, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
-        print(f"Error fetching data from CoinGecko: {e}")
-        return []
-
-def fetch_csv_data(file_path: str) -> List[Dict[str, Any]]:
-    """Reads data from a CSV file."""
-    try:
-        df = pd.read_csv(file_path)
-        return df.to_dict(orient="records")
-    except Exception as e:
-        print(f"Error reading CSV file {file_path}: {e}")
-        return []
+COINGECKO_API_URL = "https://api.coingecko.com/api/v3/coins/markets"
+
+# CoinGecko serves at most 250 coins per page; COINGECKO_MAX_ASSETS decides how
+# many pages are pulled, PAGE_CONCURRENCY how many are in flight at once.
+COINGECKO_MAX_PER_PAGE = 250
+COINGECKO_MAX_ASSETS = int(os.getenv("COINGECKO_MAX_ASSETS", "100"))
+PAGE_CONCURRENCY = int(os.getenv("PAGE_CONCURRENCY", "4"))
+
+# Streaming CSV: only these columns are parsed, CSV_CHUNK_SIZE rows at a time.
+# Numbers are read as text and coerced by the transform, so one malformed
+# value cannot abort a multi-million-row read.
+CSV_COLUMNS = ["symbol", "name", "price_usd", "market_cap"]
+CSV_DTYPES = {"symbol": str, "name": str, "price_usd": str, "market_cap": str}
+CSV_CHUNK_SIZE = int(os.getenv("CSV_CHUNK_SIZE", "50000"))
+
+logger = logging.getLogger(__name__)
+
+def fetch_pages(fetch_page: Callable[[int], List[Dict[str, Any]]], pages: int, concurrency: int = None) -> List[Dict[str, Any]]:
+    """
+    Fetches pages 1..pages with at most `concurrency` requests in flight.
+
+    Results are concatenated in page order regardless of completion order.
+    """
+    concurrency = max(1, min(concurrency or PAGE_CONCURRENCY, pages))
+    if pages <= 1 or concurrency == 1:
+        results = [fetch_page(page) for page in range(1, pages + 1)]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="page") as executor:
+            results = list(executor.map(fetch_page, range(1, pages + 1)))
+    return [item for page in results for item in page]
+
+@retry_with_backoff(retries=3, backoff_factor=2, giveup=(NotModified,))
+def fetch_coinpaprika_data(validators: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+    """
+    Fetches data from CoinPaprika API.
+
+    `validators` carries the previous response's ETag/Last-Modified; raises
+    NotModified if the upstream answers 304.
+    """
+    # Errors propagate so the retry decorator and the extraction stage see them.
+    # CoinPaprika Free API doesn't strictly require a key, but if provided we use it.
+    # Paid plans use 'Authorization' header.
+    headers = {}
+    api_key = os.getenv("COINPAPRIKA_API_KEY")
+    if api_key:
+        headers["Authorization"] = api_key
+
+    return get_json(COINPAPRIKA_API_URL, "coinpaprika", headers=headers, validators=validators)
+
+@retry_with_backoff(retries=3, backoff_factor=2, giveup=(NotModified,))
+def fetch_coingecko_page(page: int, per_page: int, validators: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+    """Fetches one page of the CoinGecko markets listing."""
+    # CoinGecko Pro uses 'x-cg-pro-api-key' header or 'x_cg_pro_api_key' param.
+    # Demo uses 'x-cg-demo-api-key'. We'll support header injection.
+    headers = {}
+    api_key = os.getenv("COINGECKO_API_KEY")
+    if api_key:
+        headers["x-cg-demo-api-key"] = api_key
+
+    params = {
+        "vs_currency": "usd",
+        "order": "market_cap_desc",
+        "per_page": per_page,
+        "page": page,
+        "sparkline": "false"
+    }
+    return get_json(COINGECKO_API_URL, "coingecko", params=params, headers=headers, validators=validators)
+
+def fetch_coingecko_data(max_assets: int = None, page_concurrency: int = None, validators: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+    """
+    Fetches the top `max_assets` coins by market cap from CoinGecko.
+
+    `validators` maps each page number to that page's ETag/Last-Modified.
+    Raises NotModified only if every page is unchanged; pages that are
+    unchanged while others moved are fetched again unconditionally, since
+    their previous body is not kept.
+    """
+    max_assets = max_assets or COINGECKO_MAX_ASSETS
+    per_page = min(COINGECKO_MAX_PER_PAGE, max_assets)
+    pages = math.ceil(max_assets / per_page)
+    if validators is not None:
+        page_validators = {page: validators.setdefault(str(page), {}) for page in range(1, pages + 1)}
+    else:
+        page_validators = {page: None for page in range(1, pages + 1)}
+
+    def fetch_page(page: int):
+        try:
+            return fetch_coingecko_page(page, per_page, page_validators[page])
+        except NotModified:
+            return None
+
+    # One entry per page: its items, or None if the page was unchanged
+    results = fetch_pages(lambda page: [fetch_page(page)], pages, page_concurrency)
+    if all(result is None for result in results):
+        raise NotModified("coingecko: all pages not modified")
+
+    data = []
+    for page, result in enumerate(results, start=1):
+        if result is None:
+            page_validators[page].clear()
+            result = fetch_coingecko_page(page, per_page, page_validators[page])
+        data.extend(result)
+    return data[:max_assets]
+
+def resolve_csv_paths(spec: str) -> List[str]:
+    """Expands a comma-separated list of CSV paths and/or glob patterns."""
+    paths = []
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        matches = sorted(glob.glob(part)) if glob.has_magic(part) else [part]
+        paths.extend(path for path in matches if path not in paths)
+    return paths
+
+def csv_file_fingerprint(path: str) -> Dict[str, int]:
+    stat = os.stat(path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+def iter_csv_chunks(paths: List[str], chunksize: int = None) -> Iterator[pd.DataFrame]:
+    """
+    Yields DataFrames of at most `chunksize` rows from each CSV file in turn,
+    parsing only CSV_COLUMNS, so memory stays bounded by the chunk size.
+    Unreadable files are logged and skipped.
+    """
+    chunksize = chunksize or CSV_CHUNK_SIZE
+    for path in paths:
+        try:
+            reader = pd.read_csv(
+                path,
+                usecols=lambda column: column in CSV_COLUMNS,
+                dtype=CSV_DTYPES,
+                chunksize=chunksize
+            )
+            with reader:
+                for chunk in reader:
+                    yield chunk
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading CSV file {path}: {e}")
@@ -1,67 +1,451 @@
 from sqlalchemy.orm import Session
-from sqlalchemy.dialects.postgresql import insert
-from sqlalchemy.sql import func
-from app.models import CryptoAsset, RawCoinPaprika, RawCoinGecko, RawCSV, ETLStatus, ETLCheckpoint
+from sqlalchemy import case, cast, or_, select, text, update, JSON
+from sqlalchemy.dialects.postgresql import insert, JSONB
+from sqlalchemy.sql import func, literal_column
+from sqlalchemy.exc import DBAPIError
+from app.models import CryptoAsset, RawCoinPaprika, RawCoinGecko, RawCSV, ETLStatus, ETLCheckpoint, AssetPriceHistory, AssetPriceHourly
 from app.schemas.schemas import CryptoAssetCreate
-from typing import List
+from app.core import metrics
+from app.ingestion import profiling
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Iterable, Set, Tuple, Union
+import io
 import json
+import logging
+import math
+import os
 
-def load_raw_coinpaprika(db: Session, data: List[dict]):
+logger = logging.getLogger(__name__)
+
+# Rows per multi-row upsert statement, and "bulk" (default) or "row" to force
+# the one-statement-per-asset path.
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "1000"))
+UPSERT_MODE = os.getenv("UPSERT_MODE", "bulk")
+
+# A row written by a higher-priority source is only protected from lower-
+# priority ones while it is fresher than this; after that the next source to
+# report the asset takes it over, so a source that is down, answers 304 or
+# drops the asset cannot freeze its price. Keep it above
+# ETL_TOUCH_INTERVAL_SECONDS, the age an unchanged row of a healthy source
+# can reach before it is rewritten.
+SOURCE_OWNERSHIP_SECONDS = float(os.getenv("SOURCE_OWNERSHIP_SECONDS", "7200"))
+
+# Raw rows buffered per COPY FROM STDIN call.
+RAW_COPY_BATCH_SIZE = int(os.getenv("RAW_COPY_BATCH_SIZE", "5000"))
+
+# Every asset row a load writes also gets a point in asset_price_history
+PRICE_HISTORY_ENABLED = os.getenv("PRICE_HISTORY_ENABLED", "true") == "true"
+
+# Written rows are announced on this LISTEN/NOTIFY channel for /stream/prices
+PRICE_CHANNEL = "price_changes"
+PRICE_NOTIFY_ENABLED = os.getenv("PRICE_NOTIFY_ENABLED", "true") == "true"
+# NOTIFY payloads must stay under 8000 bytes
+PRICE_NOTIFY_MAX_BYTES = 7500
+
+def _json_safe(value):
+    """Replaces NaN/Infinity (e.g. empty CSV cells read by pandas) with None."""
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_json_safe(v) for v in value]
+    return value
+
+def _encode_json(item) -> str:
+    """Encodes one raw item as a JSON value for COPY's text format."""
+    try:
+        encoded = json.dumps(item, default=str, allow_nan=False)
+    except ValueError:
+        encoded = json.dumps(_json_safe(item), default=str)
+    # json.dumps never emits raw tabs/newlines, so backslash is the only
+    # character COPY's text format needs escaped.
+    return encoded.replace("\\", "\\\\")
+
+def _encode_text(value) -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "\\N"
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+def _copy_raw(db: Session, model, columns: List[str], lines: Iterable[str], batch_size: int = None) -> int:
+    """
+    Streams pre-encoded lines into `model`'s table with COPY FROM STDIN.
+
+    Lines are written into one reusable buffer and flushed every `batch_size`
+    rows (RAW_COPY_BATCH_SIZE). Returns the number of rows written.
+    """
+    batch_size = batch_size or RAW_COPY_BATCH_SIZE
+    sql = f"COPY {model.__tablename__} ({', '.join(columns)}) FROM STDIN"
+    cursor = db.connection().connection.cursor()
+    buffer = io.StringIO()
+    written = pending = 0
+
+    def flush():
+        # COPY bypasses SQLAlchemy's cursor events, so report it to the profile here
+        profiling.add(nbytes=buffer.tell(), round_trips=1)
+        buffer.seek(0)
+        cursor.copy_expert(sql, buffer)
+        buffer.seek(0)
+        buffer.truncate()
+
+    try:
+        for line in lines:
+            buffer.write(line)
+            pending += 1
+            if pending >= batch_size:
+                flush()
+                written += pending
+                pending = 0
+        if pending:
+            flush()
+            written += pending
+    finally:
+        cursor.close()
+    return written
+
+def _supports_copy(db: Session) -> bool:
+    return db.get_bind().dialect.driver == "psycopg2"
+
+def load_raw_coinpaprika(db: Session, data: List[dict], run_id: str = None):
     """Stores raw CoinPaprika data."""
-    # For raw data, we might just want to store the whole batch or individual items.
-    # Storing individual items for better querying in raw table.
-    # To avoid massive bloat, we might clear old raw data or just append. 
-    # Requirement: "Store raw data".
-    for item in data:
-        raw_entry = RawCoinPaprika(data=item)
-        db.add(raw_entry)
+    # Storing individual items for better querying in raw table, tagged with
+    # the run that landed them.
+    if not _supports_copy(db):
+        db.add_all(RawCoinPaprika(data=item, run_id=run_id) for item in data)
+        db.commit()
+        return
+    run = _encode_text(run_id)
+    _copy_raw(db, RawCoinPaprika, ["data", "run_id"], (f"{_encode_json(item)}\t{run}\n" for item in data))
     db.commit()
 
-def load_raw_coingecko(db: Session, data: List[dict]):
+def load_raw_coingecko(db: Session, data: List[dict], run_id: str = None):
     """Stores raw CoinGecko data."""
-    for item in data:
-        raw_entry = RawCoinGecko(data=item)
-        db.add(raw_entry)
+    if not _supports_copy(db):
+        db.add_all(RawCoinGecko(data=item, run_id=run_id) for item in data)
+        db.commit()
+        return
+    run = _encode_text(run_id)
+    _copy_raw(db, RawCoinGecko, ["data", "run_id"], (f"{_encode_json(item)}\t{run}\n" for item in data))
     db.commit()
 
-def load_raw_csv(db: Session, data: List[dict]):
+def load_raw_csv(db: Session, data: List[dict], run_id: str = None):
     """Stores raw CSV data."""
-    for item in data:
-        raw_entry = RawCSV(symbol=item.get("symbol"), raw_data=item)
-        db.add(raw_entry)
+    if not _supports_copy(db):
+        db.add_all(RawCSV(symbol=item.get("symbol"), raw_data=item, run_id=run_id) for item in data)
+        db.commit()
+        return
+    run = _encode_text(run_id)
+    lines = (
+        f"{_encode_text(item.get('symbol'))}\t{_encode_json(item)}\t{run}\n"
+        for item in data
+    )
+    _copy_raw(db, RawCSV, ["symbol", "raw_data", "run_id"], lines)
     db.commit()
 
-def load_unified_data(db: Session, assets: List[CryptoAssetCreate]):
-    """Upserts unified data into crypto_assets table."""
-    for asset in assets:
-        stmt = insert(CryptoAsset).values(
-            id=asset.id,
-            symbol=asset.symbol,
-            name=asset.name,
-            price_usd=asset.price_usd,
-            market_cap=asset.market_cap,
-            source=asset.source
+def _asset_row(asset) -> dict:
+    if isinstance(asset, dict):
+        # Already a unified row, e.g. from columnar.ColumnarBatch.rows()
+        return asset
+    return {
+        "id": asset.id,
+        "symbol": asset.symbol,
+        "name": asset.name,
+        "price_usd": asset.price_usd,
+        "market_cap": asset.market_cap,
+        "source": asset.source,
+    }
+
+def _source_priority(column, priorities: Dict[str, int]):
+    return case(priorities, value=column, else_=0)
+
+def _upsert_statement(priorities: Dict[str, int] = None):
+    """
+    Builds the INSERT ... ON CONFLICT DO UPDATE statement.
+
+    Executed with a list of rows, SQLAlchemy renders it as multi-row VALUES
+    ("insertmanyvalues"), and the compiled form is cached between calls.
+    With `priorities`, an existing row is only overwritten by a source of
+    equal or higher priority, or once it is older than
+    SOURCE_OWNERSHIP_SECONDS, so a run that skipped a source cannot let a
+    lower-priority one clobber its fresh rows.
+    """
+    stmt = insert(CryptoAsset)
+
+    where = None
+    if priorities:
+        where = or_(
+            _source_priority(CryptoAsset.source, priorities) <= _source_priority(stmt.excluded.source, priorities),
+            CryptoAsset.last_updated < func.now() - timedelta(seconds=SOURCE_OWNERSHIP_SECONDS)
         )
-        
-        # Postgres UPSERT
-        stmt = stmt.on_conflict_do_update(
-            index_elements=['id'],
-            set_={
-                'price_usd': stmt.excluded.price_usd,
-                'market_cap': stmt.excluded.market_cap,
-                'last_updated': stmt.excluded.last_updated # This will update the timestamp
-            }
+
+    # Postgres UPSERT
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['id'],
+        set_={
+            'name': stmt.excluded.name,
+            'price_usd': stmt.excluded.price_usd,
+            'market_cap': stmt.excluded.market_cap,
+            'source': stmt.excluded.source,
+            'last_updated': stmt.excluded.last_updated # This will update the timestamp
+        },
+        where=where
+    )
+    # xmax is only zero for tuples created by this statement, so it tells
+    # inserted rows apart from the ones that went through DO UPDATE.
+    # Rows the priority guard skipped are not returned at all.
+    return stmt.returning(CryptoAsset.id, literal_column("(xmax = 0)").label("inserted"))
+
+def _count(result, counts: Dict[str, int], written: Set[str]):
+    for asset_id, inserted in result:
+        counts["inserted" if inserted else "updated"] += 1
+        written.add(asset_id)
+
+def _upsert_row_by_row(db: Session, rows: List[dict], counts: Dict[str, int], written: Set[str], priorities: Dict[str, int] = None):
+    """Fallback path: one statement (and one round trip) per asset."""
+    for row in rows:
+        _count(db.execute(_upsert_statement(priorities), row), counts, written)
+
+# Months whose asset_price_history partition is known to exist (committed)
+_history_partitions: Set[str] = set()
+
+# CREATE ... PARTITION OF locks asset_price_history exclusively; give up
+# rather than queue behind long /history reads (and block new ones meanwhile)
+HISTORY_PARTITION_LOCK_TIMEOUT = "5s"
+
+def history_partition_name(ts: datetime) -> str:
+    return f"asset_price_history_y{ts.year}m{ts.month:02d}"
+
+def _partition_exists(engine, name: str) -> bool:
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None
+
+def ensure_history_partition(db: Session, ts: datetime):
+    """
+    Creates the monthly asset_price_history partition that holds `ts`.
+
+    The DDL runs in its own short transaction on a separate connection, so
+    its exclusive lock is not held for the rest of the load and a rollback
+    of the load cannot undo it. Call it before `db`'s transaction writes to
+    asset_price_history, or the CREATE waits on that transaction's lock.
+    """
+    name = history_partition_name(ts)
+    if name in _history_partitions:
+        return
+    engine = db.get_bind().engine
+    if not _partition_exists(engine, name):
+        start = datetime(ts.year, ts.month, 1, tzinfo=timezone.utc)
+        end = datetime(ts.year + ts.month // 12, ts.month % 12 + 1, 1, tzinfo=timezone.utc)
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"SET LOCAL lock_timeout = '{HISTORY_PARTITION_LOCK_TIMEOUT}'"))
+                conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF asset_price_history "
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                ))
+            logger.info(f"Created partition {name}")
+        except DBAPIError as e:
+            # Another process may have created it first (duplicate object /
+            # unique violation); anything else is a real failure
+            if not _partition_exists(engine, name):
+                raise
+            logger.info(f"Partition {name} was created concurrently: {e.orig}")
+    # Only remembered once it is committed
+    _history_partitions.add(name)
+
+def _hourly_rollup_statement():
+    """Folds one price point per row into its hour's OHLC bucket."""
+    stmt = insert(AssetPriceHourly)
+    current, new = AssetPriceHourly.__table__.c, stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=["asset_id", "bucket"],
+        set_={
+            "open": case((new.open_ts < current.open_ts, new.open), else_=current.open),
+            "open_ts": func.least(current.open_ts, new.open_ts),
+            "close": case((new.close_ts >= current.close_ts, new.close), else_=current.close),
+            "close_ts": func.greatest(current.close_ts, new.close_ts),
+            "high": func.greatest(current.high, new.high),
+            "low": func.least(current.low, new.low),
+            "samples": current.samples + new.samples,
+        }
+    )
+
+def rebuild_hourly_rollup(db: Session, start: datetime, end: datetime):
+    """Recomputes asset_price_hourly from asset_price_history for [start, end), e.g. after a backfill."""
+    db.execute(text("DELETE FROM asset_price_hourly WHERE bucket >= :start AND bucket < :end"), {"start": start, "end": end})
+    db.execute(text("""
+        INSERT INTO asset_price_hourly (asset_id, bucket, open, high, low, close, open_ts, close_ts, samples)
+        SELECT asset_id, date_trunc('hour', ts),
+               (array_agg(price_usd ORDER BY ts))[1], max(price_usd), min(price_usd),
+               (array_agg(price_usd ORDER BY ts DESC))[1], min(ts), max(ts), count(*)
+        FROM asset_price_history
+        WHERE ts >= :start AND ts < :end
+        GROUP BY asset_id, date_trunc('hour', ts)
+    """), {"start": start, "end": end})
+
+def notify_price_changes(db: Session, rows: List[dict]):
+    """
+    Queues NOTIFYs on PRICE_CHANNEL for `rows`, delivered to listeners when
+    the transaction commits. Payloads are {"ts": ..., "rows": [[id, symbol,
+    price_usd, market_cap], ...]}; ts is the transaction's now(), i.e. the
+    rows' last_updated.
+    """
+    if not rows:
+        return
+    ts = json.dumps(db.execute(select(func.now())).scalar().isoformat())
+    prefix, suffix = '{"ts":' + ts + ',"rows":[', "]}"
+    budget = PRICE_NOTIFY_MAX_BYTES - len(prefix) - len(suffix)
+    payloads, chunk, size = [], [], 0
+    for row in rows:
+        item = json.dumps(
+            [row["id"], row["symbol"], _json_safe(row["price_usd"]), _json_safe(row["market_cap"])],
+            separators=(",", ":")
         )
-        db.execute(stmt)
+        if chunk and size + len(item) + 1 > budget:
+            payloads.append(prefix + ",".join(chunk) + suffix)
+            chunk, size = [], 0
+        chunk.append(item)
+        size += len(item) + 1
+    payloads.append(prefix + ",".join(chunk) + suffix)
+    db.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        [{"channel": PRICE_CHANNEL, "payload": payload} for payload in payloads]
+    )
+
+def load_price_history(db: Session, rows: List[dict], ts: datetime = None, batch_size: int = None):
+    """
+    Appends one asset_price_history point per unified row, stamped `ts`,
+    and folds it into asset_price_hourly. Does not commit, so it lands in
+    the same transaction as the upsert that wrote the rows.
+    """
+    if not rows:
+        return
+    ts = ts or datetime.now(timezone.utc)
+    batch_size = batch_size or UPSERT_BATCH_SIZE
+    ensure_history_partition(db, ts)
+    bucket = ts.replace(minute=0, second=0, microsecond=0)
+    points = [
+        {"asset_id": row["id"], "ts": ts, "price_usd": row["price_usd"], "market_cap": row["market_cap"], "source": row["source"]}
+        for row in rows
+    ]
+    rollups = [
+        {
+            "asset_id": row["id"], "bucket": bucket,
+            "open": row["price_usd"], "high": row["price_usd"], "low": row["price_usd"], "close": row["price_usd"],
+            "open_ts": ts, "close_ts": ts, "samples": 1,
+        }
+        for row in rows
+    ]
+    options = {"insertmanyvalues_page_size": batch_size}
+    conn = db.connection()
+    conn.execute(insert(AssetPriceHistory).on_conflict_do_nothing(), points, execution_options=options)
+    conn.execute(_hourly_rollup_statement(), rollups, execution_options=options)
+
+def load_unified_data(
+    db: Session,
+    assets: List[Union[CryptoAssetCreate, dict]],
+    batch_size: int = None,
+    bulk: bool = None,
+    priorities: Dict[str, int] = None,
+    history: bool = None,
+    notify: bool = None
+) -> Tuple[Dict[str, int], Set[str]]:
+    """
+    Upserts unified data into crypto_assets table.
+    `assets` may be CryptoAssetCreate models or plain unified row dicts.
+
+    Assets are sent as multi-row INSERT ... ON CONFLICT statements of
+    `batch_size` rows (UPSERT_BATCH_SIZE). The per-row statement is only used
+    when UPSERT_MODE=row, or to replay a batch that Postgres rejected.
+    `priorities` (source -> priority) guards fresh rows owned by a
+    higher-priority source. Rows that were written also get a price history point (see
+    load_price_history) in the same transaction, unless `history` is False
+    (default: PRICE_HISTORY_ENABLED), and are announced to price stream
+    listeners on commit unless `notify` is False (default:
+    PRICE_NOTIFY_ENABLED).
+    Returns the number of inserted, updated and skipped rows, and the ids
+    of the rows written (the skipped ones are left out).
+    """
+    batch_size = batch_size or UPSERT_BATCH_SIZE
+    if bulk is None:
+        bulk = UPSERT_MODE != "row"
+    if history is None:
+        history = PRICE_HISTORY_ENABLED
+    if notify is None:
+        notify = PRICE_NOTIFY_ENABLED
+
+    # ON CONFLICT DO UPDATE cannot touch the same row twice in one statement,
+    # so collapse duplicate ids (last one wins, as with sequential upserts).
+    rows = list({row["id"]: row for row in map(_asset_row, assets)}.values())
+    counts = {"inserted": 0, "updated": 0}
+    written: Set[str] = set()
+
+    with profiling.span("upsert"):
+        profiling.add(rows=len(rows))
+        if not bulk:
+            _upsert_row_by_row(db, rows, counts, written, priorities)
+        else:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                savepoint = db.begin_nested()
+                try:
+                    batch_counts, batch_written = {"inserted": 0, "updated": 0}, set()
+                    result = db.connection().execute(
+                        _upsert_statement(priorities),
+                        batch,
+                        execution_options={"insertmanyvalues_page_size": batch_size}
+                    )
+                    _count(result, batch_counts, batch_written)
+                    savepoint.commit()
+                except DBAPIError as e:
+                    savepoint.rollback()
+                    logger.warning(f"Bulk upsert of {len(batch)} rows failed, falling back to row-by-row: {e}")
+                    batch_counts, batch_written = {"inserted": 0, "updated": 0}, set()
+                    _upsert_row_by_row(db, batch, batch_counts, batch_written, priorities)
+                counts["inserted"] += batch_counts["inserted"]
+                counts["updated"] += batch_counts["updated"]
+                written |= batch_written
+    if history:
+        with profiling.span("history"):
+            profiling.add(rows=len(written))
+            load_price_history(db, [row for row in rows if row["id"] in written], batch_size=batch_size)
+    if notify:
+        notify_price_changes(db, [row for row in rows if row["id"] in written])
     db.commit()
+    counts["skipped"] = len(rows) - counts["inserted"] - counts["updated"]
+    return counts, written
 
-def update_etl_status(db: Session, status: str, error: str = None, duration: float = None):
-    etl_status = ETLStatus(status=status, error_message=error, duration_seconds=duration)
+def update_etl_status(
+    db: Session,
+    status: str,
+    error: str = None,
+    duration: float = None,
+    run_id: str = None,
+    stage_timings: dict = None,
+    profile: dict = None,
+    drift: dict = None
+):
+    etl_status = ETLStatus(
+        run_id=run_id, status=status, error_message=error, duration_seconds=duration,
+        stage_timings=stage_timings, profile=profile, drift=drift
+    )
     db.add(etl_status)
     db.commit()
+    metrics.ETL_LAST_RUN_STATUS.set(1 if status == "success" else 0)
+    if duration is not None:
+        metrics.ETL_LAST_RUN_DURATION.set(duration)
+        metrics.ETL_RUN_DURATION.observe(duration, status=status)
+
+def get_checkpoint_meta(db: Session, source: str) -> dict:
+    """Returns the stored meta_data of a source's checkpoint (empty if none)."""
+    checkpoint = db.query(ETLCheckpoint).filter(ETLCheckpoint.source == source).first()
+    return dict(checkpoint.meta_data or {}) if checkpoint else {}
 
 def update_checkpoint(db: Session, source: str, status: str, records: int = 0, meta: dict = None):
-    """Updates the checkpoint for a specific source."""
+    """
+    Updates the checkpoint for a specific source.
+    `meta` is merged key by key into the stored meta_data.
+    """
     stmt = insert(ETLCheckpoint).values(
         source=source,
         status=status,
@@ -74,9 +458,30 @@ def update_checkpoint(db: Session, source: str, status: str, records: int = 0, m
         set_={
             'status': stmt.excluded.status,
             'records_processed': stmt.excluded.records_processed,
-            'meta_data': stmt.excluded.meta_data,
+            'meta_data': cast(
+                func.coalesce(cast(ETLCheckpoint.meta_data, JSONB), cast({}, JSONB)).op("||")(
+                    func.coalesce(cast(stmt.excluded.meta_data, JSONB), cast({}, JSONB))
+                ),
+                JSON
+            ),
             'last_run': stmt.excluded.last_run
         }
     )
     db.execute(stmt)
     db.commit()
+    metrics.ETL_RECORDS_PROCESSED.set(records, source=source)
+
+def accept_drift_baseline(db: Session, source: str) -> bool:
+    """
+    Makes a source's last profiled batch (meta_data drift_profile) its
+    drift baseline, accepting whatever drift it had. False if the source
+    has no profiled batch yet.
+    """
+    meta = cast(ETLCheckpoint.meta_data, JSONB)
+    result = db.execute(
+        update(ETLCheckpoint)
+        .where(ETLCheckpoint.source == source, meta["drift_profile"].isnot(None))
+        .values(meta_data=cast(meta.op("||")(func.jsonb_build_object("drift_baseline", meta["drift_profile"])), JSON))
+    )
+    db.commit()
+    return result.rowcount > 0
@@ -0,0 +1,262 @@
+"""
+Per-run span profiles for the ETL.
+
+A RunProfile is a tree of spans: the run, one node per source, and the
+pipeline stages under each source (with e.g. upsert/history under merge).
+Spans are aggregated by name, so a stage that handles fifty CSV chunks is
+one span with `calls` = 50. Each records wall and CPU time, rows, bytes and
+DB round trips (SQL statements and commits seen by SQLAlchemy, plus COPY
+calls reported by the loader).
+
+The profile is stored on the run's final etl_status row and served at
+/runs/{id}/profile. With ETL_PROFILE_OTEL_PATH set it is also appended to
+that file as one OTLP/JSON line per run.
+"""
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+ETL_PROFILE_OTEL_PATH = os.getenv("ETL_PROFILE_OTEL_PATH")
+
+# The innermost span open on each thread, which DB round trips and add() are charged to
+_local = threading.local()
+
+class Span:
+    __slots__ = (
+        "name", "source", "thread", "start", "end", "wall_seconds", "cpu_seconds",
+        "rows", "bytes", "db_round_trips", "calls", "children", "span_id"
+    )
+
+    def __init__(self, name: str, source: str = None):
+        self.name = name
+        self.source = source
+        self.thread: Optional[int] = None  # thread the span was timed on; None for grouping nodes
+        self.start: Optional[float] = None
+        self.end: Optional[float] = None
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.db_round_trips = 0
+        self.calls = 0
+        self.children: Dict[Tuple[str, Optional[str]], "Span"] = {}
+        self.span_id = secrets.token_hex(8)
+
+    def child(self, name: str, source: str = None) -> "Span":
+        key = (name, source)
+        span = self.children.get(key)
+        if span is None:
+            span = self.children[key] = Span(name, source)
+        return span
+
+    def _extend(self, start: float, end: float):
+        self.start = start if self.start is None else min(self.start, start)
+        self.end = end if self.end is None else max(self.end, end)
+
+    def to_dict(self) -> dict:
+        children = [(span, span.to_dict()) for span in self.children.values()]
+        if self.thread is not None:
+            start, end, wall = self.start, self.end, self.wall_seconds
+            # Children timed on other threads aren't on this span's CPU clock
+            cpu = self.cpu_seconds + sum(c["cpu_seconds"] for span, c in children if span.thread != self.thread)
+        else:
+            # Grouping node: covers its children
+            start = min((c["start"] for _, c in children if c["start"] is not None), default=None)
+            end = max((c["end"] for _, c in children if c["end"] is not None), default=None)
+            wall = end - start if start is not None else 0.0
+            cpu = sum(c["cpu_seconds"] for _, c in children)
+        return {
+            "name": self.name,
+            "source": self.source,
+            "start": start,
+            "end": end,
+            "wall_seconds": round(wall, 6),
+            "cpu_seconds": round(cpu, 6),
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "db_round_trips": self.db_round_trips + sum(c["db_round_trips"] for _, c in children),
+            "calls": self.calls,
+            "span_id": self.span_id,
+            "children": [c for _, c in children],
+        }
+
+class RunProfile:
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.root = Span("run")
+        self._lock = threading.Lock()
+
+    def _parent(self, source: Optional[str]) -> Span:
+        current = getattr(_local, "span", None)
+        if current is not None and current is not self.root and getattr(_local, "profile", None) is self:
+            return current
+        return self._node(source)
+
+    def _node(self, source: Optional[str]) -> Span:
+        return self.root.child(source, source) if source else self.root
+
+    @contextmanager
+    def span(self, name: str, source: str = None):
+        """
+        Times the block as `name` under the thread's current span, or under
+        the source's node (the root without a source) when there is none.
+        """
+        with self._lock:
+            span = self._parent(source).child(name, source)
+        with self._activate(span):
+            yield span
+
+    @contextmanager
+    def activate(self):
+        """Times the block as the run itself; use once, around the whole run."""
+        with self._activate(self.root):
+            yield self.root
+
+    @contextmanager
+    def _activate(self, span: Span):
+        previous = (getattr(_local, "span", None), getattr(_local, "profile", None))
+        _local.span, _local.profile = span, self
+        start, wall, cpu = time.time(), time.perf_counter(), time.thread_time()
+        try:
+            yield span
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            with self._lock:
+                span.thread = threading.get_ident()
+                span.wall_seconds += wall
+                span.cpu_seconds += cpu
+                span.calls += 1
+                span._extend(start, start + wall)
+            _local.span, _local.profile = previous
+
+    def record(self, name: str, source: str = None, wall: float = 0.0, cpu: float = 0.0, rows: int = 0, nbytes: int = 0):
+        """Adds a span measured elsewhere, e.g. an extraction on the fetcher pool, ending now."""
+        end = time.time()
+        with self._lock:
+            span = self._node(source).child(name, source)
+            span.thread = -1
+            span.wall_seconds += wall
+            span.cpu_seconds += cpu
+            span.rows += rows
+            span.bytes += nbytes
+            span.calls += 1
+            span._extend(end - wall, end)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return self.root.to_dict()
+
+    def export_otel(self, path: str = None):
+        """Appends the spans as one OTLP/JSON ExportTraceServiceRequest line."""
+        path = path or ETL_PROFILE_OTEL_PATH
+        if not path:
+            return
+        try:
+            with open(path, "a") as f:
+                f.write(json.dumps(to_otel(self.to_dict(), self.run_id), separators=(",", ":")) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not export ETL profile to {path}: {e}")
+
+def _otel_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def to_otel(profile: dict, run_id: str) -> dict:
+    """Profile tree -> OTLP/JSON; the run id (32 hex digits) is the trace id."""
+    spans = []
+
+    def walk(node: dict, parent_id: str = None):
+        attributes = {
+            "etl.run_id": run_id,
+            "etl.rows": node["rows"],
+            "etl.bytes": node["bytes"],
+            "etl.cpu_seconds": node["cpu_seconds"],
+            "etl.db_round_trips": node["db_round_trips"],
+            "etl.calls": node["calls"],
+        }
+        if node["source"]:
+            attributes["etl.source"] = node["source"]
+        start = node["start"] or 0.0
+        spans.append({
+            "traceId": run_id,
+            "spanId": node["span_id"],
+            "parentSpanId": parent_id or "",
+            "name": f"etl.{node['name']}",
+            "kind": 1,
+            "startTimeUnixNano": str(int(start * 1e9)),
+            "endTimeUnixNano": str(int((node["end"] or start) * 1e9)),
+            "attributes": [{"key": key, "value": _otel_value(value)} for key, value in attributes.items()],
+        })
+        for child in node["children"]:
+            walk(child, node["span_id"])
+
+    walk(profile)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "crypto-etl"}}]},
+        "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+    }]}
+
+def span(name: str):
+    """Nested span under the thread's current span; a no-op outside a profiled run."""
+    profile = getattr(_local, "profile", None)
+    if profile is None or getattr(_local, "span", None) is None:
+        return nullcontext()
+    return profile.span(name)
+
+def add(rows: int = 0, nbytes: int = 0, round_trips: int = 0):
+    """Charges rows, bytes or round trips to the thread's current span, if any."""
+    current = getattr(_local, "span", None)
+    if current is not None:
+        current.rows += rows
+        current.bytes += nbytes
+        current.db_round_trips += round_trips
+
+def flatten(profile: dict) -> Dict[str, dict]:
+    """{"coingecko/merge/upsert": span, ...} for every span below the root."""
+    flat = {}
+
+    def walk(node: dict, prefix: str):
+        for child in node["children"]:
+            path = f"{prefix}/{child['name']}" if prefix else child["name"]
+            flat[path] = child
+            walk(child, path)
+
+    walk(profile or {"children": []}, "")
+    return flat
+
+def stage_totals(profile: dict) -> Dict[str, dict]:
+    """Per-stage sums over sources: wall/CPU seconds, rows, bytes and round trips."""
+    totals: Dict[str, dict] = {}
+    for node in (profile or {}).get("children", []):
+        if not node["source"]:
+            continue
+        for stage in node["children"]:
+            total = totals.setdefault(stage["name"], dict.fromkeys(_METRICS, 0))
+            for key in _METRICS:
+                total[key] += stage[key]
+    return totals
+
+_METRICS = ("wall_seconds", "cpu_seconds", "rows", "bytes", "db_round_trips")
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    add(round_trips=1)
+
+@event.listens_for(Engine, "commit")
+def _count_commit(conn):
+    add(round_trips=1)
@@ -0,0 +1,213 @@
+"""
+Retention for the raw_* landing tables.
+
+Rows older than a source's TTL are deleted in batches, optionally after
+being appended to a compressed JSONL archive per source and day. Runs after
+successful ETL runs once RETENTION_INTERVAL_SECONDS have passed, or by hand:
+
+    python -m app.ingestion.retention [--dry-run] [--source coingecko] [--archive-dir /var/lib/raw-archive]
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func, literal_column, select
+from sqlalchemy.orm import Session
+
+from app.ingestion import connectors
+
+logger = logging.getLogger(__name__)
+
+# Days raw rows are kept, overridable per source with RAW_RETENTION_<SOURCE>_DAYS; 0 keeps them forever
+RAW_RETENTION_DAYS = float(os.getenv("RAW_RETENTION_DAYS", "30"))
+RAW_RETENTION_BATCH_SIZE = int(os.getenv("RAW_RETENTION_BATCH_SIZE", "5000"))
+# Directory for <table>/<YYYY-MM-DD>.jsonl.gz archives of deleted rows; unset deletes without archiving
+RAW_ARCHIVE_DIR = os.getenv("RAW_ARCHIVE_DIR")
+RAW_ARCHIVE_COMPRESSION = os.getenv("RAW_ARCHIVE_COMPRESSION", "gzip")
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+
+_ARCHIVE_SUFFIX = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+# Totals since process start, exported on /metrics
+_lock = threading.Lock()
+_reclaimed: Dict[str, Dict[str, int]] = {}
+_last_run: Optional[float] = None
+
+def retention_days(source: str) -> float:
+    return float(os.getenv(f"RAW_RETENTION_{source.upper()}_DAYS", RAW_RETENTION_DAYS))
+
+def archive_compression(name: str = None) -> str:
+    """'gzip' or 'zstd'; zstd needs the optional zstandard package and falls back to gzip without it."""
+    name = (name or RAW_ARCHIVE_COMPRESSION).lower()
+    if name not in _ARCHIVE_SUFFIX:
+        raise ValueError(f"Unknown archive compression {name!r}, expected one of {sorted(_ARCHIVE_SUFFIX)}")
+    if name == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            logger.warning("RAW_ARCHIVE_COMPRESSION=zstd but zstandard is not installed; archiving with gzip")
+            return "gzip"
+    return name
+
+def _open_archive(path: str, compression: str):
+    # Appending adds a new gzip member / zstd frame; both formats allow concatenation
+    if compression == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor().stream_writer(open(path, "ab"), closefd=True)
+    return gzip.open(path, "ab")
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def archive_rows(rows: List[dict], table: str, archive_dir: str, compression: str = "gzip") -> List[str]:
+    """Appends rows to <archive_dir>/<table>/<day of ingested_at><suffix>; returns the files written."""
+    by_day: Dict[str, List[dict]] = {}
+    for row in rows:
+        ingested_at = row.get("ingested_at")
+        day = ingested_at.astimezone(timezone.utc).date().isoformat() if ingested_at else "unknown"
+        by_day.setdefault(day, []).append(row)
+
+    os.makedirs(os.path.join(archive_dir, table), exist_ok=True)
+    paths = []
+    for day, day_rows in sorted(by_day.items()):
+        path = os.path.join(archive_dir, table, day + _ARCHIVE_SUFFIX[compression])
+        payload = "".join(json.dumps(row, default=_json_default, separators=(",", ":")) + "\n" for row in day_rows)
+        with _open_archive(path, compression) as f:
+            f.write(payload.encode())
+        # The rows are deleted right after this; make sure the archive is on disk first
+        with open(path, "rb") as f:
+            os.fsync(f.fileno())
+        paths.append(path)
+    return paths
+
+def prune_source(
+    db: Session,
+    connector,
+    now: datetime = None,
+    dry_run: bool = False,
+    archive_dir: str = None,
+    compression: str = None,
+    batch_size: int = None
+) -> Dict[str, int]:
+    """
+    Deletes (or with `dry_run`, measures) the connector's raw rows older than
+    its TTL. Each batch is archived first when `archive_dir` is set and
+    committed on its own, so a large backlog never holds one long transaction.
+    Returns rows deleted, their on-disk size in bytes, and rows archived.
+    """
+    result = {"rows": 0, "bytes": 0, "archived": 0}
+    days = retention_days(connector.name)
+    if connector.raw_model is None or days <= 0:
+        return result
+    now = now or datetime.now(timezone.utc)
+    cutoff = now - timedelta(days=days)
+    table = connector.raw_model.__table__
+    row_size = func.pg_column_size(literal_column(f"{table.name}.*"))
+
+    if dry_run:
+        rows, size = db.execute(
+            select(func.count(), func.coalesce(func.sum(row_size), 0)).select_from(table).where(table.c.ingested_at < cutoff)
+        ).one()
+        result.update(rows=rows, bytes=int(size))
+        return result
+
+    batch_size = batch_size or RAW_RETENTION_BATCH_SIZE
+    compression = archive_compression(compression) if archive_dir else None
+    oldest = (
+        select(table.c.id)
+        .where(table.c.ingested_at < cutoff)
+        .order_by(table.c.id)
+        .limit(batch_size)
+        .scalar_subquery()
+    )
+    returning = [*table.c, row_size.label("_bytes")] if archive_dir else [row_size.label("_bytes")]
+    stmt = delete(table).where(table.c.id.in_(oldest)).returning(*returning)
+
+    while True:
+        try:
+            deleted = [dict(row._mapping) for row in db.execute(stmt)]
+            if archive_dir and deleted:
+                archive_rows(
+                    [{k: v for k, v in row.items() if k != "_bytes"} for row in deleted],
+                    table.name, archive_dir, compression
+                )
+            db.commit()
+        except Exception:
+            # Nothing is deleted unless its archive was written
+            db.rollback()
+            raise
+        result["rows"] += len(deleted)
+        result["bytes"] += sum(row["_bytes"] for row in deleted)
+        result["archived"] += len(deleted) if archive_dir else 0
+        if len(deleted) < batch_size:
+            return result
+
+def run_retention(
+    db: Session,
+    sources: List[str] = None,
+    dry_run: bool = False,
+    archive_dir: str = None,
+    now: datetime = None
+) -> Dict[str, Dict[str, int]]:
+    """Prunes every registered source (or just `sources`); returns per-source results."""
+    global _last_run
+    archive_dir = archive_dir if archive_dir is not None else RAW_ARCHIVE_DIR
+    results = {}
+    for connector in connectors.get_connectors():
+        if sources and connector.name not in sources:
+            continue
+        start = time.perf_counter()
+        results[connector.name] = prune_source(db, connector, now=now, dry_run=dry_run, archive_dir=archive_dir)
+        outcome = results[connector.name]
+        verb = "Would delete" if dry_run else "Deleted"
+        logger.info(
+            f"Retention {connector.name}: {verb} {outcome['rows']} raw rows "
+            f"({outcome['bytes'] / 2**20:.1f} MiB, {outcome['archived']} archived) in {time.perf_counter() - start:.2f}s"
+        )
+        if not dry_run:
+            with _lock:
+                totals = _reclaimed.setdefault(connector.name, {"rows": 0, "bytes": 0, "archived": 0})
+                for key, value in outcome.items():
+                    totals[key] += value
+    if not dry_run:
+        _last_run = time.time()
+    return results
+
+def run_if_due(db: Session) -> Optional[Dict[str, Dict[str, int]]]:
+    """Runs retention when RETENTION_INTERVAL_SECONDS have passed since the last run in this process."""
+    if RETENTION_INTERVAL_SECONDS <= 0:
+        return None
+    if _last_run is not None and time.time() - _last_run < RETENTION_INTERVAL_SECONDS:
+        return None
+    return run_retention(db)
+
+def stats() -> dict:
+    with _lock:
+        return {"reclaimed": {source: dict(totals) for source, totals in _reclaimed.items()}, "last_run": _last_run}
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Prune raw_* tables past their retention period.")
+    parser.add_argument("--source", action="append", help="Only this source (repeatable)")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be deleted")
+    parser.add_argument("--archive-dir", default=RAW_ARCHIVE_DIR, help="Archive deleted rows here first")
+    args = parser.parse_args(argv)
+
+    from app.core.database import SessionLocal
+    db = SessionLocal()
+    try:
+        results = run_retention(db, sources=args.source, dry_run=args.dry_run, archive_dir=args.archive_dir or "")
+    finally:
+        db.close()
+    for source, outcome in results.items():
+        print(f"{source:<12} rows={outcome['rows']:<10} bytes={outcome['bytes']:<12} archived={outcome['archived']}")
+
+if __name__ == "__main__":
+    main()
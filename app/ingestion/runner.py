@@ -1,70 +1,296 @@
+from sqlalchemy import text
 from sqlalchemy.orm import Session
+from app.core.cache import response_cache, CACHE_INVALIDATION_CHANNEL
+from app.core import metrics, replicas
 from app.core.database import SessionLocal
-from app.ingestion import extractor, transformer, loader, drift
+from app.ingestion import connectors, extraction, transformer, loader, drift, pipeline, profiling, retention
+from app.ingestion.change_tracker import ChangeTracker
+from app.services import search_service
+import functools
 import os
 import time
+import uuid
 
-def run_etl():
-    """Runs the full ETL pipeline."""
+# Fingerprints of what is already in crypto_assets, kept across runs
+change_tracker = ChangeTracker()
+
+# Tells this process's cache invalidation notices apart from other workers'
+_PROCESS_TOKEN = uuid.uuid4().hex
+
+def _check_failure_injection():
+    # Failure Injection (P2.2)
+    if os.getenv("INJECT_FAILURE") == "true":
+        raise Exception("Simulated ETL Failure (INJECT_FAILURE=true)")
+
+class RunCancelled(Exception):
+    """Raised inside run_etl once its cancel event is set (e.g. on shutdown)."""
+
+def _check_cancelled(cancel):
+    if cancel is not None and cancel.is_set():
+        raise RunCancelled("ETL run cancelled")
+
+def _merge_changes(total: dict, changes: dict):
+    for source, counts in changes.items():
+        source_total = total.setdefault(source, {})
+        for key, value in counts.items():
+            source_total[key] = source_total.get(key, 0) + value
+
+def invalidate_local():
+    """Drops this process's cached /data, /stats and /health responses and marks its search index stale."""
+    response_cache.bump_generation()
+    search_service.search_index.invalidate()
+
+def on_published(payload: str):
+    """CACHE_INVALIDATION_CHANNEL handler: another process committed data readers should see."""
+    if payload != _PROCESS_TOKEN:
+        invalidate_local()
+
+def _publish(db: Session):
+    """
+    Called after each commit readers should see: invalidates the cached
+    responses and search index here and, through CACHE_INVALIDATION_CHANNEL,
+    in every other worker, and records the primary's WAL position so
+    read-your-writes requests avoid replicas that have not replayed it yet.
+    """
+    invalidate_local()
+    try:
+        db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CACHE_INVALIDATION_CHANNEL, "payload": _PROCESS_TOKEN})
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Could not notify other workers of new data: {e}")
+    try:
+        replicas.record_primary_write(db)
+    except Exception as e:
+        print(f"Could not record primary WAL position: {e}")
+
+def _load_unified(db: Session, assets: list, priorities: dict) -> dict:
+    """Upserts the new, changed, or due-for-touch assets; returns per-source change counts."""
+    to_write, changes = change_tracker.partition(assets)
+    counts, written = loader.load_unified_data(db, to_write, priorities=priorities)
+    # Rows the priority guard skipped still hold another source's values
+    change_tracker.skipped([asset for asset in to_write if asset.id not in written], changes)
+    change_tracker.commit([asset for asset in to_write if asset.id in written])
+    if counts["inserted"] or counts["updated"]:
+        _publish(db)
+    print(f"Upserted {len(to_write)} of {len(assets)} unified records: {counts['inserted']} inserted, {counts['updated']} updated.")
+    return changes
+
+def _prune_raw(db: Session):
+    """Raw-table retention, when due; a failure here never fails the run."""
+    try:
+        retention.run_if_due(db)
+    except Exception as e:
+        db.rollback()
+        print(f"Raw retention failed: {e}")
+
+class _Stages:
+    """
+    The raw load, transform and merge stages of one run. Stages run on
+    their own threads, so the DB stages each get their own session.
+
+    The merge stage upserts every chunk as soon as it is transformed. Within
+    the run, an asset already merged from a higher-priority source is not
+    overwritten by a lower-priority chunk arriving later; across runs the
+    priority guard in the upsert does the same until the row goes stale
+    (loader.SOURCE_OWNERSHIP_SECONDS).
+    """
+
+    def __init__(self, connectors_by_name: dict, run_id: str, priorities: dict, validators: dict, baselines: dict, drift_reports: dict):
+        self.connectors = connectors_by_name
+        self.run_id = run_id
+        self.priorities = priorities
+        self.validators = validators
+        self.baselines = baselines  # source -> accepted drift profile
+        self.profiles = {}
+        self.summaries = {}  # source -> drift profile of this run's batch
+        self.drift = drift_reports
+        self.raw_db = SessionLocal()
+        self.merge_db = SessionLocal()
+        self.claimed = {}  # asset id -> priority of the source that wrote it this run
+        self.records = {}
+        self.changes = {}
+
+    def raw_load(self, chunk: pipeline.Chunk) -> pipeline.Chunk:
+        source = chunk.source
+        if chunk.items:
+            # Streamed sources arrive in several chunks; drift is judged on the whole batch
+            self.profiles.setdefault(source, drift.SchemaProfile()).add(chunk.items)
+            self.connectors[source].load_raw(self.raw_db, chunk.items, run_id=self.run_id)
+        if chunk.last and source in self.profiles:
+            summary = self.summaries[source] = self.profiles.pop(source).summary()
+            report = self.drift[source] = drift.check(source, summary, self.baselines.get(source))
+            # A drifted batch is compared with the same baseline next run, so
+            # lasting drift keeps being reported until it is accepted
+            if not report["drift"] or source not in self.baselines:
+                self.baselines[source] = summary
+        _check_failure_injection()
+        return chunk
+
+    def transform(self, chunk: pipeline.Chunk) -> pipeline.Chunk:
+        if chunk.items:
+            chunk.items = self.connectors[chunk.source].transform(chunk.items)
+        return chunk
+
+    def merge(self, chunk: pipeline.Chunk) -> pipeline.Chunk:
+        source = chunk.source
+        priority = self.priorities.get(source, 0)
+        self.records[source] = self.records.get(source, 0) + len(chunk.items)
+        assets = [
+            asset for asset in transformer.unify_assets({source: chunk.items}, self.priorities)
+            if self.claimed.get(asset.id, priority) <= priority
+        ]
+        for asset in assets:
+            self.claimed[asset.id] = priority
+        if assets:
+            _merge_changes(self.changes, _load_unified(self.merge_db, assets, self.priorities))
+        if chunk.last:
+            # Only remember validators once the data they describe is committed
+            loader.update_checkpoint(
+                self.merge_db, source, "success", self.records[source],
+                {"http_validators": self.validators[source], "changes": self.changes.get(source, {}), "error": None}
+            )
+        return chunk
+
+    def close(self):
+        self.raw_db.close()
+        self.merge_db.close()
+
+def _run_pipeline(db: Session, run_id: str, sources, cancel, profile: profiling.RunProfile, drift_reports: dict) -> pipeline.Pipeline:
+    """
+    Extracts every source and pushes it through the staged pipeline; returns
+    the drained pipeline. Each source's schema drift report is added to
+    `drift_reports` as soon as its batch has been profiled.
+    """
+    if not change_tracker.seeded and os.getenv("ETL_CHANGE_TRACKER_SEED", "true") == "true":
+        with profile.span("seed_change_tracker"):
+            change_tracker.seed(db)
+
+    # 1. Extract all sources concurrently; each one is drift-checked,
+    # landed raw, transformed and merged as soon as it arrives, with the
+    # stages overlapping across sources (see pipeline.py).
+    print("Extracting data...")
+    registered = {
+        connector.name: connector for connector in connectors.get_connectors()
+        if sources is None or connector.name in sources
+    }
+    priorities = connectors.priorities()
+    checkpoints = {name: loader.get_checkpoint_meta(db, name) for name in registered}
+    # Conditional-request validators (ETag, Last-Modified, ...) from the last successful run
+    validators = {name: meta.get("http_validators") or {} for name, meta in checkpoints.items()}
+    # Accepted schema profiles, for drift detection
+    baselines = {name: meta["drift_baseline"] for name, meta in checkpoints.items() if meta.get("drift_baseline")}
+    # Streaming connectors only open their stream here; it is consumed below
+    fetchers = {
+        name: functools.partial(
+            connector.open_stream if connector.streaming else connector.fetch,
+            validators=validators[name]
+        )
+        for name, connector in registered.items()
+    }
+    stages = _Stages(registered, run_id, priorities, validators, baselines, drift_reports)
+    try:
+        with pipeline.Pipeline(
+            stages.raw_load, stages.transform, stages.merge,
+            check=functools.partial(_check_cancelled, cancel),
+            profile=profile
+        ) as pipe:
+            for result in extraction.extract_concurrently(fetchers):
+                _check_cancelled(cancel)
+                if pipe.failed.is_set():
+                    break
+                source = result.source
+                streaming = registered[source].streaming
+                pipe.timings.add(source, "extract", result.duration_seconds)
+                metrics.ETL_STAGE_DURATION.observe(result.duration_seconds, stage="extract", source=source)
+                if not streaming and result.data:
+                    metrics.ETL_ROWS.inc(len(result.data), stage="extract", source=source)
+                profile.record(
+                    "extract", source, wall=result.duration_seconds, cpu=result.cpu_seconds,
+                    rows=0 if streaming else len(result.data)
+                )
+                extract_meta = {"extract_seconds": round(result.duration_seconds, 3)}
+                if not result.ok:
+                    print(f"Skipping {source}: {result.error}")
+                    loader.update_checkpoint(db, source, "failed", 0, {**extract_meta, "error": result.error})
+                    continue
+                if result.not_modified:
+                    print(f"{source} not modified since last run, skipping transform/load")
+                    loader.update_checkpoint(db, source, "not_modified", 0, {**extract_meta, "error": None})
+                    continue
+
+                # 2-4. Raw load -> transform -> merge on the pipeline threads
+                if streaming:
+                    print(f"Streaming {source}...")
+                    pipe.feed_async(source, result.data)
+                else:
+                    print(f"Extracted {len(result.data)} {source} records in {result.duration_seconds:.2f}s")
+                    pipe.put(pipeline.Chunk(source, result.data, last=True))
+    finally:
+        stages.close()
+
+    for source in stages.records:
+        meta = {"stages": pipe.timings.source(source)}
+        if source in stages.summaries:
+            meta["drift_profile"] = stages.summaries[source]
+            if stages.baselines[source] is stages.summaries[source]:
+                meta["drift_baseline"] = stages.baselines[source]
+        loader.update_checkpoint(db, source, "success", stages.records[source], meta)
+    return pipe
+
+def _finish_profile(profile: profiling.RunProfile) -> dict:
+    profile.export_otel()
+    return profile.to_dict()
+
+def run_etl(sources=None, run_id: str = None, cancel=None) -> str:
+    """
+    Runs the ETL pipeline for every registered source, or only `sources`.
+    `cancel` (a threading.Event) stops the run between batches and sources;
+    it is then recorded as 'cancelled'. The run's span profile and schema
+    drift report are stored with its final status. Returns the run id.
+    """
     db = SessionLocal()
     start_time = time.time()
+    # Tags every raw row and status record written by this run
+    run_id = run_id or uuid.uuid4().hex
+    profile = profiling.RunProfile(run_id)
+    drift_reports = {}
     try:
-        print("Starting ETL pipeline...")
-        loader.update_etl_status(db, "running")
-
-        # 1. Extract
-        print("Extracting data...")
-        api_data = extractor.fetch_coinpaprika_data()
-        drift.detect_drift("coinpaprika", api_data)
-        
-        gecko_data = extractor.fetch_coingecko_data()
-        drift.detect_drift("coingecko", gecko_data)
-        
-        csv_path = os.path.join(os.path.dirname(__file__), "../data/source.csv")
-        csv_data = extractor.fetch_csv_data(csv_path)
-        drift.detect_drift("csv", csv_data)
-
-        # 2. Load Raw
-        print("Loading raw data...")
-        if api_data:
-            loader.load_raw_coinpaprika(db, api_data)
-        if gecko_data:
-            loader.load_raw_coingecko(db, gecko_data)
-        
-        if csv_data:
-            loader.load_raw_csv(db, csv_data)
-
-        # Failure Injection (P2.2)
-        if os.getenv("INJECT_FAILURE") == "true":
-            raise Exception("Simulated ETL Failure (INJECT_FAILURE=true)")
-
-        # 3. Transform
-        print("Transforming data...")
-        unified_api = transformer.transform_coinpaprika_data(api_data)
-        loader.update_checkpoint(db, "coinpaprika", "success", len(unified_api))
-        
-        unified_gecko = transformer.transform_coingecko_data(gecko_data)
-        loader.update_checkpoint(db, "coingecko", "success", len(unified_gecko))
-        
-        unified_csv = transformer.transform_csv_data(csv_data)
-        loader.update_checkpoint(db, "csv", "success", len(unified_csv))
-        
-        all_unified = transformer.unify_assets(unified_api, unified_gecko, unified_csv)
-
-        # 4. Load Unified
-        print(f"Loading {len(all_unified)} unified records...")
-        loader.load_unified_data(db, all_unified)
+        print(f"Starting ETL pipeline (run {run_id})...")
+        with profile.activate():
+            loader.update_etl_status(db, "running", run_id=run_id)
+            _publish(db)
+            pipe = _run_pipeline(db, run_id, sources, cancel, profile, drift_reports)
 
         duration = time.time() - start_time
-        loader.update_etl_status(db, "success", duration=duration)
+        loader.update_etl_status(
+            db, "success", duration=duration, run_id=run_id,
+            stage_timings=pipe.timings.totals(), profile=_finish_profile(profile), drift=drift_reports or None
+        )
+        _publish(db)
         print(f"ETL pipeline completed successfully in {duration:.2f}s.")
+        _prune_raw(db)
 
+    except RunCancelled as e:
+        print(f"ETL pipeline cancelled: {e}")
+        db.rollback()
+        loader.update_etl_status(
+            db, "cancelled", str(e), duration=time.time() - start_time, run_id=run_id,
+            profile=_finish_profile(profile), drift=drift_reports or None
+        )
+        _publish(db)
     except Exception as e:
         print(f"ETL pipeline failed: {e}")
         duration = time.time() - start_time
-        loader.update_etl_status(db, "failed", str(e), duration=duration)
+        loader.update_etl_status(
+            db, "failed", str(e), duration=duration, run_id=run_id, profile=_finish_profile(profile), drift=drift_reports or None
+        )
+        _publish(db)
     finally:
         db.close()
+    return run_id
 
 if __name__ == "__main__":
-    run_etl()
+    # Through the scheduler so a manual run respects the per-source locks
+    from app.ingestion.scheduler import scheduler
+    scheduler.wait(scheduler.trigger())
@@ -0,0 +1,312 @@
+"""
+Periodic ETL scheduling.
+
+Each source runs on its own schedule: ETL_<SOURCE>_SCHEDULE, else
+ETL_SCHEDULE, either an interval in seconds or a five-field cron expression
+(minute hour day month weekday, evaluated in UTC). Sources that come due
+together share one run, so they are unified against each other as before.
+
+Two runs never work on the same source at once: within a process the
+scheduler tracks in-flight sources, and across workers and replicas each
+run holds a Postgres session-level advisory lock per source for its
+duration. A source that is still busy is skipped until its next slot.
+"""
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional
+
+from sqlalchemy import text
+
+from app.core.database import engine
+from app.ingestion import connectors, runner
+
+logger = logging.getLogger(__name__)
+
+# Default schedule for every source; "off" leaves a source to POST /etl/run only
+ETL_SCHEDULE = os.getenv("ETL_SCHEDULE", "300")
+# Each run starts up to this many seconds late, so workers and replicas
+# started together don't all hit the upstream APIs and the lock at once
+ETL_SCHEDULE_JITTER_SECONDS = float(os.getenv("ETL_SCHEDULE_JITTER_SECONDS", "5"))
+# How long shutdown waits for a cancelled run to stop
+ETL_SHUTDOWN_TIMEOUT_SECONDS = float(os.getenv("ETL_SHUTDOWN_TIMEOUT_SECONDS", "30"))
+
+class RunInProgress(Exception):
+    """Some requested source is already being run, here or on another node."""
+
+    def __init__(self, sources: List[str], run_id: str = None):
+        self.sources = sources
+        self.run_id = run_id
+        where = f"run {run_id}" if run_id else "another worker"
+        super().__init__(f"ETL already running for {', '.join(sources)} ({where})")
+
+class IntervalSchedule:
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError("Schedule interval must be positive")
+        self.seconds = seconds
+
+    def first(self, now: float) -> float:
+        # Like the old startup run: due as soon as the scheduler starts
+        return now
+
+    def next_after(self, now: float) -> float:
+        return now + self.seconds
+
+    def __repr__(self):
+        return f"every {self.seconds:g}s"
+
+_CRON_FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7))
+
+def _cron_field(expr: str, low: int, high: int) -> FrozenSet[int]:
+    values = set()
+    for part in expr.split(","):
+        span, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if span == "*":
+            start, end = low, high
+        elif "-" in span:
+            start, end = (int(bound) for bound in span.split("-", 1))
+        else:
+            start = int(span)
+            end = high if step > 1 else start
+        if step < 1 or not low <= start <= end <= high:
+            raise ValueError(f"Invalid cron field {expr!r}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+class CronSchedule:
+    """Five-field cron expression in UTC; day and weekday match either-or when both are set, as in cron."""
+
+    def __init__(self, expr: str):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expr!r}")
+        self.expr = expr
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _cron_field(field, low, high) for field, (_, low, high) in zip(fields, _CRON_FIELDS)
+        )
+        # cron counts Sunday as 0 or 7
+        self.weekdays = frozenset(day % 7 for day in weekdays)
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_matches(self, dt: datetime) -> bool:
+        day = dt.day in self.days
+        weekday = (dt.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def first(self, now: float) -> float:
+        return self.next_after(now)
+
+    def next_after(self, now: float) -> float:
+        dt = datetime.fromtimestamp(now, tz=timezone.utc).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=5 * 366)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+            else:
+                return dt.timestamp()
+        raise ValueError(f"Cron expression {self.expr!r} never fires")
+
+    def __repr__(self):
+        return f"cron {self.expr!r}"
+
+def parse_schedule(expr: str):
+    """'300' -> IntervalSchedule, '*/5 * * * *' -> CronSchedule, 'off' -> None."""
+    expr = (expr or "").strip()
+    if expr.lower() in ("", "off", "none", "false"):
+        return None
+    try:
+        return IntervalSchedule(float(expr))
+    except ValueError:
+        return CronSchedule(expr)
+
+def source_schedules() -> Dict[str, object]:
+    """Schedules of the registered sources, from ETL_<SOURCE>_SCHEDULE or ETL_SCHEDULE."""
+    schedules = {}
+    for connector in connectors.get_connectors():
+        schedule = parse_schedule(os.getenv(f"ETL_{connector.name.upper()}_SCHEDULE", ETL_SCHEDULE))
+        if schedule is not None:
+            schedules[connector.name] = schedule
+    return schedules
+
+def lock_key(source: str) -> int:
+    """Stable signed 64-bit advisory lock key for a source."""
+    digest = hashlib.blake2b(f"crypto-etl:{source}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+def acquire_source_locks(sources: Iterable[str]):
+    """
+    Takes the advisory lock of every source on one dedicated connection, or
+    none of them (raising RunInProgress). The connection must be handed to
+    release_source_locks; if the process dies the locks go with it.
+    """
+    conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        held = [
+            source for source in sources
+            if not conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": lock_key(source)}).scalar()
+        ]
+        if held:
+            raise RunInProgress(held)
+        return conn
+    except Exception:
+        release_source_locks(conn)
+        raise
+
+def release_source_locks(conn):
+    try:
+        # Pooled connections keep session locks, so drop them before returning it
+        conn.execute(text("SELECT pg_advisory_unlock_all()"))
+    except Exception as e:
+        logger.warning(f"Could not release ETL advisory locks: {e}")
+    finally:
+        conn.close()
+
+class Scheduler:
+    """
+    Starts ETL runs on a background thread, from POST /etl/run via trigger()
+    and on each source's schedule once start() is called. stop() cancels
+    in-flight runs and waits for them to wind down.
+    """
+
+    def __init__(self, schedules: Dict[str, object] = None, jitter: float = None, run: Callable = None):
+        self.schedules = schedules
+        self.jitter = ETL_SCHEDULE_JITTER_SECONDS if jitter is None else jitter
+        self.run = run
+        self.next_due: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._running: Dict[str, str] = {}  # source -> run id
+        self._runs: Dict[str, tuple] = {}   # run id -> (thread, cancel event)
+        self._stop = threading.Event()
+        self._loop_thread: Optional[threading.Thread] = None
+
+    def running(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._running)
+
+    def trigger(self, sources: Iterable[str] = None, skip_busy: bool = False) -> Optional[str]:
+        """
+        Starts a run of `sources` (default: all registered) and returns its id.
+        Raises RunInProgress if any of them is busy; with `skip_busy` the
+        busy ones are left out instead, returning None if nothing is left.
+        """
+        registered = [connector.name for connector in connectors.get_connectors()]
+        sources = registered if sources is None else list(dict.fromkeys(sources))
+        unknown = sorted(set(sources) - set(registered))
+        if unknown:
+            raise ValueError(f"Unknown source(s): {', '.join(unknown)}")
+
+        with self._lock:
+            busy = [source for source in sources if source in self._running]
+            if busy and not skip_busy:
+                raise RunInProgress(busy, self._running[busy[0]])
+            sources = [source for source in sources if source not in busy]
+            locks = None
+            while sources:
+                try:
+                    locks = acquire_source_locks(sources)
+                    break
+                except RunInProgress as e:
+                    if not skip_busy:
+                        raise
+                    sources = [source for source in sources if source not in e.sources]
+            if not sources:
+                return None
+            run_id = uuid.uuid4().hex
+            cancel = threading.Event()
+            thread = threading.Thread(
+                target=self._run, args=(run_id, sources, locks, cancel), name=f"etl-{run_id[:8]}", daemon=True
+            )
+            for source in sources:
+                self._running[source] = run_id
+            self._runs[run_id] = (thread, cancel)
+        thread.start()
+        return run_id
+
+    def _run(self, run_id: str, sources: List[str], locks, cancel: threading.Event):
+        try:
+            (self.run or runner.run_etl)(sources=sources, run_id=run_id, cancel=cancel)
+        except Exception:
+            logger.exception(f"ETL run {run_id} crashed")
+        finally:
+            release_source_locks(locks)
+            with self._lock:
+                for source in sources:
+                    self._running.pop(source, None)
+                self._runs.pop(run_id, None)
+
+    def wait(self, run_id: str, timeout: float = None) -> bool:
+        """Blocks until the run finished; False on timeout."""
+        with self._lock:
+            run = self._runs.get(run_id)
+        if run is not None:
+            run[0].join(timeout)
+            return not run[0].is_alive()
+        return True
+
+    def start(self):
+        if self._loop_thread is not None:
+            return
+        if self.schedules is None:
+            self.schedules = source_schedules()
+        self._stop.clear()
+        now = time.time()
+        self.next_due = {
+            source: schedule.first(now) + random.uniform(0, self.jitter)
+            for source, schedule in self.schedules.items()
+        }
+        logger.info("ETL schedules: " + (", ".join(f"{s} {sch!r}" for s, sch in self.schedules.items()) or "none"))
+        self._loop_thread = threading.Thread(target=self._loop, name="etl-scheduler", daemon=True)
+        self._loop_thread.start()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            now = time.time()
+            due = sorted(source for source, at in self.next_due.items() if at <= now)
+            if not due:
+                if not self.next_due:
+                    break
+                self._stop.wait(min(self.next_due.values()) - now)
+                continue
+            try:
+                run_id = self.trigger(due, skip_busy=True)
+                if run_id is None:
+                    logger.info(f"ETL for {', '.join(due)} still running, skipping this slot")
+            except Exception:
+                logger.exception(f"Could not start scheduled ETL for {', '.join(due)}")
+            for source in due:
+                self.next_due[source] = self.schedules[source].next_after(now) + random.uniform(0, self.jitter)
+
+    def stop(self, timeout: float = None):
+        """Stops scheduling, cancels in-flight runs and waits up to `timeout` for them."""
+        timeout = ETL_SHUTDOWN_TIMEOUT_SECONDS if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        self._stop.set()
+        if self._loop_thread is not None:
+            self._loop_thread.join(timeout)
+            self._loop_thread = None
+        with self._lock:
+            runs = list(self._runs.items())
+        for _, (_, cancel) in runs:
+            cancel.set()
+        for run_id, (thread, _) in runs:
+            thread.join(max(0, deadline - time.monotonic()))
+            if thread.is_alive():
+                logger.warning(f"ETL run {run_id} did not stop within {timeout:g}s")
+
+scheduler = Scheduler()
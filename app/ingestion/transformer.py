@@ -1,9 +1,29 @@
+import logging
+import math
+import os
 from typing import List, Dict, Any
 from app.schemas.schemas import CryptoAssetCreate
 
+logger = logging.getLogger(__name__)
+
+# "columnar" (default) validates whole batches with vectorized masks, see
+# columnar.py; "rowwise" builds and validates one model per item.
+ETL_TRANSFORM_MODE = os.getenv("ETL_TRANSFORM_MODE", "columnar")
+
+def _optional_float(value):
+    """market_cap rule: empty, zero or NaN (pandas' missing value) means unknown."""
+    if not value or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return float(value)
+
+def _log_rejects(source: str, rejected: int, total: int, last_error: Exception):
+    if rejected:
+        logger.warning(f"Skipped {rejected} of {total} malformed {source} items (last error: {last_error})")
+
 def transform_coinpaprika_data(raw_data: List[Dict[str, Any]]) -> List[CryptoAssetCreate]:
     """Transforms CoinPaprika data to unified schema."""
     transformed = []
+    rejected, last_error = 0, None
     for item in raw_data:
         try:
             # CoinPaprika returns 'id', 'name', 'symbol', 'quotes' -> 'USD' -> 'price'
@@ -20,14 +40,16 @@ def transform_coinpaprika_data(raw_data: List[Dict[str, Any]]) -> List[CryptoAss
             )
             transformed.append(asset)
         except Exception as e:
-            # Skip malformed items but log error (print for now)
-            print(f"Error transforming CoinPaprika item {item.get('id')}: {e}")
-            continue
+            # Skip malformed items; they are summarised once per batch
+            logger.debug(f"Error transforming CoinPaprika item {item.get('id')}: {e}")
+            rejected, last_error = rejected + 1, e
+    _log_rejects("CoinPaprika", rejected, len(raw_data), last_error)
     return transformed
 
 def transform_coingecko_data(raw_data: List[Dict[str, Any]]) -> List[CryptoAssetCreate]:
     """Transforms CoinGecko data to unified schema."""
     transformed = []
+    rejected, last_error = 0, None
     for item in raw_data:
         try:
             # CoinGecko: id, symbol, name, current_price, market_cap
@@ -36,18 +58,20 @@ def transform_coingecko_data(raw_data: List[Dict[str, Any]]) -> List[CryptoAsset
                 symbol=item["symbol"].upper(),
                 name=item["name"],
                 price_usd=float(item["current_price"]),
-                market_cap=float(item["market_cap"]) if item.get("market_cap") else None,
+                market_cap=_optional_float(item.get("market_cap")),
                 source="coingecko"
             )
             transformed.append(asset)
         except Exception as e:
-            print(f"Error transforming CoinGecko item {item.get('id')}: {e}")
-            continue
+            logger.debug(f"Error transforming CoinGecko item {item.get('id')}: {e}")
+            rejected, last_error = rejected + 1, e
+    _log_rejects("CoinGecko", rejected, len(raw_data), last_error)
     return transformed
 
 def transform_csv_data(raw_data: List[Dict[str, Any]]) -> List[CryptoAssetCreate]:
     """Transforms CSV data to unified schema."""
     transformed = []
+    rejected, last_error = 0, None
     for item in raw_data:
         try:
             # CSV columns: symbol, name, price_usd, market_cap
@@ -60,23 +84,25 @@ def transform_csv_data(raw_data: List[Dict[str, Any]]) -> List[CryptoAssetCreate
                 symbol=symbol,
                 name=item["name"],
                 price_usd=float(item["price_usd"]),
-                market_cap=float(item["market_cap"]) if item.get("market_cap") else None,
+                market_cap=_optional_float(item.get("market_cap")),
                 source="csv"
             )
             transformed.append(asset)
         except Exception as e:
-            print(f"Error transforming CSV item {item}: {e}")
-            continue
+            logger.debug(f"Error transforming CSV item {item}: {e}")
+            rejected, last_error = rejected + 1, e
+    _log_rejects("CSV", rejected, len(raw_data), last_error)
     return transformed
 
 def unify_assets(
-    paprika_data: List[CryptoAssetCreate],
-    gecko_data: List[CryptoAssetCreate],
-    csv_data: List[CryptoAssetCreate]
+    batches: Dict[str, List[CryptoAssetCreate]],
+    priorities: Dict[str, int]
 ) -> List[CryptoAssetCreate]:
     """
     Unifies assets from multiple sources based on symbol.
-    Priority: CoinGecko > CoinPaprika > CSV
+    `batches` maps a source name to its transformed assets; when several
+    sources report a symbol, the one with the highest priority wins
+    (by default CoinGecko > CoinPaprika > CSV, see connectors).
     """
     unified_map: Dict[str, CryptoAssetCreate] = {}
 
@@ -89,8 +115,7 @@ def unify_assets(
             unified_map[symbol] = asset
 
     # Process in reverse priority order so higher priority overwrites lower
-    process_source(csv_data)
-    process_source(paprika_data)
-    process_source(gecko_data)
+    for source in sorted(batches, key=lambda name: priorities.get(name, 0)):
+        process_source(batches[source])
 
     return list(unified_map.values())
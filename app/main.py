@@ -1,26 +1,44 @@
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
-import threading
-from app.core.database import engine, Base
+from app.core.database import engine, Base, SessionLocal, add_missing_columns, add_missing_indexes
+from app.core import metrics, serialization
+from app.core.cache import CACHE_INVALIDATION_CHANNEL
 from app.api import routes
+from app.services import stats_service, search_service
+from app.services.stream_service import price_hub
 from app.ingestion import runner
+from app.ingestion.scheduler import scheduler
 from app.core.security import get_api_key
 from fastapi import Depends
 import os
 
 # Create tables
 Base.metadata.create_all(bind=engine)
+add_missing_columns(engine)
+add_missing_indexes(engine)
+search_service.ensure_trgm_indexes(engine)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup logic
+    with SessionLocal() as db:
+        stats_service.load_etl_metrics(db)
+    metrics.start_flusher()
+    search_service.search_index.warm()
+    # Other workers' ETL commits invalidate this worker's cached responses
+    price_hub.on_notify(CACHE_INVALIDATION_CHANNEL, runner.on_published)
+    price_hub.start()
     if os.getenv("DISABLE_AUTO_ETL") != "true":
-        etl_thread = threading.Thread(target=runner.run_etl)
-        etl_thread.start()
+        scheduler.start()
     yield
-    # Shutdown logic
+    # Shutdown logic: cancel and wait for any in-flight run
+    scheduler.stop()
+    await price_hub.stop()
 
-app = FastAPI(title="Crypto ETL Backend", lifespan=lifespan)
+app = FastAPI(title="Crypto ETL Backend", lifespan=lifespan, default_response_class=serialization.FastJSONResponse)
+if serialization.RESPONSE_GZIP_MIN_BYTES > 0:
+    app.add_middleware(serialization.CompressionMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Protect all API routes
 app.include_router(routes.router, dependencies=[Depends(get_api_key)])
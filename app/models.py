@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, Boolean, Index, PrimaryKeyConstraint, literal_column
 from sqlalchemy.sql import func
 from app.core.database import Base
 
@@ -7,14 +7,16 @@ class RawCoinPaprika(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     data = Column(JSON)
-    ingested_at = Column(DateTime(timezone=True), server_default=func.now())
+    run_id = Column(String, index=True, nullable=True) # ETL run that landed the row
+    ingested_at = Column(DateTime(timezone=True), server_default=func.now(), index=True) # retention cutoff
 
 class RawCoinGecko(Base):
     __tablename__ = "raw_coingecko"
 
     id = Column(Integer, primary_key=True, index=True)
     data = Column(JSON)
-    ingested_at = Column(DateTime(timezone=True), server_default=func.now())
+    run_id = Column(String, index=True, nullable=True) # ETL run that landed the row
+    ingested_at = Column(DateTime(timezone=True), server_default=func.now(), index=True) # retention cutoff
 
 class RawCSV(Base):
     __tablename__ = "raw_csv"
@@ -22,7 +24,8 @@ class RawCSV(Base):
     id = Column(Integer, primary_key=True, index=True)
     symbol = Column(String, index=True)
     raw_data = Column(JSON) # Storing the row as JSON for simplicity
-    ingested_at = Column(DateTime(timezone=True), server_default=func.now())
+    run_id = Column(String, index=True, nullable=True) # ETL run that landed the row
+    ingested_at = Column(DateTime(timezone=True), server_default=func.now(), index=True) # retention cutoff
 
 class CryptoAsset(Base):
     __tablename__ = "crypto_assets"
@@ -35,13 +38,58 @@ class CryptoAsset(Base):
     source = Column(String) # 'coingecko', 'coinpaprika', or 'csv'
     last_updated = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
+# /data sort key: market cap descending (unknown caps last), ties broken by id.
+# Queries must use this exact expression for Postgres to match the index.
+asset_rank = func.coalesce(CryptoAsset.market_cap, literal_column("'-Infinity'::float8"))
+Index("ix_crypto_assets_rank", asset_rank.desc(), CryptoAsset.id.desc())
+# Case-insensitive symbol lookups (POST /data/batch) filter on upper(symbol)
+Index("ix_crypto_assets_symbol_upper", func.upper(CryptoAsset.symbol))
+
+class AssetPriceHistory(Base):
+    """
+    Append-only price points, one per asset whose row a load wrote.
+    Range-partitioned by month on ts; loader.ensure_history_partition
+    creates partitions as they are needed.
+    """
+    __tablename__ = "asset_price_history"
+    __table_args__ = (
+        # Doubles as the (asset_id, ts) index every history query uses
+        PrimaryKeyConstraint("asset_id", "ts", name="pk_asset_price_history"),
+        {"postgresql_partition_by": "RANGE (ts)"},
+    )
+
+    asset_id = Column(String, nullable=False) # crypto_assets.id
+    ts = Column(DateTime(timezone=True), nullable=False)
+    price_usd = Column(Float)
+    market_cap = Column(Float, nullable=True)
+    source = Column(String)
+
+class AssetPriceHourly(Base):
+    """Hourly OHLC rollup of asset_price_history, maintained by the loader."""
+    __tablename__ = "asset_price_hourly"
+    __table_args__ = (PrimaryKeyConstraint("asset_id", "bucket", name="pk_asset_price_hourly"),)
+
+    asset_id = Column(String, nullable=False)
+    bucket = Column(DateTime(timezone=True), nullable=False) # start of the hour
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
+    open_ts = Column(DateTime(timezone=True))
+    close_ts = Column(DateTime(timezone=True))
+    samples = Column(Integer, default=0)
+
 class ETLStatus(Base):
     __tablename__ = "etl_status"
 
     id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(String, index=True, nullable=True)
     status = Column(String) # 'running', 'success', 'failed'
     error_message = Column(String, nullable=True)
     duration_seconds = Column(Float, nullable=True)
+    stage_timings = Column(JSON, nullable=True) # busy seconds per pipeline stage, summed over sources
+    profile = Column(JSON, nullable=True) # span tree of the run, see ingestion/profiling.py
+    drift = Column(JSON, nullable=True) # schema drift report per source, see ingestion/drift.py
     last_run = Column(DateTime(timezone=True), server_default=func.now())
 
 class ETLCheckpoint(Base):
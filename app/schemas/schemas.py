@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, field_validator
-from typing import Optional, List
+from typing import Any, Dict, List, Literal, Optional
 from datetime import datetime
 
 class CryptoAssetBase(BaseModel):
@@ -21,9 +21,22 @@ class CryptoAssetResponse(CryptoAssetBase):
         from_attributes = True
 
 class Pagination(BaseModel):
-    page: int
+    page: Optional[int] = None  # None for cursor requests
     limit: int
-    total: int
+    total: Optional[int] = None  # None when the count was skipped
+    total_is_estimate: bool = False
+    next_cursor: Optional[str] = None
+
+# Columns POST /data/batch can project
+AssetField = Literal["id", "symbol", "name", "price_usd", "market_cap", "source", "last_updated"]
+
+class BatchLookupRequest(BaseModel):
+    symbols: List[str] = Field(..., min_length=1, max_length=1000)
+    fields: Optional[List[AssetField]] = None  # None returns every field
+
+class BatchLookupResponse(BaseModel):
+    data: Dict[str, Dict[str, Any]]  # keyed by the symbol as requested
+    unknown: List[str]
 
 class Metadata(BaseModel):
     request_id: str
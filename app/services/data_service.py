@@ -0,0 +1,117 @@
+import base64
+import binascii
+import json
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import ARRAY, String, any_, bindparam, func, select, text, tuple_
+from sqlalchemy.orm import Session
+
+from app.models import CryptoAsset, asset_rank
+
+class InvalidCursor(ValueError):
+    """Raised for a /data cursor that was not produced by encode_cursor."""
+
+def encode_cursor(asset) -> str:
+    """Opaque cursor pointing just past `asset` in /data sort order."""
+    raw = json.dumps([asset.market_cap, asset.id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """Returns the (rank, id) sort key encoded in `cursor`."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        market_cap, asset_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(asset_id, str) or not (market_cap is None or isinstance(market_cap, (int, float))):
+            raise ValueError(cursor)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+    # Unknown market caps sort last, as in models.asset_rank
+    return (float("-inf") if market_cap is None else float(market_cap)), asset_id
+
+def estimate_total(db: Session) -> Optional[int]:
+    """Planner row estimate for crypto_assets; None until the table has been analyzed."""
+    reltuples = db.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE oid = 'crypto_assets'::regclass")
+    ).scalar()
+    return reltuples if reltuples is not None and reltuples >= 0 else None
+
+# /data's columns, in CryptoAssetResponse field order
+PAGE_COLUMNS = (
+    CryptoAsset.symbol, CryptoAsset.name, CryptoAsset.price_usd, CryptoAsset.market_cap,
+    CryptoAsset.id, CryptoAsset.source, CryptoAsset.last_updated,
+)
+
+def get_assets_page(
+    db: Session,
+    limit: int,
+    page: int = 1,
+    cursor: Optional[str] = None,
+    symbol: Optional[str] = None,
+    count: str = "exact"
+) -> Tuple[list, Optional[str], Optional[int], bool]:
+    """
+    One page of crypto_assets ordered by market cap desc, id desc, as plain
+    rows of PAGE_COLUMNS (no ORM entities to build and then validate again).
+
+    With `cursor` the page is found by a keyset seek on ix_crypto_assets_rank,
+    so page 1000 costs the same as page 1; without it `page` falls back to
+    OFFSET. `count` is "exact", "estimate" (pg_class.reltuples, unfiltered
+    queries only) or "none".
+
+    Returns (assets, next_cursor, total, total_is_estimate).
+    """
+    query = db.query(*PAGE_COLUMNS)
+    if symbol:
+        query = query.filter(CryptoAsset.symbol == symbol)
+
+    total, estimated = None, False
+    if count == "estimate" and not symbol:
+        total = estimate_total(db)
+        estimated = total is not None
+    if count != "none" and total is None:
+        total = query.count()
+
+    query = query.order_by(asset_rank.desc(), CryptoAsset.id.desc())
+    if cursor:
+        query = query.filter(tuple_(asset_rank, CryptoAsset.id) < tuple_(*decode_cursor(cursor)))
+    else:
+        query = query.offset((page - 1) * limit)
+
+    # One extra row tells us whether there is a next page
+    assets = query.limit(limit + 1).all()
+    next_cursor = encode_cursor(assets[limit - 1]) if len(assets) > limit else None
+    return assets[:limit], next_cursor, total, estimated
+
+ASSET_FIELDS = ("id", "symbol", "name", "price_usd", "market_cap", "source", "last_updated")
+
+def get_assets_by_symbols(
+    db: Session, symbols: Sequence[str], fields: Optional[Sequence[str]] = None
+) -> Tuple[Dict[str, dict], List[str]]:
+    """
+    Resolves many symbols, case-insensitively, in one query on
+    ix_crypto_assets_symbol_upper. Where several assets share a symbol the
+    one with the largest market cap wins, as on /data.
+
+    Returns ({requested symbol: asset fields}, unknown symbols), both in
+    request order; only `fields` are selected when given.
+    """
+    requested: Dict[str, str] = {}
+    for symbol in symbols:
+        symbol = symbol.strip()
+        if symbol:
+            requested.setdefault(symbol.upper(), symbol)
+    if not requested:
+        return {}, []
+
+    fields = [name for name in ASSET_FIELDS if name in set(fields)] if fields else list(ASSET_FIELDS)
+    key = func.upper(CryptoAsset.symbol)
+    stmt = (
+        select(key.label("key"), *(getattr(CryptoAsset, name) for name in fields))
+        .where(key == any_(bindparam("symbols", list(requested), type_=ARRAY(String))))
+        .distinct(key)
+        .order_by(key, asset_rank.desc(), CryptoAsset.id.desc())
+    )
+    found = {row.key: {name: getattr(row, name) for name in fields} for row in db.execute(stmt)}
+    data = {symbol: found[upper] for upper, symbol in requested.items() if upper in found}
+    unknown = [symbol for upper, symbol in requested.items() if upper not in found]
+    return data, unknown
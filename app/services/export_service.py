@@ -0,0 +1,230 @@
+"""
+GET /export: bulk export of crypto_assets, price history or a raw table as
+CSV, Arrow IPC stream or Parquet.
+
+Rows are read through a server-side cursor (yield_per) in chunks of
+EXPORT_CHUNK_ROWS and each chunk is encoded and handed to the response
+before the next is fetched, so memory stays flat however big the table is.
+Filters (source, symbol, updated_since / until) become WHERE clauses.
+"""
+import asyncio
+import csv
+import io
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Sequence
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import ARRAY, JSON, Boolean, DateTime, Float, Integer, String, Table, any_, bindparam, func, select
+
+from app.core import replicas
+from app.ingestion import connectors
+from app.models import AssetPriceHistory, CryptoAsset
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "10000"))
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+class InvalidExport(ValueError):
+    """Raised for an export request that can't be served; reported as 400."""
+
+@dataclass
+class Export:
+    media_type: str
+    filename: str
+    chunks: AsyncIterator[bytes]
+
+def _upper_symbols(symbols: Sequence[str]):
+    return bindparam("symbols", [s.strip().upper() for s in symbols], type_=ARRAY(String))
+
+def _query(dataset: str, sources: Sequence[str], symbols: Sequence[str], updated_since, until):
+    """(table, select statement) for a dataset and its filters."""
+    if dataset == "assets":
+        table, time_column = CryptoAsset.__table__, CryptoAsset.last_updated
+        stmt = select(table).order_by(CryptoAsset.id)
+        if sources:
+            stmt = stmt.where(CryptoAsset.source.in_(sources))
+        if symbols:
+            # Served by ix_crypto_assets_symbol_upper
+            stmt = stmt.where(func.upper(CryptoAsset.symbol) == any_(_upper_symbols(symbols)))
+    elif dataset == "history":
+        table, time_column = AssetPriceHistory.__table__, AssetPriceHistory.ts
+        stmt = select(table).order_by(AssetPriceHistory.asset_id, AssetPriceHistory.ts)
+        if sources:
+            stmt = stmt.where(AssetPriceHistory.source.in_(sources))
+        if symbols:
+            ids = select(CryptoAsset.id).where(func.upper(CryptoAsset.symbol) == any_(_upper_symbols(symbols)))
+            stmt = stmt.where(AssetPriceHistory.asset_id.in_(ids))
+    elif dataset == "raw":
+        if len(sources or ()) != 1:
+            raise InvalidExport("dataset=raw needs exactly one source")
+        connector = connectors.get_connector(sources[0])
+        if connector is None or connector.raw_model is None:
+            raise InvalidExport(f"Unknown source {sources[0]!r}")
+        model = connector.raw_model
+        table, time_column = model.__table__, model.ingested_at
+        stmt = select(table).order_by(model.id)
+        if symbols:
+            if "symbol" not in table.c:
+                raise InvalidExport(f"{table.name} has no symbol column")
+            stmt = stmt.where(func.upper(table.c.symbol) == any_(_upper_symbols(symbols)))
+    else:
+        raise InvalidExport(f"Unknown dataset {dataset!r}; use assets, history or raw")
+
+    if updated_since is not None:
+        stmt = stmt.where(time_column >= updated_since)
+    if until is not None:
+        stmt = stmt.where(time_column < until)
+    return table, stmt
+
+def _arrow_type(column):
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us", tz="UTC")
+    if isinstance(column.type, Float):
+        return pa.float64()
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, Boolean):
+        return pa.bool_()
+    # Strings, and JSON documents as their JSON text
+    return pa.string()
+
+def _json_columns(table: Table) -> List[int]:
+    return [i for i, column in enumerate(table.columns) if isinstance(column.type, JSON)]
+
+async def _stream(stmt, chunk_rows: int) -> AsyncIterator[list]:
+    """
+    Chunks of result rows from a server-side cursor, on a read replica when
+    one is healthy. The session is opened here rather than taken from the
+    route's dependency, which is closed before a streamed body is sent.
+    """
+    async with replicas.router.session() as db:
+        result = await db.stream(stmt.execution_options(yield_per=chunk_rows))
+        async for partition in result.partitions():
+            yield partition
+
+class _CSVEncoder:
+    def __init__(self, table: Table):
+        self.json_columns = _json_columns(table)
+        self.buf = io.StringIO()
+        self.writer = csv.writer(self.buf)
+        self.writer.writerow(table.columns.keys())
+
+    def _take(self) -> bytes:
+        data = self.buf.getvalue().encode()
+        self.buf.seek(0)
+        self.buf.truncate()
+        return data
+
+    def start(self) -> bytes:
+        return self._take()
+
+    def encode(self, rows: list) -> bytes:
+        for row in rows:
+            values = list(row)
+            for i in self.json_columns:
+                values[i] = json.dumps(values[i]) if values[i] is not None else None
+            self.writer.writerow([value.isoformat() if isinstance(value, datetime) else value for value in values])
+        return self._take()
+
+    def finish(self) -> bytes:
+        return b""
+
+class _Drain(io.RawIOBase):
+    """Write-only file for pyarrow writers; take() returns what was written since the last call."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+class _ColumnarEncoder:
+    """Arrow IPC stream (one record batch per chunk) or Parquet (one row group per chunk)."""
+
+    def __init__(self, table: Table, fmt: str):
+        self.fmt = fmt
+        self.schema = pa.schema([(column.name, _arrow_type(column)) for column in table.columns])
+        self.json_columns = _json_columns(table)
+        self.sink = _Drain()
+        self.writer = None
+
+    def start(self) -> bytes:
+        if self.fmt == "arrow":
+            self.writer = pa.ipc.new_stream(self.sink, self.schema)
+        else:
+            self.writer = pq.ParquetWriter(self.sink, self.schema)
+        return self.sink.take()
+
+    def encode(self, rows: list) -> bytes:
+        columns = [list(values) for values in zip(*rows)]
+        for i in self.json_columns:
+            columns[i] = [json.dumps(value) if value is not None else None for value in columns[i]]
+        batch = pa.record_batch(
+            [pa.array(values, type=field.type) for values, field in zip(columns, self.schema)], schema=self.schema
+        )
+        if self.fmt == "arrow":
+            self.writer.write_batch(batch)
+        else:
+            self.writer.write_table(pa.Table.from_batches([batch]))
+        return self.sink.take()
+
+    def finish(self) -> bytes:
+        self.writer.close()
+        return self.sink.take()
+
+async def _encode(stmt, encoder, chunk_rows: int) -> AsyncIterator[bytes]:
+    yield encoder.start()
+    chunks = _stream(stmt, chunk_rows)
+    try:
+        async for rows in chunks:
+            # Encoding a chunk is CPU work; keep it off the event loop
+            yield await asyncio.to_thread(encoder.encode, rows)
+    finally:
+        # Closes the cursor and session as soon as the client goes away
+        await chunks.aclose()
+    tail = encoder.finish()
+    if tail:
+        yield tail
+
+def export(
+    dataset: str = "assets",
+    fmt: str = "csv",
+    sources: Optional[Sequence[str]] = None,
+    symbols: Optional[Sequence[str]] = None,
+    updated_since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    chunk_rows: Optional[int] = None,
+) -> Export:
+    """
+    Validates the request and returns the lazily encoded export; the
+    database is only read as the chunks are consumed, so errors surface
+    here, before the response has started.
+    """
+    if fmt not in FORMATS:
+        raise InvalidExport(f"Unknown format {fmt!r}; use csv, arrow or parquet")
+    table, stmt = _query(dataset, sources or [], symbols or [], updated_since, until)
+    encoder = _CSVEncoder(table) if fmt == "csv" else _ColumnarEncoder(table, fmt)
+    media_type, extension = FORMATS[fmt]
+    return Export(media_type, f"{table.name}.{extension}", _encode(stmt, encoder, chunk_rows or EXPORT_CHUNK_ROWS))
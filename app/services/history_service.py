@@ -0,0 +1,121 @@
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Buckets are aligned to this origin, a Monday at midnight UTC, so daily
+# buckets start at midnight and weekly ones on Mondays
+HISTORY_ORIGIN = datetime(2000, 1, 3, tzinfo=timezone.utc)
+HISTORY_MAX_BUCKETS = int(os.getenv("HISTORY_MAX_BUCKETS", "10000"))
+INTERVAL_UNITS = {"m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+_INTERVAL_RE = re.compile(r"^(\d+)([mhdw])$")
+
+class InvalidHistoryQuery(ValueError):
+    pass
+
+# Bucket timestamps are rendered as ISO 8601 UTC strings in SQL: parsing
+# thousands of timestamptz values back into datetimes costs more than the query.
+
+# Intervals of whole hours are answered from the hourly rollup, so a year
+# is ~8.8k rows per asset instead of ~525k minute-level points
+_ROLLUP_QUERY = text("""
+    SELECT to_char(ts AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS"Z"'), open, high, low, close, samples
+    FROM (
+        SELECT date_bin(:step, bucket, :origin) AS ts,
+               (array_agg(open ORDER BY bucket))[1] AS open,
+               max(high) AS high,
+               min(low) AS low,
+               (array_agg(close ORDER BY bucket DESC))[1] AS close,
+               sum(samples)::int AS samples
+        FROM asset_price_hourly
+        WHERE asset_id = :asset_id AND bucket >= :start AND bucket < :end
+        GROUP BY 1
+    ) buckets
+    ORDER BY buckets.ts
+""")
+
+# Hourly buckets are the rollup rows themselves
+_HOURLY_QUERY = text("""
+    SELECT to_char(bucket AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS"Z"') AS ts, open, high, low, close, samples
+    FROM asset_price_hourly
+    WHERE asset_id = :asset_id AND bucket >= :start AND bucket < :end
+    ORDER BY bucket
+""")
+
+_RAW_QUERY = text("""
+    SELECT to_char(ts AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS"Z"'), open, high, low, close, samples
+    FROM (
+        SELECT date_bin(:step, ts, :origin) AS ts,
+               (array_agg(price_usd ORDER BY ts))[1] AS open,
+               max(price_usd) AS high,
+               min(price_usd) AS low,
+               (array_agg(price_usd ORDER BY ts DESC))[1] AS close,
+               count(*)::int AS samples
+        FROM asset_price_history
+        WHERE asset_id = :asset_id AND ts >= :start AND ts < :end
+        GROUP BY 1
+    ) buckets
+    ORDER BY buckets.ts
+""")
+
+def parse_interval(interval: str) -> timedelta:
+    """'15m', '1h', '4h', '1d', '1w' -> timedelta."""
+    match = _INTERVAL_RE.match(interval or "")
+    if not match or int(match.group(1)) == 0:
+        raise InvalidHistoryQuery(f"Invalid interval {interval!r}; use e.g. 5m, 1h, 1d or 1w")
+    return timedelta(seconds=int(match.group(1)) * INTERVAL_UNITS[match.group(2)])
+
+def _utc(ts: datetime) -> datetime:
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+
+def align(ts: datetime, step: timedelta, up: bool = False) -> datetime:
+    """Rounds `ts` down (or up) to a bucket boundary."""
+    buckets, remainder = divmod(ts - HISTORY_ORIGIN, step)
+    if up and remainder:
+        buckets += 1
+    return HISTORY_ORIGIN + buckets * step
+
+def get_history(
+    db: Session,
+    symbol: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    interval: str = "1h"
+) -> dict:
+    """
+    OHLC buckets of `symbol`'s price between start and end, computed in SQL.
+    start/end are widened to whole buckets; naive datetimes are UTC.
+    Defaults to the last 7 days.
+    """
+    step = parse_interval(interval)
+    end = _utc(end) if end else datetime.now(timezone.utc)
+    start = _utc(start) if start else end - timedelta(days=7)
+    if start >= end:
+        raise InvalidHistoryQuery("start must be before end")
+    start, end = align(start, step), align(end, step, up=True)
+    if (end - start) / step > HISTORY_MAX_BUCKETS:
+        raise InvalidHistoryQuery(f"More than {HISTORY_MAX_BUCKETS} buckets requested; use a larger interval")
+
+    if step == timedelta(hours=1):
+        query = _HOURLY_QUERY
+    elif step % timedelta(hours=1) == timedelta(0):
+        query = _ROLLUP_QUERY
+    else:
+        query = _RAW_QUERY
+    rows = db.execute(
+        query,
+        {"step": step, "origin": HISTORY_ORIGIN, "asset_id": symbol.upper(), "start": start, "end": end}
+    ).all()
+    return {
+        "symbol": symbol.upper(),
+        "interval": interval,
+        "start": start,
+        "end": end,
+        "buckets": [
+            {"ts": ts, "open": open_, "high": high, "low": low, "close": close, "samples": samples}
+            for ts, open_, high, low, close, samples in rows
+        ],
+    }
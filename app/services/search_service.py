@@ -0,0 +1,338 @@
+"""
+GET /search: prefix and fuzzy lookup of assets by symbol, name or id.
+
+SearchIndex keeps every asset in memory in /data order (market cap desc,
+then id), so an asset's position is also its rank:
+
+* prefix matches come from a sorted array of lower-cased keys (symbol, id,
+  name and each word of the name) searched with bisect;
+* fuzzy matches (queries of 3+ characters) use pg_trgm-style trigrams and
+  similarity (shared / union), counting only the posting lists of the
+  query's trigrams.
+
+Exact symbol/id matches rank first, then prefix matches, both by market
+cap; fuzzy matches fill the remaining slots by similarity, then market cap.
+
+The index is rebuilt in the background on the first search after an ETL
+load commits (see invalidate), or after SEARCH_INDEX_TTL_SECONDS. Above
+SEARCH_INDEX_MAX_ASSETS assets, with SEARCH_BACKEND=pg_trgm, or while a
+process's first index is still being built, searches run in Postgres
+against trigram GIN indexes instead.
+"""
+import bisect
+import logging
+import math
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.models import CryptoAsset, asset_rank
+from app.services.data_service import estimate_total
+
+logger = logging.getLogger(__name__)
+
+# memory, pg_trgm, or auto (memory unless there are more than SEARCH_INDEX_MAX_ASSETS assets)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+SEARCH_INDEX_MAX_ASSETS = int(os.getenv("SEARCH_INDEX_MAX_ASSETS", "500000"))
+SEARCH_INDEX_TTL_SECONDS = float(os.getenv("SEARCH_INDEX_TTL_SECONDS", "60"))
+# pg_trgm's default similarity threshold
+SEARCH_FUZZY_THRESHOLD = float(os.getenv("SEARCH_FUZZY_THRESHOLD", "0.3"))
+
+_WORD = re.compile(r"[a-z0-9]+")
+# Sorts after any character a key can contain, so [q, q + _MAX) is the prefix range of q
+_MAX = "\U0010ffff"
+
+class InvalidSearch(ValueError):
+    """Raised for a query with nothing to search for."""
+
+class SearchUnavailable(Exception):
+    """Raised while the first index is being built and Postgres can't search (no pg_trgm); reported as 503."""
+
+def trigrams(value: str) -> Set[str]:
+    """pg_trgm's trigrams: each alphanumeric word padded with two spaces in front and one behind."""
+    grams = set()
+    for word in _WORD.findall(value.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def _result(asset: tuple, match: str, score: float) -> dict:
+    asset_id, symbol, name, market_cap = asset
+    return {"id": asset_id, "symbol": symbol, "name": name, "market_cap": market_cap, "match": match, "score": round(score, 3)}
+
+class SearchIndex:
+    """
+    Immutable once built. Posting lists and key positions are numpy arrays,
+    so a lookup's counting and top-k selection run vectorized.
+    """
+
+    def __init__(self, assets: List[tuple] = ()):
+        """`assets` are (id, symbol, name, market_cap) tuples in rank order."""
+        self.assets = list(assets)
+        self.built_at = time.monotonic()
+        self.generation = 0
+
+        pairs = []
+        exact: Dict[str, List[int]] = {}
+        # Trigram documents: one per distinct symbol and name, pointing back at the asset
+        doc_assets: List[int] = []
+        doc_sizes: List[int] = []
+        postings: Dict[str, List[int]] = {}
+        self._keys_per_asset = 1
+        for position, (asset_id, symbol, name, _) in enumerate(self.assets):
+            symbol, asset_id, name = (symbol or "").lower(), asset_id.lower(), (name or "").lower()
+            exact.setdefault(symbol, []).append(position)
+            if asset_id != symbol:
+                exact.setdefault(asset_id, []).append(position)
+            keys = {symbol, asset_id, name, *_WORD.findall(name)}
+            keys.discard("")
+            self._keys_per_asset = max(self._keys_per_asset, len(keys))
+            pairs.extend((key, position) for key in keys)
+            for field in {symbol, name}:
+                grams = trigrams(field)
+                if not grams:
+                    continue
+                doc = len(doc_assets)
+                doc_assets.append(position)
+                doc_sizes.append(len(grams))
+                for gram in grams:
+                    postings.setdefault(gram, []).append(doc)
+        exact.pop("", None)
+
+        pairs.sort()
+        self._keys = [key for key, _ in pairs]
+        self._positions = np.fromiter((position for _, position in pairs), dtype=np.int32, count=len(pairs))
+        self._exact = exact
+        self._doc_assets = np.array(doc_assets, dtype=np.int32)
+        self._doc_sizes = np.array(doc_sizes, dtype=np.int32)
+        self._postings = {gram: np.array(docs, dtype=np.int32) for gram, docs in postings.items()}
+
+    def __len__(self):
+        return len(self.assets)
+
+    def prefix(self, q: str, limit: int) -> List[int]:
+        """Positions (ranks) of the best `limit` assets with a key starting with q, best first."""
+        lo = bisect.bisect_left(self._keys, q)
+        hi = bisect.bisect_left(self._keys, q + _MAX, lo)
+        window = self._positions[lo:hi]
+        # Each asset appears at most _keys_per_asset times, so this many smallest entries hold `limit` assets
+        depth = limit * self._keys_per_asset
+        if len(window) > depth:
+            window = np.partition(window, depth - 1)[:depth]
+        return np.unique(window)[:limit].tolist()
+
+    def fuzzy(self, q: str, limit: int, exclude: Set[int] = frozenset(), threshold: float = None) -> List[Tuple[int, float]]:
+        """
+        The best `limit` (position, similarity) pairs, by similarity then
+        rank, whose symbol or name is at least `threshold` similar to q.
+        """
+        threshold = SEARCH_FUZZY_THRESHOLD if threshold is None else threshold
+        grams = trigrams(q)
+        docs = [self._postings[gram] for gram in grams if gram in self._postings]
+        if not docs:
+            return []
+        shared = np.bincount(np.concatenate(docs), minlength=len(self._doc_sizes))
+        # similarity <= shared / len(grams), so fewer shared trigrams can't reach the threshold
+        needed = max(1, math.ceil(threshold * len(grams) - 1e-9))
+        candidates = np.flatnonzero(shared >= needed)
+        counts = shared[candidates]
+        similarity = counts / (len(grams) + self._doc_sizes[candidates] - counts)
+        keep = similarity >= threshold
+        candidates, similarity = candidates[keep], similarity[keep]
+        positions = self._doc_assets[candidates]
+
+        results, seen = [], set(exclude)
+        for i in np.lexsort((positions, -similarity)):
+            position = int(positions[i])
+            if position in seen:
+                continue
+            seen.add(position)
+            results.append((position, float(similarity[i])))
+            if len(results) >= limit:
+                break
+        return results
+
+    def search(self, q: str, limit: int = 10) -> List[dict]:
+        q = q.strip().lower()
+        if not q:
+            raise InvalidSearch("Query must not be empty")
+        exact = self._exact.get(q, [])
+        results = [_result(self.assets[position], "exact", 1.0) for position in exact[:limit]]
+        seen = set(exact)
+
+        for position in self.prefix(q, limit + len(exact)):
+            if len(results) >= limit:
+                return results
+            if position not in seen:
+                seen.add(position)
+                results.append(_result(self.assets[position], "prefix", 1.0))
+
+        if len(results) < limit and len(q) >= 3:
+            for position, similarity in self.fuzzy(q, limit - len(results), exclude=seen):
+                results.append(_result(self.assets[position], "fuzzy", similarity))
+        return results
+
+def load_assets(db: Session) -> List[tuple]:
+    rows = (
+        db.query(CryptoAsset.id, CryptoAsset.symbol, CryptoAsset.name, CryptoAsset.market_cap)
+        .order_by(asset_rank.desc(), CryptoAsset.id.desc())
+        .all()
+    )
+    return [tuple(row) for row in rows]
+
+class SearchIndexHolder:
+    """
+    The process's current SearchIndex. A stale index keeps serving while a
+    background thread rebuilds it from the primary. Searches run on the
+    event loop thread, so nothing is ever built inline: until the first
+    build finishes there is no index to serve.
+    """
+
+    def __init__(self, ttl: float = None):
+        self.ttl = SEARCH_INDEX_TTL_SECONDS if ttl is None else ttl
+        self.index: Optional[SearchIndex] = None
+        self.use_database = False
+        self.generation = 0
+        self._built: Optional[Tuple[int, float]] = None  # (generation, monotonic time) of the last build
+        self._refresh: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Marks the index stale; called after each ETL load commit."""
+        with self._lock:
+            self.generation += 1
+
+    def _stale(self) -> bool:
+        built = self._built
+        return built is None or built[0] != self.generation or time.monotonic() - built[1] > self.ttl
+
+    def _build(self, db: Session):
+        generation = self.generation
+        estimated = estimate_total(db)
+        use_database = SEARCH_BACKEND == "pg_trgm" or (
+            SEARCH_BACKEND == "auto" and _trgm_ready and estimated is not None and estimated > SEARCH_INDEX_MAX_ASSETS
+        )
+        index = None if use_database else SearchIndex(load_assets(db))
+        with self._lock:
+            self.index, self.use_database = index, use_database
+            self._built = (generation, time.monotonic())
+
+    def _refresh_in_background(self):
+        try:
+            with SessionLocal() as db:
+                self._build(db)
+        except Exception as e:
+            logger.error(f"Search index rebuild failed: {e}")
+        finally:
+            with self._lock:
+                self._refresh = None
+
+    def warm(self) -> threading.Thread:
+        """Starts a background rebuild unless one is already running."""
+        with self._lock:
+            if self._refresh is None:
+                self._refresh = threading.Thread(target=self._refresh_in_background, name="search-index", daemon=True)
+                self._refresh.start()
+            return self._refresh
+
+    def join(self, timeout: float = None):
+        refresh = self._refresh
+        if refresh is not None:
+            refresh.join(timeout)
+
+    def get(self) -> Optional[SearchIndex]:
+        """The index to search; None when searches should go to Postgres or none is built yet."""
+        if self._stale():
+            self.warm()
+        return self.index
+
+    def clear(self):
+        with self._lock:
+            self.index, self.use_database, self._built = None, False, None
+
+search_index = SearchIndexHolder()
+# Set by ensure_trgm_indexes; the auto backend only falls back to Postgres when it worked
+_trgm_ready = False
+
+def search_database(db: Session, q: str, limit: int = 10) -> List[dict]:
+    """The same ranking computed by Postgres, using pg_trgm (see ensure_trgm_indexes)."""
+    q = q.strip().lower()
+    if not q:
+        raise InvalidSearch("Query must not be empty")
+    prefix_match = (
+        "lower(symbol) LIKE :prefix OR lower(id) LIKE :prefix OR lower(name) LIKE :prefix OR lower(name) LIKE :word"
+    )
+    rows = db.execute(
+        text(
+            f"""
+            SELECT * FROM (
+                SELECT id, symbol, name, market_cap,
+                       CASE WHEN lower(symbol) = :q OR lower(id) = :q THEN 0
+                            WHEN {prefix_match} THEN 1
+                            ELSE 2 END AS tier,
+                       greatest(similarity(lower(symbol), :q), similarity(lower(name), :q)) AS similarity
+                FROM crypto_assets
+                WHERE {prefix_match} OR lower(symbol) % :q OR lower(name) % :q
+            ) matches
+            ORDER BY tier, CASE WHEN tier = 2 THEN similarity ELSE 1 END DESC,
+                     coalesce(market_cap, '-Infinity'::float8) DESC, id DESC
+            LIMIT :limit
+            """
+        ),
+        {"q": q, "prefix": _like_prefix(q), "word": "% " + _like_prefix(q), "limit": limit},
+    ).all()
+    return [
+        {
+            "id": row.id, "symbol": row.symbol, "name": row.name, "market_cap": row.market_cap,
+            "match": ("exact", "prefix", "fuzzy")[row.tier],
+            "score": round(row.similarity, 3) if row.tier == 2 else 1.0,
+        }
+        for row in rows
+    ]
+
+def _like_prefix(q: str) -> str:
+    return q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def ensure_trgm_indexes(bind) -> bool:
+    """
+    Creates pg_trgm and trigram GIN indexes on lower(symbol) / lower(name)
+    for the Postgres search backend. Returns False, leaving searches in
+    memory, when the extension can't be installed.
+    """
+    global _trgm_ready
+    if SEARCH_BACKEND == "memory":
+        return False
+    try:
+        with bind.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_crypto_assets_symbol_trgm ON crypto_assets USING gin (lower(symbol) gin_trgm_ops)"
+            ))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_crypto_assets_name_trgm ON crypto_assets USING gin (lower(name) gin_trgm_ops)"
+            ))
+    except Exception as e:
+        log = logger.error if SEARCH_BACKEND == "pg_trgm" else logger.info
+        log(f"pg_trgm search indexes unavailable, searching in memory only: {e}")
+        return False
+    _trgm_ready = True
+    return True
+
+def search(db: Session, q: str, limit: int = 10) -> dict:
+    """
+    Runs a search against the in-memory index, or Postgres for very large
+    asset sets and while the first index is being built.
+    """
+    index = search_index.get()
+    if index is None:
+        if not (search_index.use_database or _trgm_ready):
+            raise SearchUnavailable("Search index is still being built")
+        return {"query": q, "backend": "pg_trgm", "results": search_database(db, q, limit)}
+    return {"query": q, "backend": "memory", "results": index.search(q, limit)}
@@ -1,6 +1,15 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, defer
+from sqlalchemy.pool import NullPool
 from app.models import ETLStatus, ETLCheckpoint
 from app.schemas.schemas import ETLStatsResponse, CheckpointStats
+from app.core.resilience import circuit_breakers, CircuitBreaker
+from app.core.cache import response_cache
+from app.core import metrics
+from app.core.database import engine, async_engine
+from app.ingestion import drift, profiling, retention
+
+# Numeric encoding of breaker states for the circuit_breaker_state gauge
+CIRCUIT_STATE_VALUES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
 
 def get_etl_stats(db: Session) -> ETLStatsResponse:
     # Get last run status
@@ -32,38 +41,134 @@ def get_etl_stats(db: Session) -> ETLStatsResponse:
         checkpoints=checkpoint_stats
     )
 
-def generate_prometheus_metrics(db: Session) -> str:
-    """Generates Prometheus metrics text."""
-    metrics = []
-    
-    # ETL Status
+def load_etl_metrics(db: Session):
+    """
+    Seeds the ETL gauges from the database at startup; afterwards the loader
+    keeps them current, so scrapes never query Postgres.
+    """
     last_run = db.query(ETLStatus).order_by(ETLStatus.last_run.desc()).first()
-    status_val = 1 if last_run and last_run.status == "success" else 0
-    metrics.append(f'etl_last_run_status {status_val}')
-    
-    if last_run and last_run.duration_seconds:
-        metrics.append(f'etl_last_run_duration_seconds {last_run.duration_seconds}')
+    if last_run:
+        metrics.ETL_LAST_RUN_STATUS.set(1 if last_run.status == "success" else 0)
+        if last_run.duration_seconds:
+            metrics.ETL_LAST_RUN_DURATION.set(last_run.duration_seconds)
+    for cp in db.query(ETLCheckpoint).all():
+        metrics.ETL_RECORDS_PROCESSED.set(cp.records_processed, source=cp.source)
+    last_drift = db.query(ETLStatus.drift).filter(ETLStatus.drift.isnot(None)).order_by(ETLStatus.id.desc()).first()
+    for source, report in (last_drift.drift if last_drift else {}).items():
+        for kind in drift.ISSUE_KINDS:
+            metrics.ETL_DRIFT_ISSUES.set(len(report.get(kind) or {}), source=source, kind=kind)
 
-    # Checkpoints
-    checkpoints = db.query(ETLCheckpoint).all()
-    for cp in checkpoints:
-        metrics.append(f'etl_records_processed{{source="{cp.source}"}} {cp.records_processed}')
-        
-    return "\n".join(metrics)
+def _circuit_breaker_metrics():
+    # 0 = closed, 1 = half-open, 2 = open
+    for name, breaker in sorted(circuit_breakers().items()):
+        yield "circuit_breaker_state", "gauge", "Upstream circuit breaker state.", {"source": name}, CIRCUIT_STATE_VALUES[breaker.state]
+        yield "circuit_breaker_consecutive_failures", "gauge", "Consecutive upstream failures.", {"source": name}, breaker.failures
+
+def _response_cache_metrics():
+    # Response cache for /data, /stats and /health
+    cache = response_cache.stats()
+    for endpoint in sorted(set(cache["hits"]) | set(cache["misses"])):
+        yield "response_cache_hits_total", "counter", "Response cache hits.", {"endpoint": endpoint}, cache["hits"].get(endpoint, 0)
+        yield "response_cache_misses_total", "counter", "Response cache misses.", {"endpoint": endpoint}, cache["misses"].get(endpoint, 0)
+    yield "response_cache_evictions_total", "counter", "Response cache evictions.", {}, cache["evictions"]
+    yield "response_cache_entries", "gauge", "Cached responses.", {}, cache["entries"]
+    yield "response_cache_bytes", "gauge", "Size of cached response bodies.", {}, cache["bytes"]
+    yield "response_cache_generation", "gauge", "Response cache generation.", {}, cache["generation"]
+
+def _retention_metrics():
+    # Raw-table retention since process start
+    pruned = retention.stats()
+    for source, totals in sorted(pruned["reclaimed"].items()):
+        labels = {"source": source}
+        yield "raw_retention_rows_deleted_total", "counter", "Raw rows deleted by retention.", labels, totals["rows"]
+        yield "raw_retention_bytes_reclaimed_total", "counter", "Bytes reclaimed by retention.", labels, totals["bytes"]
+        yield "raw_retention_rows_archived_total", "counter", "Raw rows archived before deletion.", labels, totals["archived"]
+    if pruned["last_run"] is not None:
+        yield "raw_retention_last_run_timestamp_seconds", "gauge", "Last retention run.", {}, round(pruned["last_run"])
+
+def _db_pool_metrics():
+    for name, pool in (("sync", engine.pool), ("async", async_engine.pool)):
+        if isinstance(pool, NullPool):
+            continue
+        labels = {"engine": name}
+        yield "db_pool_size", "gauge", "Configured DB pool size.", labels, pool.size()
+        yield "db_pool_checked_out", "gauge", "DB connections in use.", labels, pool.checkedout()
+        yield "db_pool_checked_in", "gauge", "Idle DB connections in the pool.", labels, pool.checkedin()
+        yield "db_pool_overflow", "gauge", "DB connections above pool_size.", labels, max(pool.overflow(), 0)
+
+metrics.REGISTRY.collector(_circuit_breaker_metrics, modes={"circuit_breaker_state": "max", "circuit_breaker_consecutive_failures": "max"})
+metrics.REGISTRY.collector(_response_cache_metrics, modes={"response_cache_generation": "max"})
+metrics.REGISTRY.collector(_retention_metrics, modes={"raw_retention_last_run_timestamp_seconds": "max"})
+metrics.REGISTRY.collector(_db_pool_metrics)
+
+def generate_prometheus_metrics() -> str:
+    """Prometheus metrics text, from memory only (merged across workers if configured)."""
+    return metrics.render()
 
 def get_past_runs(db: Session, limit: int):
-    """Returns a list of past ETL runs."""
-    runs = db.query(ETLStatus).order_by(ETLStatus.last_run.desc()).limit(limit).all()
+    """Returns a list of past ETL runs (without their profiles and drift reports, see get_run_profile and get_run_drift)."""
+    runs = db.query(ETLStatus).options(defer(ETLStatus.profile), defer(ETLStatus.drift)).order_by(ETLStatus.last_run.desc()).limit(limit).all()
     return runs
 
+def _find_run(db: Session, run_id: str):
+    """A status row by numeric id, or the latest profiled row of an ETL run id."""
+    if run_id.isdigit():
+        return db.query(ETLStatus).filter(ETLStatus.id == int(run_id)).first()
+    return (
+        db.query(ETLStatus)
+        .filter(ETLStatus.run_id == run_id, ETLStatus.profile.isnot(None))
+        .order_by(ETLStatus.id.desc())
+        .first()
+    )
+
+def get_run_profile(db: Session, run_id: str):
+    """The span profile of a run, plus its per-stage totals; None if unknown or unprofiled."""
+    run = _find_run(db, run_id)
+    if not run or not run.profile:
+        return None
+    return {
+        "id": run.id,
+        "run_id": run.run_id,
+        "status": run.status,
+        "duration_seconds": run.duration_seconds,
+        "stages": profiling.stage_totals(run.profile),
+        "profile": run.profile,
+    }
+
+def get_run_drift(db: Session, run_id: str):
+    """The schema drift report of each source in a run; None if unknown or not profiled."""
+    run = _find_run(db, run_id)
+    if not run or not run.drift:
+        return None
+    return {"id": run.id, "run_id": run.run_id, "status": run.status, "sources": run.drift}
+
+def _diff_metrics(first: dict, second: dict) -> dict:
+    """run_1 - run_2 for each profiled metric; a side missing the span counts as zero."""
+    first, second = first or {}, second or {}
+    return {
+        "run_1": first or None,
+        "run_2": second or None,
+        **{
+            f"{key}_diff": round((first.get(key) or 0) - (second.get(key) or 0), 6)
+            for key in ("wall_seconds", "cpu_seconds", "rows", "bytes", "db_round_trips")
+        },
+    }
+
+def _span_metrics(span: dict) -> dict:
+    return {key: span[key] for key in ("wall_seconds", "cpu_seconds", "rows", "bytes", "db_round_trips", "calls")}
+
 def compare_runs(db: Session, run_id_1: int, run_id_2: int):
-    """Compares two runs."""
+    """Compares two runs, in total and stage by stage where both were profiled."""
     run1 = db.query(ETLStatus).filter(ETLStatus.id == run_id_1).first()
     run2 = db.query(ETLStatus).filter(ETLStatus.id == run_id_2).first()
     
     if not run1 or not run2:
         return {"error": "One or both run IDs not found"}
-        
+
+    stages1, stages2 = profiling.stage_totals(run1.profile), profiling.stage_totals(run2.profile)
+    spans1 = {path: _span_metrics(span) for path, span in profiling.flatten(run1.profile).items()}
+    spans2 = {path: _span_metrics(span) for path, span in profiling.flatten(run2.profile).items()}
+
     return {
         "run_1": {
             "id": run1.id,
@@ -79,5 +184,15 @@ def compare_runs(db: Session, run_id_1: int, run_id_2: int):
         },
         "diff": {
             "duration_diff": (run1.duration_seconds or 0) - (run2.duration_seconds or 0)
-        }
+        },
+        # Summed over sources, e.g. "merge"
+        "stages": {
+            stage: _diff_metrics(stages1.get(stage), stages2.get(stage))
+            for stage in sorted(set(stages1) | set(stages2))
+        },
+        # Every span, e.g. "coingecko/merge/upsert"
+        "spans": {
+            path: _diff_metrics(spans1.get(path), spans2.get(path))
+            for path in sorted(set(spans1) | set(spans2))
+        },
     }
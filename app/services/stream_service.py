@@ -0,0 +1,231 @@
+"""
+Push channel for price changes: GET /stream/prices (Server-Sent Events).
+
+load_unified_data NOTIFYs the rows it wrote on loader.PRICE_CHANNEL, which
+Postgres delivers on commit to every listening connection, so each uvicorn
+worker runs one LISTEN connection (PriceHub.listen) and fans the changes
+out to its own subscribers.
+
+Subscribers can pick symbols; each gets the changes as one SSE "prices"
+event per commit. A subscriber buffers at most PRICE_STREAM_QUEUE_SIZE
+undelivered events. When a slow client lets that fill up,
+PRICE_STREAM_DROP_POLICY decides: "drop_oldest" discards the oldest event
+and tells the client how many changes it missed (event "dropped", so it can
+resync with POST /data/batch), "disconnect" ends its stream instead.
+
+The same connection listens on any channel registered with on_notify,
+e.g. the response cache's invalidation channel.
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+import asyncpg
+from sqlalchemy.engine import make_url
+
+from app.core import metrics
+from app.core.database import DATABASE_URL
+from app.ingestion.loader import PRICE_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+PRICE_STREAM_ENABLED = os.getenv("PRICE_STREAM_ENABLED", "true") == "true"
+PRICE_STREAM_QUEUE_SIZE = int(os.getenv("PRICE_STREAM_QUEUE_SIZE", "64"))
+PRICE_STREAM_DROP_POLICY = os.getenv("PRICE_STREAM_DROP_POLICY", "drop_oldest")
+PRICE_STREAM_HEARTBEAT_SECONDS = float(os.getenv("PRICE_STREAM_HEARTBEAT_SECONDS", "15"))
+
+# Reconnect delays for the LISTEN connection
+_BACKOFF = (1, 2, 5, 10, 30)
+
+class Event:
+    """One SSE event, encoded once however many subscribers it goes to."""
+    __slots__ = ("deltas", "_encoded")
+
+    def __init__(self, deltas: List[dict]):
+        self.deltas = deltas
+        self._encoded: Optional[bytes] = None
+
+    def encode(self) -> bytes:
+        if self._encoded is None:
+            self._encoded = b"event: prices\ndata: " + json.dumps(self.deltas, separators=(",", ":")).encode() + b"\n\n"
+        return self._encoded
+
+class Subscriber:
+    __slots__ = ("symbols", "events", "dropped", "closed", "wakeup", "max_events", "policy")
+
+    def __init__(self, symbols: Optional[Set[str]], max_events: int, policy: str):
+        self.symbols = symbols  # upper-cased; None for every asset
+        self.events: deque = deque()
+        self.dropped = 0
+        self.closed = False
+        self.wakeup = asyncio.Event()
+        self.max_events = max_events
+        self.policy = policy
+
+    def push(self, event: Event):
+        if self.closed:
+            return
+        if len(self.events) >= self.max_events:
+            if self.policy == "disconnect":
+                # The queued events and this one are never delivered
+                lost = sum(len(queued.deltas) for queued in self.events) + len(event.deltas)
+                self.closed = True
+                self.events.clear()
+            else:
+                lost = len(self.events.popleft().deltas)
+                self.dropped += lost
+            metrics.STREAM_DROPPED.inc(lost, policy=self.policy)
+        if not self.closed:
+            self.events.append(event)
+        self.wakeup.set()
+
+class PriceHub:
+    def __init__(self, max_events: int = None, policy: str = None):
+        self.max_events = PRICE_STREAM_QUEUE_SIZE if max_events is None else max_events
+        self.policy = policy or PRICE_STREAM_DROP_POLICY
+        self._everything: Set[Subscriber] = set()
+        self._by_symbol: Dict[str, Set[Subscriber]] = {}
+        # Last published (price, market cap) per asset, so rewrites of unchanged rows are not pushed
+        self._last: Dict[str, tuple] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._channels: Dict[str, Callable[[str], None]] = {}
+        self.subscribers = 0
+
+    def on_notify(self, channel: str, callback: Callable[[str], None]):
+        """Also LISTENs on `channel` and calls `callback(payload)` for each notification."""
+        self._channels[channel] = callback
+
+    def subscribe(self, symbols: Iterable[str] = None) -> Subscriber:
+        wanted = {symbol.strip().upper() for symbol in symbols or () if symbol.strip()} or None
+        subscriber = Subscriber(wanted, self.max_events, self.policy)
+        if wanted is None:
+            self._everything.add(subscriber)
+        else:
+            for symbol in wanted:
+                self._by_symbol.setdefault(symbol, set()).add(subscriber)
+        self.subscribers += 1
+        metrics.STREAM_SUBSCRIBERS.inc()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        if subscriber.symbols is None:
+            self._everything.discard(subscriber)
+        else:
+            for symbol in subscriber.symbols:
+                subscribers = self._by_symbol.get(symbol)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._by_symbol[symbol]
+        self.subscribers -= 1
+        metrics.STREAM_SUBSCRIBERS.dec()
+
+    def publish(self, ts: str, rows: List[list]):
+        """Fans out one NOTIFY payload's rows ([id, symbol, price_usd, market_cap]) that actually changed."""
+        deltas = []
+        for asset_id, symbol, price_usd, market_cap in rows:
+            if self._last.get(asset_id) == (price_usd, market_cap):
+                continue
+            self._last[asset_id] = (price_usd, market_cap)
+            deltas.append({"id": asset_id, "symbol": symbol, "price_usd": price_usd, "market_cap": market_cap, "last_updated": ts})
+        if not deltas:
+            return
+        metrics.STREAM_DELTAS.inc(len(deltas))
+
+        if self._everything:
+            event = Event(deltas)
+            for subscriber in self._everything:
+                subscriber.push(event)
+        if self._by_symbol:
+            pending: Dict[Subscriber, List[dict]] = {}
+            for delta in deltas:
+                for subscriber in self._by_symbol.get((delta["symbol"] or "").upper(), ()):
+                    pending.setdefault(subscriber, []).append(delta)
+            for subscriber, subscribed in pending.items():
+                subscriber.push(Event(subscribed))
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            message = json.loads(payload)
+            self.publish(message["ts"], message["rows"])
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring malformed {channel} notification: {e}")
+
+    def _on_channel_notify(self, connection, pid, channel, payload):
+        try:
+            self._channels[channel](payload)
+        except Exception as e:
+            logger.warning(f"{channel} notification handler failed: {e}")
+
+    async def listen(self, dsn: str = None):
+        """Holds a LISTEN connection for the life of the task, reconnecting after failures."""
+        dsn = dsn or make_url(DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        failures = 0
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                channels = list(self._channels)
+                for channel in channels:
+                    await connection.add_listener(channel, self._on_channel_notify)
+                if PRICE_STREAM_ENABLED:
+                    await connection.add_listener(PRICE_CHANNEL, self._on_notify)
+                    channels.append(PRICE_CHANNEL)
+                logger.info(f"Listening on {', '.join(channels)}")
+                failures = 0
+                # asyncpg delivers notifications through the callback; just watch the connection
+                while not connection.is_closed():
+                    await asyncio.sleep(PRICE_STREAM_HEARTBEAT_SECONDS)
+                    await connection.execute("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                delay = _BACKOFF[min(failures, len(_BACKOFF) - 1)]
+                failures += 1
+                logger.warning(f"Price change listener failed ({e}); reconnecting in {delay}s")
+                await asyncio.sleep(delay)
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+
+    def start(self):
+        """Starts the listener on the running event loop (app startup)."""
+        if (PRICE_STREAM_ENABLED or self._channels) and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def events(self, subscriber: Subscriber, heartbeat: float = None):
+        """The subscriber's SSE stream; unsubscribes when the client goes away."""
+        heartbeat = PRICE_STREAM_HEARTBEAT_SECONDS if heartbeat is None else heartbeat
+        try:
+            yield f"retry: 3000\n: subscribed to {','.join(sorted(subscriber.symbols or ['*']))}\n\n".encode()
+            while True:
+                try:
+                    await asyncio.wait_for(subscriber.wakeup.wait(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                subscriber.wakeup.clear()
+                if subscriber.closed:
+                    yield b'event: overflow\ndata: {"reason":"client too slow"}\n\n'
+                    return
+                if subscriber.dropped:
+                    yield f'event: dropped\ndata: {{"dropped":{subscriber.dropped}}}\n\n'.encode()
+                    subscriber.dropped = 0
+                while subscriber.events:
+                    yield subscriber.events.popleft().encode()
+        finally:
+            self.unsubscribe(subscriber)
+
+price_hub = PriceHub()
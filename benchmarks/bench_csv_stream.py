@@ -0,0 +1,80 @@
+"""
+Streams a large synthetic CSV through the CSV connector and reports peak RSS
+as the run progresses; with streaming it should stay flat.
+
+    python -m benchmarks.bench_csv_stream --rows 5000000
+    python -m benchmarks.bench_csv_stream --rows 5000000 --load   # + raw/unified load
+
+--load writes through the real loaders against DATABASE_URL inside a
+transaction that is rolled back at the end.
+"""
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+from app.ingestion.connectors import CSVConnector
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def write_synthetic_csv(path: str, rows: int):
+    with open(path, "w") as f:
+        f.write("symbol,name,price_usd,market_cap,extra\n")
+        for i in range(rows):
+            f.write(f"SYM{i},Synthetic Asset {i},{1 + i % 1000}.25,{i * 10.5},ignored-column\n")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--path", help="Existing CSV to stream instead of a synthetic one")
+    parser.add_argument("--load", action="store_true", help="Also land raw rows and upsert unified rows")
+    args = parser.parse_args()
+
+    path = args.path
+    if not path:
+        path = os.path.join(tempfile.mkdtemp(), "synthetic.csv")
+        start = time.perf_counter()
+        write_synthetic_csv(path, args.rows)
+        print(f"Wrote {args.rows} rows ({os.path.getsize(path) / 2**20:.0f} MiB) in {time.perf_counter() - start:.1f}s")
+
+    connector = CSVConnector(path)
+    baseline = peak_rss_mb()
+    print(f"Peak RSS before streaming: {baseline:.0f} MiB")
+
+    db = outer = conn = None
+    if args.load:
+        from sqlalchemy.orm import Session
+        from app.core.database import engine, Base
+        from app.ingestion import runner
+
+        Base.metadata.create_all(bind=engine)
+        conn = engine.connect()
+        outer = conn.begin()
+        db = Session(bind=conn, join_transaction_mode="create_savepoint")
+
+    start = time.perf_counter()
+    rows = 0
+    try:
+        if args.load:
+            records, _ = runner._stream_source(db, connector, connector.open_stream(), "bench", {"csv": 10})
+            rows = records
+        else:
+            for i, batch in enumerate(connector.open_stream(), start=1):
+                rows += len(connector.transform(batch))
+                if i % 10 == 0:
+                    print(f"  {rows:>9} rows  peak RSS {peak_rss_mb():.0f} MiB")
+    finally:
+        if db is not None:
+            db.close()
+            outer.rollback()
+            conn.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Streamed {rows} rows in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s)")
+    print(f"Peak RSS after streaming: {peak_rss_mb():.0f} MiB (+{peak_rss_mb() - baseline:.0f} MiB)")
+
+if __name__ == "__main__":
+    main()
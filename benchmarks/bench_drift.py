@@ -0,0 +1,63 @@
+"""
+Time to profile a batch for schema drift and check it against a baseline.
+
+Items are shaped like CoinPaprika tickers (top-level fields plus the
+nested quotes.USD object), with some null fields and, with --drift, string
+prices and a misspelt key in the last tenth of the batch.
+
+    python -m benchmarks.bench_drift --items 10000
+"""
+import argparse
+import logging
+import random
+import statistics
+import time
+
+from app.ingestion import drift
+
+def ticker(i: int, drifted: bool) -> dict:
+    usd = {
+        "price": str(i) if drifted else random.random() * 1000,
+        "volume_24h": random.random() * 1e9,
+        "volume_24h_change_24h": None if i % 7 == 0 else 0.5,
+        "market_cap": i * 1e6,
+        "market_cap_change_24h": 0.1,
+        **{f"percent_change_{period}": 0.1 for period in ("15m", "30m", "1h", "6h", "12h", "24h", "7d", "30d")},
+        "percent_change_1y": None if i % 5 else 0.1,
+        "ath_price": 1000.0,
+        "ath_date": "2024-03-14T07:10:36Z",
+        "percent_from_price_ath": -10.0,
+    }
+    if drifted:
+        usd["prcie"] = usd.pop("volume_24h")
+    return {
+        "id": f"coin-{i}", "name": f"Coin {i}", "symbol": f"C{i}", "rank": i,
+        "circulating_supply": i * 1000.0, "total_supply": i * 1000, "max_supply": None if i % 3 else i * 2000,
+        "beta_value": 0.9, "first_data_at": "2010-07-17T00:00:00Z", "last_updated": "2025-01-01T00:00:00Z",
+        "quotes": {"USD": usd},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--drift", action="store_true", help="Drift the last tenth of the batch")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    baseline = drift.SchemaProfile()
+    baseline.add([ticker(i, False) for i in range(args.items)])
+    baseline = baseline.summary()
+    items = [ticker(i, args.drift and i >= args.items * 0.9) for i in range(args.items)]
+
+    samples = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        report = drift.detect_drift("coinpaprika", items, baseline)
+        samples.append((time.perf_counter() - start) * 1000)
+    findings = {kind: len(report[kind]) for kind in drift.ISSUE_KINDS if report[kind]}
+    print(f"{args.items} items, {len(report['fields'])} fields: "
+          f"median {statistics.median(samples):.1f} ms, min {min(samples):.1f} ms; findings {findings or 'none'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Times SearchIndex builds and lookups over synthetic assets, in memory.
+
+    python -m benchmarks.bench_search --assets 50000
+
+Reports p50/p99 per query kind; the target is a p99 under 2 ms at 50k assets.
+"""
+import argparse
+import random
+import statistics
+import string
+import time
+
+from app.services.search_service import SearchIndex
+
+WORDS = ["bitcoin", "ether", "token", "chain", "swap", "finance", "protocol", "network", "coin", "dao", "labs", "gold"]
+
+def synthetic_assets(count: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    assets = []
+    for i in range(count):
+        symbol = "".join(rng.choices(string.ascii_uppercase, k=rng.randint(2, 5))) + str(i % 97)
+        name = " ".join(rng.choices(WORDS, k=rng.randint(1, 3))).title() + f" {i}"
+        assets.append((f"asset-{i}", symbol, name, rng.random() * 1e10 if i % 10 else None))
+    assets.sort(key=lambda a: (a[3] if a[3] is not None else float("-inf"), a[0]), reverse=True)
+    return assets
+
+def percentiles(samples: list) -> str:
+    ordered = sorted(samples)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    return f"p50 {statistics.median(ordered):.3f} ms  p99 {p99:.3f} ms"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    assets = synthetic_assets(args.assets)
+    start = time.perf_counter()
+    index = SearchIndex(assets)
+    print(f"Built index over {len(index)} assets in {time.perf_counter() - start:.2f}s")
+
+    rng = random.Random(11)
+    kinds = {
+        "exact": lambda: rng.choice(assets)[1],
+        "prefix": lambda: rng.choice(assets)[1][:2],
+        "word prefix": lambda: rng.choice(WORDS)[:rng.randint(1, 4)],
+        # One dropped letter, as in "protcol"
+        "fuzzy": lambda: (lambda w, i: w[:i] + w[i + 1:])(rng.choice(WORDS[:8]), rng.randint(1, 4)),
+    }
+    for kind, make_query in kinds.items():
+        samples = []
+        for _ in range(args.queries):
+            q = make_query()
+            start = time.perf_counter()
+            index.search(q, limit=10)
+            samples.append((time.perf_counter() - start) * 1000)
+        print(f"{kind:>12}: {percentiles(samples)}")
+
+if __name__ == "__main__":
+    main()
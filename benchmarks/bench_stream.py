@@ -0,0 +1,53 @@
+"""
+Memory and fan-out cost of idle /stream/prices subscribers in one process.
+
+Opens `--subscribers` event streams on a PriceHub (a quarter of them
+subscribed to a few symbols, the rest to everything), then publishes one
+ETL commit's worth of changes and times the fan-out and the delivery.
+
+    python -m benchmarks.bench_stream --subscribers 10000 --changes 1000
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from app.services.stream_service import PriceHub
+
+async def run(subscribers: int, changes: int):
+    hub = PriceHub()
+    tracemalloc.start()
+    streams = []
+    for i in range(subscribers):
+        symbols = [f"SYM{(i * 7 + k) % changes}" for k in range(3)] if i % 4 == 0 else None
+        stream = hub.events(hub.subscribe(symbols))
+        await stream.__anext__()
+        streams.append(stream)
+    # Park each stream on its wakeup event, as an idle connection would be
+    waiters = [asyncio.ensure_future(stream.__anext__()) for stream in streams]
+    await asyncio.sleep(0)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{subscribers} idle subscribers: {current / subscribers / 1024:.2f} KiB each")
+
+    rows = [[f"asset-{i}", f"SYM{i}", 1.0 + i, None] for i in range(changes)]
+    start = time.perf_counter()
+    hub.publish("2025-01-01T00:00:00+00:00", rows)
+    fan_out = time.perf_counter() - start
+    start = time.perf_counter()
+    await asyncio.gather(*waiters)
+    delivered = time.perf_counter() - start
+    print(f"Fan-out of {changes} changes: {fan_out * 1000:.1f} ms, delivery to all streams: {delivered * 1000:.1f} ms")
+
+    for stream in streams:
+        await stream.aclose()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=10_000)
+    parser.add_argument("--changes", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(run(args.subscribers, args.changes))
+
+if __name__ == "__main__":
+    main()
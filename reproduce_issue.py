@@ -1,7 +1,7 @@
 import sys
 import os
 sys.path.append(os.getcwd())
-from app.ingestion import transformer
+from app.ingestion import transformer, connectors
 from app.schemas.schemas import CryptoAssetCreate
 
 def test_reproduction_duplicates():
@@ -38,7 +38,10 @@ def test_reproduction_duplicates():
     unified_csv = transformer.transform_csv_data(csv_data)
     
     # Combine (new logic)
-    all_unified = transformer.unify_assets(unified_paprika, unified_gecko, unified_csv)
+    all_unified = transformer.unify_assets(
+        {"coinpaprika": unified_paprika, "coingecko": unified_gecko, "csv": unified_csv},
+        connectors.priorities()
+    )
     
     print(f"Total records: {len(all_unified)}")
     for asset in all_unified:
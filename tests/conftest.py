@@ -1,10 +1,17 @@
+import os
+
+# TestClient runs each request on a fresh event loop, and asyncpg
+# connections cannot move between loops, so don't pool them in tests
+os.environ.setdefault("DB_POOL_DISABLED", "true")
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.main import app
 from app.core.database import Base, get_db
-import os
+from app.core.cache import response_cache
+from app.services.search_service import search_index
 
 # Use a separate test database or the same one (be careful!)
 # For simplicity in this setup, we'll use the same DB but we should ideally use a test one.
@@ -37,3 +44,11 @@ def client(db_session):
     app.dependency_overrides[get_db] = override_get_db
     with TestClient(app) as c:
         yield c
+
+@pytest.fixture(autouse=True)
+def fresh_response_cache():
+    # Tests write to the DB directly rather than through run_etl, so start
+    # every test with nothing cached
+    response_cache.bump_generation()
+    search_index.invalidate()
+    yield
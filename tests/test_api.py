@@ -53,3 +53,44 @@ def test_get_data_filter(db_session):
     data = response.json()
     assert len(data["data"]) == 1
     assert data["data"][0]["symbol"] == "BTC"
+
+def _seed_ranked(db_session):
+    db_session.query(CryptoAsset).delete()
+    db_session.commit()
+    caps = {"a": 300, "b": 200, "c": 200, "d": None, "e": 100}
+    for asset_id, cap in caps.items():
+        db_session.add(CryptoAsset(id=asset_id, symbol=asset_id.upper(), name=asset_id, price_usd=1, market_cap=cap, source="test"))
+    db_session.commit()
+
+def test_get_data_cursor_walk(db_session):
+    _seed_ranked(db_session)
+
+    seen, cursor = [], None
+    while True:
+        url = "/data?limit=2" + (f"&cursor={cursor}" if cursor else "")
+        body = client.get(url, headers={"X-API-Key": "test-key"}).json()
+        seen += [asset["id"] for asset in body["data"]]
+        cursor = body["pagination"]["next_cursor"]
+        if cursor is None:
+            break
+
+    # market cap desc, ties by id desc, unknown caps last
+    assert seen == ["a", "c", "b", "e", "d"]
+
+    # page/limit callers get the same order
+    page_2 = client.get("/data?page=2&limit=2", headers={"X-API-Key": "test-key"}).json()
+    assert [asset["id"] for asset in page_2["data"]] == ["b", "e"]
+    assert page_2["pagination"]["total"] == 5
+
+def test_get_data_count_modes(db_session):
+    _seed_ranked(db_session)
+
+    body = client.get("/data?count=none", headers={"X-API-Key": "test-key"}).json()
+    assert body["pagination"]["total"] is None
+
+    body = client.get("/data?count=estimate", headers={"X-API-Key": "test-key"}).json()
+    assert body["pagination"]["total"] is not None
+
+def test_get_data_invalid_cursor(db_session):
+    response = client.get("/data?cursor=not-a-cursor", headers={"X-API-Key": "test-key"})
+    assert response.status_code == 400
@@ -0,0 +1,59 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.main import app
+from app.models import CryptoAsset
+from app.services import data_service
+
+client = TestClient(app)
+HEADERS = {"X-API-Key": "test-key"}
+
+def _seed(db_session):
+    db_session.query(CryptoAsset).filter(CryptoAsset.id.like("batch-%")).delete(synchronize_session=False)
+    db_session.add_all([
+        CryptoAsset(id="batch-aaa", symbol="BATCHA", name="Batch A", price_usd=1.5, market_cap=100.0, source="coingecko"),
+        CryptoAsset(id="batch-aaa-csv", symbol="batcha", name="Batch A (csv)", price_usd=1.4, market_cap=None, source="csv"),
+        CryptoAsset(id="batch-bbb", symbol="batchb", name="Batch B", price_usd=2.0, market_cap=50.0, source="csv"),
+    ])
+    db_session.commit()
+
+def _clear(db_session):
+    db_session.query(CryptoAsset).filter(CryptoAsset.id.like("batch-%")).delete(synchronize_session=False)
+    db_session.commit()
+
+def test_batch_lookup_is_case_insensitive(db_session):
+    _seed(db_session)
+    try:
+        response = client.post(
+            "/data/batch", json={"symbols": ["batcha", "BATCHB", "NOPE", "batchA"]}, headers=HEADERS
+        )
+        assert response.status_code == 200
+        body = response.json()
+        # Keyed by the symbol as requested; the bigger market cap wins a shared symbol
+        assert list(body["data"]) == ["batcha", "BATCHB"]
+        assert body["data"]["batcha"]["id"] == "batch-aaa"
+        assert body["data"]["BATCHB"]["price_usd"] == 2.0
+        assert set(body["data"]["batcha"]) == set(data_service.ASSET_FIELDS)
+        assert body["unknown"] == ["NOPE"]
+    finally:
+        _clear(db_session)
+
+def test_batch_field_projection(db_session):
+    _seed(db_session)
+    try:
+        body = client.post(
+            "/data/batch", json={"symbols": ["BATCHB"], "fields": ["price_usd", "symbol"]}, headers=HEADERS
+        ).json()
+        assert body["data"] == {"BATCHB": {"symbol": "batchb", "price_usd": 2.0}}
+        assert client.post("/data/batch", json={"symbols": ["X"], "fields": ["secret"]}, headers=HEADERS).status_code == 422
+        assert client.post("/data/batch", json={"symbols": []}, headers=HEADERS).status_code == 422
+    finally:
+        _clear(db_session)
+
+def test_batch_lookup_uses_the_symbol_index(db_session):
+    db_session.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = "\n".join(db_session.execute(text(
+        "EXPLAIN SELECT id FROM crypto_assets WHERE upper(symbol) = ANY(ARRAY['BTC', 'ETH'])"
+    )).scalars())
+    db_session.rollback()
+    assert "ix_crypto_assets_symbol_upper" in plan
@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.core.cache import CACHE_INVALIDATION_CHANNEL, ResponseCache, etag_matches, response_cache
+from app.ingestion import runner
+from app.main import app
+from app.services.stream_service import PriceHub
+
+client = TestClient(app)
+HEADERS = {"X-API-Key": "test-key"}
+
+def test_generation_bump_invalidates():
+    cache = ResponseCache(ttl=60)
+    builds = []
+    build = lambda: builds.append(1) or b'{"v":1}'
+
+    first, hit = cache.get_or_build("stats", (), build)
+    assert not hit
+    again, hit = cache.get_or_build("stats", (), build)
+    assert hit and again.etag == first.etag and len(builds) == 1
+
+    cache.bump_generation()
+    _, hit = cache.get_or_build("stats", (), build)
+    assert not hit and len(builds) == 2
+    assert cache.stats()["hits"] == {"stats": 1} and cache.stats()["misses"] == {"stats": 2}
+
+def test_ttl_expiry():
+    cache = ResponseCache(ttl=0.05)
+    cache.get_or_build("data", "k", lambda: b"{}")
+    time.sleep(0.06)
+    _, hit = cache.get_or_build("data", "k", lambda: b"{}")
+    assert not hit
+
+def test_lru_eviction_by_bytes():
+    cache = ResponseCache(ttl=60, max_bytes=25)
+    for key in "abc":
+        cache.get_or_build("data", key, lambda: b"x" * 10)
+    assert len(cache) == 2 and cache.bytes == 20 and cache.evictions == 1
+
+    # Touching "b" makes "c" the least recently used entry
+    cache.get_or_build("data", "b", lambda: b"x" * 10)
+    cache.get_or_build("data", "d", lambda: b"x" * 10)
+    _, hit = cache.get_or_build("data", "b", lambda: b"x" * 10)
+    assert hit
+    _, hit = cache.get_or_build("data", "c", lambda: b"x" * 10)
+    assert not hit
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc", "def"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches(None, '"abc"')
+    assert not etag_matches('"def"', '"abc"')
+
+def test_stats_endpoint_cached_with_conditional_get(db_session):
+    first = client.get("/stats", headers=HEADERS)
+    assert first.status_code == 200 and first.headers["X-Cache"] == "MISS"
+    assert first.headers["Cache-Control"].startswith("private")
+
+    second = client.get("/stats", headers=HEADERS)
+    assert second.headers["X-Cache"] == "HIT" and second.json() == first.json()
+
+    not_modified = client.get("/stats", headers={**HEADERS, "If-None-Match": first.headers["ETag"]})
+    assert not_modified.status_code == 304 and not_modified.content == b""
+
+    response_cache.bump_generation()
+    assert client.get("/stats", headers=HEADERS).headers["X-Cache"] == "MISS"
+
+def test_data_keys_on_query_params_and_keeps_per_request_metadata(db_session):
+    first = client.get("/data?limit=5", headers=HEADERS)
+    second = client.get("/data?limit=5", headers=HEADERS)
+    assert second.headers["X-Cache"] == "HIT"
+    assert first.json()["metadata"]["request_id"] != second.json()["metadata"]["request_id"]
+    assert first.headers["ETag"].startswith("W/") and first.headers["ETag"] == second.headers["ETag"]
+
+    assert client.get("/data?limit=6", headers=HEADERS).headers["X-Cache"] == "MISS"
+
+def test_cache_counters_in_metrics(db_session):
+    client.get("/health", headers=HEADERS)
+    client.get("/health", headers=HEADERS)
+    metrics = client.get("/metrics", headers=HEADERS).text
+    assert 'response_cache_hits_total{endpoint="health"}' in metrics
+    assert 'response_cache_misses_total{endpoint="health"}' in metrics
+
+def test_other_workers_commits_invalidate_the_cache(db_session):
+    async def scenario():
+        hub = PriceHub()
+        hub.on_notify(CACHE_INVALIDATION_CHANNEL, runner.on_published)
+        listener = asyncio.get_running_loop().create_task(hub.listen())
+        try:
+            await asyncio.sleep(0.5)
+            generation = response_cache.generation
+            # This process's own notice is skipped: _publish already bumped locally
+            await asyncio.to_thread(runner._publish, db_session)
+            await asyncio.sleep(0.3)
+            assert response_cache.generation == generation + 1
+            # Another worker's commit
+            db_session.execute(text("SELECT pg_notify(:channel, 'other-worker')"), {"channel": CACHE_INVALIDATION_CHANNEL})
+            await asyncio.to_thread(db_session.commit)
+            for _ in range(50):
+                if response_cache.generation == generation + 2:
+                    break
+                await asyncio.sleep(0.1)
+            assert response_cache.generation == generation + 2
+        finally:
+            listener.cancel()
+
+    asyncio.run(scenario())
@@ -0,0 +1,64 @@
+from app.ingestion import loader, runner
+from app.ingestion.change_tracker import ChangeTracker
+from app.models import CryptoAsset
+from app.schemas.schemas import CryptoAssetCreate
+
+def _asset(symbol, price, source="coingecko"):
+    return CryptoAssetCreate(id=symbol, symbol=symbol, name=symbol.title(), price_usd=price, market_cap=None, source=source)
+
+def test_partition_skips_unchanged_assets():
+    tracker = ChangeTracker(touch_interval=0)
+    first = [_asset("BTC", 1.0), _asset("ETH", 2.0, source="csv")]
+
+    to_write, counts = tracker.partition(first)
+    assert to_write == first
+    assert counts["coingecko"]["new"] == 1 and counts["csv"]["new"] == 1
+    tracker.commit(to_write)
+
+    second = [_asset("BTC", 1.5), _asset("ETH", 2.0, source="csv")]
+    to_write, counts = tracker.partition(second)
+    assert [a.symbol for a in to_write] == ["BTC"]
+    assert counts["coingecko"] == {"new": 0, "changed": 1, "unchanged": 0, "touched": 0}
+    assert counts["csv"] == {"new": 0, "changed": 0, "unchanged": 1, "touched": 0}
+
+def test_touch_interval_rewrites_stale_assets():
+    tracker = ChangeTracker(touch_interval=60)
+    assets = [_asset("BTC", 1.0)]
+    tracker.commit(assets, now=1000.0)
+
+    to_write, counts = tracker.partition(assets, now=1030.0)
+    assert to_write == [] and counts["coingecko"]["unchanged"] == 1
+
+    to_write, counts = tracker.partition(assets, now=1061.0)
+    assert to_write == assets and counts["coingecko"]["touched"] == 1
+
+def test_seed_from_crypto_assets(db_session):
+    db_session.query(CryptoAsset).filter(CryptoAsset.id.in_(["SEED1", "SEED2"])).delete(synchronize_session=False)
+    db_session.commit()
+    loader.load_unified_data(db_session, [_asset("SEED1", 3.0), _asset("SEED2", 4.0)])
+
+    tracker = ChangeTracker(touch_interval=3600)
+    tracker.seed(db_session)
+    to_write, _ = tracker.partition([_asset("SEED1", 3.0), _asset("SEED2", 5.0)])
+    assert [a.symbol for a in to_write] == ["SEED2"]
+
+    db_session.query(CryptoAsset).filter(CryptoAsset.id.in_(["SEED1", "SEED2"])).delete(synchronize_session=False)
+    db_session.commit()
+
+def test_rows_skipped_by_priority_are_not_recorded(db_session):
+    db_session.query(CryptoAsset).filter(CryptoAsset.id == "GUARD").delete(synchronize_session=False)
+    db_session.commit()
+    priorities = {"coingecko": 30, "csv": 10}
+    runner.change_tracker.clear()
+    try:
+        runner._load_unified(db_session, [_asset("GUARD", 1.0)], priorities)
+        changes = runner._load_unified(db_session, [_asset("GUARD", 2.0, source="csv")], priorities)
+        assert changes["csv"] == {"new": 0, "changed": 0, "unchanged": 0, "touched": 0, "skipped": 1}
+
+        # The tracker still matches crypto_assets, so the csv asset is retried next run
+        to_write, _ = runner.change_tracker.partition([_asset("GUARD", 1.0), _asset("GUARD", 2.0, source="csv")])
+        assert [a.source for a in to_write] == ["csv"]
+    finally:
+        runner.change_tracker.clear()
+        db_session.query(CryptoAsset).filter(CryptoAsset.id == "GUARD").delete(synchronize_session=False)
+        db_session.commit()
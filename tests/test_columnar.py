@@ -0,0 +1,94 @@
+import math
+
+import pytest
+
+from app.ingestion import columnar, loader, transformer
+from app.ingestion.change_tracker import ChangeTracker
+from app.models import CryptoAsset
+
+PAPRIKA = [
+    {"id": "btc-bitcoin", "symbol": "BTC", "name": "Bitcoin", "quotes": {"USD": {"price": 50000.5, "market_cap": 1e12}}},
+    {"id": "eth-ethereum", "symbol": "ETH", "name": "Ethereum", "quotes": {"USD": {"price": "3000", "market_cap": 0}}},
+    {"id": "zero-price", "symbol": "ZERO", "name": "Zero", "quotes": {"USD": {"price": 0}}},
+    {"id": "no-quotes", "symbol": "NOQ", "name": "No Quotes"},
+    {"id": "bad-price", "symbol": "BAD", "name": "Bad", "quotes": {"USD": {"price": "n/a"}}},
+    {"id": "no-symbol", "name": "No Symbol", "quotes": {"USD": {"price": 1.0}}},
+    {"id": "int-symbol", "symbol": 42, "name": "Int Symbol", "quotes": {"USD": {"price": 1.0}}},
+]
+
+GECKO = [
+    {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin", "current_price": 50001, "market_cap": 1e12},
+    {"id": "tether", "symbol": "usdt", "name": "Tether", "current_price": "1.0", "market_cap": None},
+    {"id": "null-price", "symbol": "np", "name": "Null Price", "current_price": None},
+    {"id": "neg-price", "symbol": "neg", "name": "Negative", "current_price": -1},
+    {"id": "no-symbol", "name": "No Symbol", "current_price": 2.0},
+    {"id": "bad-cap", "symbol": "bc", "name": "Bad Cap", "current_price": 2.0, "market_cap": "lots"},
+]
+
+CSV = [
+    {"symbol": "SOL", "name": "Solana", "price_usd": "150.5", "market_cap": "60000000000"},
+    {"symbol": "ADA", "name": "Cardano", "price_usd": "0.45", "market_cap": float("nan")},
+    {"symbol": "DOT", "name": "Polkadot", "price_usd": "7", "market_cap": ""},
+    {"symbol": "BAD", "name": "Bad", "price_usd": "abc", "market_cap": "1"},
+    {"symbol": float("nan"), "name": "No Symbol", "price_usd": "1", "market_cap": "1"},
+    {"symbol": "NOP", "name": "No Price", "price_usd": float("nan"), "market_cap": "1"},
+]
+
+def _normalize(asset):
+    if isinstance(asset, columnar.AssetRow):
+        row = {name: getattr(asset, name) for name in columnar.UNIFIED_COLUMNS}
+    else:
+        row = asset.model_dump() if hasattr(asset, "model_dump") else dict(asset)
+    if isinstance(row["market_cap"], float) and math.isnan(row["market_cap"]):
+        row["market_cap"] = None
+    row["price_usd"] = float(row["price_usd"])
+    return row
+
+@pytest.mark.parametrize("raw, rowwise, columnwise", [
+    (PAPRIKA, transformer.transform_coinpaprika_data, columnar.transform_coinpaprika),
+    (GECKO, transformer.transform_coingecko_data, columnar.transform_coingecko),
+    (CSV, transformer.transform_csv_data, columnar.transform_csv),
+])
+def test_columnar_matches_rowwise(raw, rowwise, columnwise):
+    expected = [_normalize(asset) for asset in rowwise(raw)]
+    batch = columnwise(raw)
+
+    assert [_normalize(row) for row in batch.rows()] == expected
+    assert [_normalize(asset) for asset in batch.assets()] == expected
+    assert [_normalize(record) for record in batch.records()] == expected
+    assert len(batch.rejects) == len(raw) - len(expected)
+
+def test_rejects_carry_reasons():
+    batch = columnar.transform_coingecko(GECKO)
+    reasons = dict(zip(batch.rejects["id"], batch.rejects["reason"]))
+    assert reasons == {
+        "null-price": "missing price_usd",
+        "neg-price": "price_usd must be > 0",
+        "no-symbol": "invalid symbol",
+        "bad-cap": "invalid market_cap",
+    }
+
+def test_columnar_rows_feed_bulk_loader(db_session):
+    ids = ["csv-sol", "csv-ada", "csv-dot"]
+    db_session.query(CryptoAsset).filter(CryptoAsset.id.in_(ids)).delete(synchronize_session=False)
+    db_session.commit()
+
+    counts, _ = loader.load_unified_data(db_session, columnar.transform_csv(CSV).rows())
+    assert counts["inserted"] == 3
+
+    stored = {a.id: a for a in db_session.query(CryptoAsset).filter(CryptoAsset.id.in_(ids))}
+    assert float(stored["csv-sol"].price_usd) == 150.5
+    assert stored["csv-ada"].market_cap is None
+
+    db_session.query(CryptoAsset).filter(CryptoAsset.id.in_(ids)).delete(synchronize_session=False)
+    db_session.commit()
+
+def test_records_flow_through_unify_and_tracker():
+    records = columnar.transform_coingecko(GECKO).records()
+    unified = transformer.unify_assets({"coingecko": records}, {"coingecko": 30})
+    assert sorted(asset.id for asset in unified) == ["BTC", "USDT"]
+
+    tracker = ChangeTracker(touch_interval=0)
+    to_write, counts = tracker.partition(unified)
+    assert len(to_write) == 2 and counts["coingecko"]["new"] == 2
+    assert loader._asset_row(to_write[0])["source"] == "coingecko"
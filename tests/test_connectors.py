@@ -0,0 +1,120 @@
+import logging
+import threading
+import time
+
+import pytest
+
+from app.core.http_client import NotModified
+from app.ingestion import connectors, drift, extractor, transformer
+from app.schemas.schemas import CryptoAssetCreate
+
+class DummyConnector(connectors.SourceConnector):
+    name = "dummy"
+    priority = 100
+    expected_keys = {"ticker", "usd"}
+
+    def fetch(self, validators=None):
+        return [{"ticker": "BTC", "usd": 1.0}]
+
+    def load_raw(self, db, data, run_id=None):
+        pass
+
+    def transform(self, data):
+        return [
+            CryptoAssetCreate(id=item["ticker"], symbol=item["ticker"], name=item["ticker"], price_usd=item["usd"], source=self.name)
+            for item in data
+        ]
+
+def test_builtin_connectors_ordered_by_priority():
+    names = [c.name for c in connectors.get_connectors()]
+    assert names == ["coingecko", "coinpaprika", "csv"]
+
+def test_incomplete_connector_is_rejected():
+    class NoTransform(connectors.SourceConnector):
+        name = "no_transform"
+
+        def fetch(self, validators=None):
+            return []
+
+        def load_raw(self, db, data, run_id=None):
+            pass
+
+    with pytest.raises(TypeError):
+        NoTransform()
+    with pytest.raises(TypeError):
+        connectors.register(object())
+    assert connectors.get_connector("no_transform") is None
+    # Non-streaming connectors get open_stream for free, as one batch
+    assert list(DummyConnector().open_stream()) == [[{"ticker": "BTC", "usd": 1.0}]]
+
+def test_registered_connector_drives_drift_and_unify(caplog):
+    connectors.register(DummyConnector())
+    try:
+        with caplog.at_level(logging.WARNING):
+            drift.detect_drift("dummy", [{"tickr": "BTC", "usd": 1.0}])
+        assert "Possible typo detected: 'tickr' might be 'ticker'" in caplog.text
+
+        dummy = connectors.get_connector("dummy")
+        gecko = transformer.transform_coingecko_data([
+            {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin", "current_price": 2.0, "market_cap": 1.0}
+        ])
+        unified = transformer.unify_assets(
+            {"coingecko": gecko, "dummy": dummy.transform(dummy.fetch())},
+            connectors.priorities()
+        )
+        assert len(unified) == 1
+        assert unified[0].source == "dummy"
+    finally:
+        connectors.unregister("dummy")
+
+def test_fetch_pages_bounded_concurrency():
+    in_flight = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def fetch_page(page):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight -= 1
+        return [{"page": page}]
+
+    data = extractor.fetch_pages(fetch_page, pages=8, concurrency=3)
+    assert [item["page"] for item in data] == list(range(1, 9))
+    assert peak == 3
+
+def test_coingecko_pagination(monkeypatch):
+    calls = []
+
+    def fake_page(page, per_page, validators=None):
+        calls.append((page, per_page))
+        return [{"id": f"coin-{page}-{i}"} for i in range(per_page)]
+
+    monkeypatch.setattr(extractor, "fetch_coingecko_page", fake_page)
+    data = extractor.fetch_coingecko_data(max_assets=600, page_concurrency=2)
+
+    assert sorted(calls) == [(1, 250), (2, 250), (3, 250)]
+    assert len(data) == 600
+    assert data[0]["id"] == "coin-1-0"
+    assert data[-1]["id"] == "coin-3-99"
+
+def test_csv_streams_globbed_files_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(extractor, "CSV_CHUNK_SIZE", 2)
+    (tmp_path / "a.csv").write_text("symbol,name,price_usd,market_cap,unused\nBTC,Bitcoin,1,2,x\nETH,Ether,3,,x\nSOL,Solana,4,5,x\n")
+    (tmp_path / "b.csv").write_text("symbol,name,price_usd,market_cap\nDOGE,Doge,0.1,7\n")
+    csv = connectors.CSVConnector(str(tmp_path / "*.csv"))
+
+    validators = {}
+    batches = list(csv.open_stream(validators))
+    assert [len(batch) for batch in batches] == [2, 1, 1]
+    assert set(batches[0][0]) == {"symbol", "name", "price_usd", "market_cap"}
+    assert [a.symbol for batch in batches for a in csv.transform(batch)] == ["BTC", "ETH", "SOL", "DOGE"]
+
+    # Unchanged files are skipped; all unchanged means not modified
+    with pytest.raises(NotModified):
+        csv.open_stream(validators)
+    (tmp_path / "c.csv").write_text("symbol,name,price_usd,market_cap\nADA,Cardano,0.5,1\n")
+    assert [item["symbol"] for batch in csv.open_stream(validators) for item in batch] == ["ADA"]
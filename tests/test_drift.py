@@ -0,0 +1,126 @@
+import logging
+
+from fastapi.testclient import TestClient
+
+from app.core import metrics
+from app.ingestion import connectors, drift, runner
+from app.ingestion.connectors import SourceConnector
+from app.main import app
+from app.models import CryptoAsset, ETLCheckpoint
+from app.schemas.schemas import CryptoAssetCreate
+
+client = TestClient(app)
+HEADERS = {"X-API-Key": "test-key"}
+
+def _paprika(i, price=1.0, market_cap=10.0):
+    return {
+        "id": f"coin-{i}", "name": f"Coin {i}", "symbol": f"C{i}", "rank": i,
+        "circulating_supply": 1.0, "total_supply": 1.0, "max_supply": None, "beta_value": 0.5,
+        "first_data_at": "2020-01-01", "last_updated": "2025-01-01",
+        "quotes": {"USD": {"price": price, "market_cap": market_cap}},
+    }
+
+def test_profile_covers_every_item_and_nested_paths():
+    profile = drift.SchemaProfile()
+    profile.add([_paprika(1), _paprika(2, market_cap=None)])
+    profile.add([{"id": "coin-3", "symbol": "C3", "quotes": {"USD": {"price": "3.0"}}}])
+    fields = profile.summary()["fields"]
+    assert profile.items == 3
+    assert fields["name"]["presence"] == 0.6667
+    assert fields["quotes.USD.price"]["types"] == ["number", "string"]
+    assert fields["quotes.USD.market_cap"] == {"presence": 0.6667, "null_rate": 0.5, "types": ["number"]}
+    assert "quotes.USD" in fields and fields["quotes.USD"]["types"] == ["object"]
+
+def test_drift_against_baseline(caplog):
+    baseline = drift.SchemaProfile()
+    baseline.add([_paprika(i) for i in range(100)])
+    # Only later items change: string prices, null caps and a misspelt nested key
+    batch = [_paprika(i) for i in range(50)]
+    batch += [_paprika(i, price=str(i), market_cap=None) for i in range(50, 90)]
+    batch += [{**_paprika(i), "quotes": {"USD": {"prcie": 1.0, "market_cap": 1.0}}} for i in range(90, 100)]
+
+    with caplog.at_level(logging.WARNING):
+        report = drift.detect_drift("coinpaprika", batch, baseline.summary())
+
+    assert report["drift"]
+    assert report["type_changes"]["quotes.USD.price"] == {"baseline": ["number"], "current": ["number", "string"]}
+    assert report["null_rate_changes"]["quotes.USD.market_cap"] == {"baseline": 0.0, "current": 0.4}
+    assert report["presence_changes"]["quotes.USD.price"] == {"baseline": 1.0, "current": 0.9}
+    assert report["new_fields"] == {"quotes.USD.prcie": 0.1}
+    assert report["typos"] == {"quotes.USD.prcie": "quotes.USD.price"}
+    assert "Possible typo detected: 'quotes.USD.prcie' might be 'quotes.USD.price'" in caplog.text
+    assert metrics.ETL_DRIFT_ISSUES.value(source="coinpaprika", kind="type_changes") == 1
+
+    # The same batch against itself is clean
+    clean = drift.detect_drift("coinpaprika", batch, drift.detect_drift("coinpaprika", batch))
+    assert not clean["drift"]
+    assert metrics.ETL_DRIFT_ISSUES.value(source="coinpaprika", kind="type_changes") == 0
+
+def test_typo_matches_are_cached():
+    drift._closest.cache_clear()
+    for _ in range(3):
+        drift.detect_drift("coinpaprika", [{"id": "btc", "symobl": "BTC", "name": "Bitcoin"}])
+    info = drift._closest.cache_info()
+    assert info.misses == 1 and info.hits == 2
+
+class DriftingConnector(SourceConnector):
+    name = "drift_src"
+    priority = 5
+    expected_keys = {"symbol", "price"}
+    batches = []
+
+    def fetch(self, validators=None):
+        return self.batches.pop(0)
+
+    def load_raw(self, db, data, run_id=None):
+        pass
+
+    def transform(self, data):
+        return [CryptoAssetCreate(id="DRIFTX", symbol="DRIFTX", name="Drift", price_usd=float(item["price"]), source=self.name) for item in data]
+
+def test_report_is_stored_with_the_run_and_baseline_persisted(db_session):
+    DriftingConnector.batches = [
+        [{"symbol": "DRIFTX", "price": 1.0}],
+        [{"symbol": "DRIFTX", "price": "2.0"}],
+        [{"symbol": "DRIFTX", "price": "3.0"}],
+        [{"symbol": "DRIFTX", "price": "4.0"}],
+    ]
+    connectors.register(DriftingConnector())
+
+    def meta():
+        db_session.expire_all()
+        return db_session.query(ETLCheckpoint).filter(ETLCheckpoint.source == "drift_src").one().meta_data
+
+    def report(run_id):
+        return client.get(f"/runs/{run_id}/drift", headers=HEADERS).json()["sources"]["drift_src"]
+
+    try:
+        first = runner.run_etl(sources=["drift_src"])
+        second = runner.run_etl(sources=["drift_src"])
+        # The drifted batch does not replace the baseline, so the drift is reported again
+        third = runner.run_etl(sources=["drift_src"])
+        gauge = metrics.ETL_DRIFT_ISSUES.value(source="drift_src", kind="type_changes")
+        stored = meta()
+        accepted = client.post("/drift/drift_src/accept", headers=HEADERS)
+        baseline = meta()["drift_baseline"]
+        fourth = runner.run_etl(sources=["drift_src"])
+    finally:
+        connectors.unregister("drift_src")
+        db_session.query(CryptoAsset).filter(CryptoAsset.id == "DRIFTX").delete()
+        db_session.query(ETLCheckpoint).filter(ETLCheckpoint.source == "drift_src").delete()
+        db_session.commit()
+        runner.change_tracker.clear()
+
+    assert stored["drift_baseline"]["fields"]["price"]["types"] == ["number"]
+    assert stored["drift_profile"]["fields"]["price"]["types"] == ["string"]
+    body = client.get(f"/runs/{first}/drift", headers=HEADERS).json()
+    assert body["status"] == "success"
+    assert not body["sources"]["drift_src"]["drift"]
+    for run_id in (second, third):
+        assert report(run_id)["type_changes"] == {"price": {"baseline": ["number"], "current": ["string"]}}
+    assert gauge == 1
+    assert accepted.status_code == 200
+    assert baseline["fields"]["price"]["types"] == ["string"]
+    assert not report(fourth)["drift"]
+    assert client.post("/drift/unknown_src/accept", headers=HEADERS).status_code == 404
+    assert client.get("/runs/does-not-exist/drift", headers=HEADERS).status_code == 404
@@ -0,0 +1,145 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi.testclient import TestClient
+
+from app.ingestion import loader
+from app.main import app
+from app.models import AssetPriceHistory, CryptoAsset, RawCSV
+from app.services import export_service
+
+client = TestClient(app)
+HEADERS = {"X-API-Key": "test-key"}
+T0 = datetime(2025, 4, 1, 12, 0, tzinfo=timezone.utc)
+
+def _seed(db_session):
+    _clear(db_session)
+    db_session.add_all([
+        CryptoAsset(id="export-a", symbol="EXPA", name="Export A", price_usd=1.5, market_cap=10.0, source="coingecko", last_updated=T0),
+        CryptoAsset(id="export-b", symbol="expb", name="Export, \"B\"", price_usd=2.0, market_cap=None, source="csv", last_updated=T0 + timedelta(days=1)),
+        CryptoAsset(id="export-c", symbol="EXPC", name="Export C", price_usd=3.0, market_cap=30.0, source="csv", last_updated=T0 + timedelta(days=2)),
+    ])
+    db_session.commit()
+
+def _clear(db_session):
+    db_session.query(AssetPriceHistory).filter(AssetPriceHistory.asset_id.like("export-%")).delete(synchronize_session=False)
+    db_session.query(CryptoAsset).filter(CryptoAsset.id.like("export-%")).delete(synchronize_session=False)
+    db_session.query(RawCSV).filter(RawCSV.run_id == "export-test").delete(synchronize_session=False)
+    db_session.commit()
+
+def _csv_rows(response):
+    return list(csv.DictReader(io.StringIO(response.text)))
+
+def test_csv_export_with_filters(db_session):
+    _seed(db_session)
+    try:
+        response = client.get("/export", params={"symbol": "expa,EXPB,expc", "source": "csv"}, headers=HEADERS)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert response.headers["content-disposition"] == 'attachment; filename="crypto_assets.csv"'
+        # Streamed without a length
+        assert "content-length" not in response.headers
+        rows = _csv_rows(response)
+        assert [row["id"] for row in rows] == ["export-b", "export-c"]
+        assert rows[0]["name"] == 'Export, "B"'
+        assert rows[0]["market_cap"] == ""
+        assert datetime.fromisoformat(rows[0]["last_updated"]) == T0 + timedelta(days=1)
+
+        since = (T0 + timedelta(days=1)).isoformat()
+        rows = _csv_rows(client.get("/export", params={"symbol": "EXPA,EXPB,EXPC", "updated_since": since}, headers=HEADERS))
+        assert [row["id"] for row in rows] == ["export-b", "export-c"]
+    finally:
+        _clear(db_session)
+
+def test_history_and_raw_exports(db_session):
+    _seed(db_session)
+    try:
+        for minutes, price in [(0, 1.0), (60, 1.1), (120, 1.2)]:
+            loader.load_price_history(db_session, [{"id": "export-a", "price_usd": price, "market_cap": None, "source": "coingecko"}], ts=T0 + timedelta(minutes=minutes))
+        db_session.add(RawCSV(symbol="EXPA", raw_data={"symbol": "EXPA", "price": "1.5"}, run_id="export-test"))
+        db_session.commit()
+
+        rows = _csv_rows(client.get("/export", params={
+            "dataset": "history", "symbol": "expa", "updated_since": T0.isoformat(), "until": (T0 + timedelta(minutes=120)).isoformat(),
+        }, headers=HEADERS))
+        assert [float(row["price_usd"]) for row in rows] == [1.0, 1.1]
+
+        response = client.get("/export", params={"dataset": "raw", "source": "csv", "symbol": "expa"}, headers=HEADERS)
+        assert response.headers["content-disposition"] == 'attachment; filename="raw_csv.csv"'
+        rows = [row for row in _csv_rows(response) if row["run_id"] == "export-test"]
+        assert json.loads(rows[0]["raw_data"]) == {"symbol": "EXPA", "price": "1.5"}
+    finally:
+        _clear(db_session)
+
+def test_invalid_exports_fail_before_streaming():
+    assert client.get("/export", params={"dataset": "raw"}, headers=HEADERS).status_code == 400
+    assert client.get("/export", params={"dataset": "raw", "source": "nope"}, headers=HEADERS).status_code == 400
+    assert client.get("/export", params={"dataset": "raw", "source": "coingecko", "symbol": "BTC"}, headers=HEADERS).status_code == 400
+    assert client.get("/export", params={"format": "xml"}, headers=HEADERS).status_code == 422
+
+def test_rows_are_encoded_chunk_by_chunk(db_session):
+    _seed(db_session)
+
+    async def collect():
+        export = export_service.export(symbols=["EXPA", "EXPB", "EXPC"], chunk_rows=1)
+        return [chunk async for chunk in export.chunks]
+
+    try:
+        chunks = asyncio.run(collect())
+        # The header, then one chunk per row
+        assert len(chunks) == 4
+        assert chunks[1].startswith(b"export-a,")
+    finally:
+        _clear(db_session)
+
+def test_columnar_formats(db_session):
+    _seed(db_session)
+    columns = ["id", "symbol", "name", "price_usd", "market_cap", "source", "last_updated"]
+    try:
+        for fmt in ("arrow", "parquet"):
+            response = client.get("/export", params={"format": fmt, "symbol": "EXPA,EXPB"}, headers=HEADERS)
+            assert response.status_code == 200
+            if fmt == "arrow":
+                assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+                table = pa.ipc.open_stream(response.content).read_all()
+            else:
+                assert response.headers["content-disposition"] == 'attachment; filename="crypto_assets.parquet"'
+                table = pq.read_table(pa.BufferReader(response.content))
+            assert table.num_rows == 2
+            assert table.column_names == columns
+            assert table.schema.field("price_usd").type == pa.float64()
+            assert table.column("id").to_pylist() == ["export-a", "export-b"]
+            assert table.column("market_cap").to_pylist() == [10.0, None]
+            assert table.column("last_updated").to_pylist() == [T0, T0 + timedelta(days=1)]
+    finally:
+        _clear(db_session)
+
+def test_columnar_chunks_and_json_columns(db_session):
+    _seed(db_session)
+    db_session.add(RawCSV(symbol="EXPA", raw_data={"symbol": "EXPA", "price": "1.5"}, run_id="export-test"))
+    db_session.commit()
+
+    async def collect(fmt, **filters):
+        export = export_service.export(fmt=fmt, chunk_rows=1, **filters)
+        return b"".join([chunk async for chunk in export.chunks])
+
+    try:
+        # One row group per chunk
+        body = asyncio.run(collect("parquet", symbols=["EXPA", "EXPB", "EXPC"]))
+        parquet = pq.ParquetFile(pa.BufferReader(body))
+        assert parquet.metadata.num_rows == 3
+        assert parquet.metadata.num_row_groups == 3
+
+        # JSON documents travel as their JSON text
+        body = asyncio.run(collect("arrow", dataset="raw", sources=["csv"], symbols=["EXPA"]))
+        table = pa.ipc.open_stream(body).read_all()
+        assert table.column_names == ["id", "symbol", "raw_data", "run_id", "ingested_at"]
+        rows = [row for row in table.to_pylist() if row["run_id"] == "export-test"]
+        assert json.loads(rows[0]["raw_data"]) == {"symbol": "EXPA", "price": "1.5"}
+    finally:
+        _clear(db_session)
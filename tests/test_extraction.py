@@ -0,0 +1,80 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from app.ingestion import extraction
+
+class SlowHandler(BaseHTTPRequestHandler):
+    """Answers /<delay_ms> with a JSON list after sleeping for delay_ms."""
+
+    def do_GET(self):
+        delay_ms = int(self.path.strip("/"))
+        time.sleep(delay_ms / 1000)
+        body = json.dumps([{"delay_ms": delay_ms}]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture(scope="module")
+def stub_servers():
+    """Three independent stub upstreams, one per source."""
+    servers = [ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler) for _ in range(3)]
+    for server in servers:
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield [f"http://127.0.0.1:{server.server_address[1]}" for server in servers]
+    for server in servers:
+        server.shutdown()
+
+def _fetcher(url):
+    def fetch():
+        response = requests.get(url, timeout=10)
+        response.raise_for_status()
+        return response.json()
+    return fetch
+
+def test_extraction_takes_max_not_sum(stub_servers):
+    latencies = [300, 500, 700]
+    fetchers = {
+        f"source{i}": _fetcher(f"{base}/{delay}")
+        for i, (base, delay) in enumerate(zip(stub_servers, latencies))
+    }
+
+    start = time.perf_counter()
+    results = list(extraction.extract_concurrently(fetchers))
+    elapsed = time.perf_counter() - start
+
+    assert all(result.ok for result in results)
+    # Completion order follows latency, so fast sources can be processed first
+    assert [result.source for result in results] == ["source0", "source1", "source2"]
+    assert results[0].data == [{"delay_ms": 300}]
+    assert results[0].duration_seconds < results[2].duration_seconds
+    assert 0.7 <= elapsed < sum(latencies) / 1000
+
+def test_extraction_deadline_and_errors(stub_servers):
+    def broken():
+        raise ValueError("upstream exploded")
+
+    fetchers = {
+        "fast": _fetcher(f"{stub_servers[0]}/50"),
+        "slow": _fetcher(f"{stub_servers[1]}/2000"),
+        "broken": broken,
+    }
+
+    start = time.perf_counter()
+    results = {r.source: r for r in extraction.extract_concurrently(fetchers, deadlines={"slow": 0.3})}
+    elapsed = time.perf_counter() - start
+
+    assert results["fast"].ok
+    assert results["slow"].timed_out and results["slow"].data == []
+    assert results["broken"].error == "upstream exploded"
+    assert elapsed < 1.0
@@ -0,0 +1,72 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.core import http_client
+from app.ingestion import connectors
+
+ETAG = '"v1"'
+
+class ETagHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    client_ports = set()
+
+    def do_GET(self):
+        ETagHandler.client_ports.add(self.client_address[1])
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps([{"id": "btc"}]).encode()
+        self.send_response(200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def etag_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ETagHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    ETagHandler.client_ports = set()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+
+def test_conditional_get_and_keep_alive(etag_server):
+    validators = {}
+    assert http_client.get_json(etag_server, "test", validators=validators) == [{"id": "btc"}]
+    assert validators == {"etag": ETAG}
+
+    with pytest.raises(http_client.NotModified):
+        http_client.get_json(etag_server, "test", validators=validators)
+
+    # Both requests reused one pooled connection
+    assert len(ETagHandler.client_ports) == 1
+
+def test_source_timeouts(monkeypatch):
+    monkeypatch.setenv("HTTP_COINGECKO_READ_TIMEOUT", "7")
+    assert http_client.source_timeout("coingecko") == (http_client.HTTP_CONNECT_TIMEOUT, 7.0)
+    assert http_client.source_timeout("coinpaprika") == (http_client.HTTP_CONNECT_TIMEOUT, http_client.HTTP_READ_TIMEOUT)
+
+def test_csv_not_modified(tmp_path):
+    path = tmp_path / "source.csv"
+    path.write_text("symbol,name,price_usd,market_cap\nBTC,Bitcoin,1,2\n")
+    csv = connectors.CSVConnector(str(path))
+    validators = {}
+    assert len(csv.fetch(validators)) == 1
+
+    with pytest.raises(http_client.NotModified):
+        csv.open_stream(validators)
+
+    path.write_text("symbol,name,price_usd,market_cap\nBTC,Bitcoin,1,2\nETH,Ethereum,1,2\n")
+    os.utime(path, ns=(0, validators[str(path)]["mtime_ns"] + 1))
+    assert len(csv.fetch(validators)) == 2
@@ -1,5 +1,10 @@
+from datetime import timedelta
+
+from sqlalchemy import func
+
 from app.ingestion import transformer, loader
-from app.models import ETLCheckpoint
+from app.models import ETLCheckpoint, CryptoAsset, RawCoinPaprika, RawCSV
+from app.schemas.schemas import CryptoAssetCreate
 
 def test_transform_coingecko_data():
     raw_data = [
@@ -28,3 +33,91 @@ def test_checkpoint_update(db_session):
     loader.update_checkpoint(db_session, "test_source", "failed", 0)
     db_session.refresh(cp)
     assert cp.status == "failed"
+
+def test_checkpoint_meta_is_merged(db_session):
+    loader.update_checkpoint(db_session, "test_meta", "success", 1, {"http_validators": {"etag": "abc"}})
+    loader.update_checkpoint(db_session, "test_meta", "success", 2, {"extract_seconds": 0.5})
+    assert loader.get_checkpoint_meta(db_session, "test_meta") == {
+        "http_validators": {"etag": "abc"},
+        "extract_seconds": 0.5
+    }
+    assert loader.get_checkpoint_meta(db_session, "missing_source") == {}
+
+def _assets(n, price=1.0):
+    return [
+        CryptoAssetCreate(id=f"BULK{i}", symbol=f"BULK{i}", name=f"Bulk {i}", price_usd=price, market_cap=None, source="test")
+        for i in range(n)
+    ]
+
+def test_bulk_upsert_counts(db_session):
+    db_session.query(CryptoAsset).filter(CryptoAsset.id.like("BULK%")).delete(synchronize_session=False)
+    db_session.commit()
+
+    counts, _ = loader.load_unified_data(db_session, _assets(5), batch_size=2)
+    assert counts == {"inserted": 5, "updated": 0, "skipped": 0}
+
+    counts, _ = loader.load_unified_data(db_session, _assets(7, price=2.0), batch_size=3)
+    assert counts == {"inserted": 2, "updated": 5, "skipped": 0}
+    assert db_session.query(CryptoAsset).filter(CryptoAsset.id.like("BULK%")).count() == 7
+    assert db_session.query(CryptoAsset).filter_by(id="BULK0").first().price_usd == 2.0
+
+    # The row-by-row fallback reports the same way
+    counts, _ = loader.load_unified_data(db_session, _assets(8, price=3.0), bulk=False)
+    assert counts == {"inserted": 1, "updated": 7, "skipped": 0}
+
+    db_session.query(CryptoAsset).filter(CryptoAsset.id.like("BULK%")).delete(synchronize_session=False)
+    db_session.commit()
+
+def test_raw_copy_landing(db_session):
+    run_id = "test-raw-copy"
+    items = [
+        {"id": "btc-bitcoin", "name": "Bit\tcoin \"quoted\" \\ slash", "quotes": {"USD": {"price": 1.5}}},
+        {"id": "eth-ethereum", "name": "Ether\num", "symbol": "ÉTH"},
+    ]
+    loader.load_raw_coinpaprika(db_session, items, run_id=run_id)
+    loader.load_raw_csv(db_session, [{"symbol": "A\tB", "name": "x", "market_cap": float("nan")}], run_id=run_id)
+
+    rows = db_session.query(RawCoinPaprika).filter_by(run_id=run_id).order_by(RawCoinPaprika.id).all()
+    assert [row.data for row in rows] == items
+
+    csv_row = db_session.query(RawCSV).filter_by(run_id=run_id).one()
+    assert csv_row.symbol == "A\tB"
+    assert csv_row.raw_data["market_cap"] is None
+
+    db_session.query(RawCoinPaprika).filter_by(run_id=run_id).delete()
+    db_session.query(RawCSV).filter_by(run_id=run_id).delete()
+    db_session.commit()
+
+def test_upsert_respects_source_priority(db_session):
+    priorities = {"high": 2, "low": 1}
+    db_session.query(CryptoAsset).filter(CryptoAsset.id == "PRIO").delete()
+    db_session.commit()
+
+    def asset(source, price):
+        return CryptoAssetCreate(id="PRIO", symbol="PRIO", name="Prio", price_usd=price, source=source)
+
+    loader.load_unified_data(db_session, [asset("high", 1.0)], priorities=priorities)
+    counts, written = loader.load_unified_data(db_session, [asset("low", 2.0)], priorities=priorities)
+    assert counts == {"inserted": 0, "updated": 0, "skipped": 1}
+    assert written == set()
+    row = db_session.query(CryptoAsset).filter_by(id="PRIO").first()
+    db_session.refresh(row)
+    assert (row.source, row.price_usd) == ("high", 1.0)
+
+    counts, written = loader.load_unified_data(db_session, [asset("high", 3.0)], priorities=priorities, bulk=False)
+    assert written == {"PRIO"}
+    assert counts["updated"] == 1
+
+    # Once the high-priority row goes stale, a lower-priority source takes it over
+    db_session.query(CryptoAsset).filter_by(id="PRIO").update(
+        {CryptoAsset.last_updated: func.now() - timedelta(seconds=loader.SOURCE_OWNERSHIP_SECONDS + 60)},
+        synchronize_session=False
+    )
+    db_session.commit()
+    counts, _ = loader.load_unified_data(db_session, [asset("low", 4.0)], priorities=priorities)
+    assert counts["updated"] == 1
+    db_session.refresh(row)
+    assert (row.source, row.price_usd) == ("low", 4.0)
+
+    db_session.delete(row)
+    db_session.commit()
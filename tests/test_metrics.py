@@ -0,0 +1,81 @@
+import json
+import os
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core import metrics
+from app.main import app
+
+client = TestClient(app)
+HEADERS = {"X-API-Key": "test-key"}
+
+# Not a live process (above the kernel's pid_max)
+DEAD_PID = 99999999
+
+def _worker(pid: int, jobs: int, busy: float, last: float, latency: float) -> tuple:
+    registry = metrics.Registry()
+    metrics.Counter("jobs_total", "Jobs.", registry=registry).inc(jobs, queue="a")
+    metrics.Gauge("busy", "Busy.", registry=registry).set(busy)
+    metrics.Gauge("last", "Last.", mode="latest", registry=registry).set(last)
+    metrics.Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0), registry=registry).observe(latency)
+    return pid, registry
+
+def test_histogram_exposition():
+    registry = metrics.Registry()
+    histogram = metrics.Histogram("op_seconds", "Op latency.", buckets=(0.1, 1.0), registry=registry)
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, op='say "hi"')
+    body = metrics.render(registry)
+    assert "# TYPE op_seconds histogram" in body
+    assert 'op_seconds_bucket{op="say \\"hi\\"",le="0.1"} 1' in body
+    assert 'op_seconds_bucket{op="say \\"hi\\"",le="1.0"} 3' in body
+    assert 'op_seconds_bucket{op="say \\"hi\\"",le="+Inf"} 4' in body
+    assert 'op_seconds_count{op="say \\"hi\\""} 4' in body
+    assert 'op_seconds_sum{op="say \\"hi\\""} 4.05' in body
+
+def test_multiprocess_snapshots_are_merged(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    _, local = _worker(os.getpid(), 1, 2, 10, 0.05)
+    # A live sibling worker and one that has exited since its last flush
+    for pid, registry in (_worker(os.getppid(), 2, 3, 20, 0.5), _worker(DEAD_PID, 4, 5, 30, 5.0)):
+        (tmp_path / f"{pid}.json").write_text(json.dumps(registry.snapshot()))
+        time.sleep(0.01)
+
+    body = metrics.render(local)
+    assert 'jobs_total{queue="a"} 7' in body
+    # Gauges of exited workers are dropped, unless the latest value wins
+    assert "busy 5" in body
+    assert "last 30" in body
+    assert 'latency_seconds_bucket{le="0.1"} 1' in body
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in body
+
+    metrics.write_snapshot(local)
+    assert json.loads((tmp_path / f"{os.getpid()}.json").read_text())["jobs_total"]["type"] == "counter"
+
+def test_requests_are_timed_per_route_template():
+    labels = {"method": "GET", "route": "/runs/{run_id}/profile", "status": "404"}
+    before = metrics.HTTP_REQUEST_DURATION.count(**labels)
+    client.get("/runs/no-such-run/profile", headers=HEADERS)
+    client.get("/runs/other-run/profile", headers=HEADERS)
+    assert metrics.HTTP_REQUEST_DURATION.count(**labels) == before + 2
+    client.get("/no/such/path", headers=HEADERS)
+    assert metrics.HTTP_REQUEST_DURATION.count(method="GET", route="unmatched", status="404") >= 1
+
+def test_scrape_does_not_touch_the_database():
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    client.get("/health", headers=HEADERS)
+    event.listen(Engine, "before_cursor_execute", count)
+    try:
+        response = client.get("/metrics", headers=HEADERS)
+    finally:
+        event.remove(Engine, "before_cursor_execute", count)
+    assert response.status_code == 200
+    assert statements == []
+    assert 'http_request_duration_seconds_count{method="GET",route="/health",status="200"}' in response.text
@@ -1,6 +1,10 @@
+import asyncio
+import time
 import pytest
+import requests
 from app.ingestion import drift
-from app.core.resilience import retry_with_backoff
+from app.core import resilience
+from app.core.resilience import retry_with_backoff, async_retry_with_backoff, TokenBucket, CircuitBreaker, CircuitOpenError
 from app.services import stats_service
 from app.models import ETLStatus, ETLCheckpoint
 from datetime import datetime
@@ -38,6 +42,102 @@ def test_retry_logic():
     assert result == "Success"
     assert mock_call_count == 3
 
+def _http_error(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.HTTPError(f"{status} error", response=response)
+
+def test_retry_honours_retry_after(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(resilience.time, "sleep", sleeps.append)
+    calls = 0
+
+    @retry_with_backoff(retries=3, backoff_factor=1)
+    def rate_limited():
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise _http_error(429, {"Retry-After": "7"})
+        return "ok"
+
+    assert rate_limited() == "ok"
+    assert sleeps == [7.0]
+
+def test_retry_ignores_malformed_retry_after(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(resilience.time, "sleep", sleeps.append)
+    assert resilience.retry_after_seconds(_http_error(503, {"Retry-After": "soon-ish"})) is None
+    calls = 0
+
+    @retry_with_backoff(retries=3, backoff_factor=1)
+    def unavailable():
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise _http_error(503, {"Retry-After": "not a date"})
+        return "ok"
+
+    # The header is ignored and the normal backoff applies
+    assert unavailable() == "ok"
+    assert calls == 2 and len(sleeps) == 1 and sleeps[0] < 2
+
+def test_retry_gives_up_on_client_errors(monkeypatch):
+    monkeypatch.setattr(resilience.time, "sleep", lambda s: None)
+    calls = 0
+
+    @retry_with_backoff(retries=3)
+    def not_found():
+        nonlocal calls
+        calls += 1
+        raise _http_error(404)
+
+    with pytest.raises(requests.HTTPError):
+        not_found()
+    assert calls == 1
+
+def test_async_retry(monkeypatch):
+    async def no_sleep(seconds):
+        pass
+    monkeypatch.setattr(resilience.asyncio, "sleep", no_sleep)
+    calls = 0
+
+    @async_retry_with_backoff(retries=3)
+    async def flaky():
+        nonlocal calls
+        calls += 1
+        if calls < 3:
+            raise ConnectionError("flap")
+        return calls
+
+    assert asyncio.run(flaky()) == 3
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=20, capacity=2)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # 2 tokens of burst, then 4 more at 20/s
+    assert time.monotonic() - start >= 0.18
+
+def test_circuit_breaker_opens_and_recovers():
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=0.1)
+
+    def boom():
+        raise ConnectionError("down")
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            breaker.call(boom)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: "never called")
+
+    time.sleep(0.12)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.call(lambda: "recovered") == "recovered"
+    assert breaker.state == CircuitBreaker.CLOSED
+
 def test_prometheus_metrics(db_session):
     """Test prometheus metrics generation."""
     # Setup data
@@ -47,8 +147,15 @@ def test_prometheus_metrics(db_session):
     db_session.add(cp)
     db_session.commit()
     
-    metrics = stats_service.generate_prometheus_metrics(db_session)
+    stats_service.load_etl_metrics(db_session)
+    metrics = stats_service.generate_prometheus_metrics()
     
     assert "etl_last_run_status 1" in metrics
     assert "etl_last_run_duration_seconds 5.0" in metrics
     assert 'etl_records_processed{source="test"} 100' in metrics
+
+    breaker = resilience.get_circuit_breaker("metrics_test")
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    metrics = stats_service.generate_prometheus_metrics()
+    assert 'circuit_breaker_state{source="metrics_test"} 2' in metrics
@@ -0,0 +1,122 @@
+import json
+import threading
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.core.database import SessionLocal
+from app.ingestion import connectors, profiling, runner
+from app.ingestion.connectors import SourceConnector
+from app.main import app
+from app.models import CryptoAsset, ETLCheckpoint
+from app.schemas.schemas import CryptoAssetCreate
+
+client = TestClient(app)
+HEADERS = {"X-API-Key": "test-key"}
+
+def test_spans_count_rows_and_round_trips():
+    profile = profiling.RunProfile("a" * 32)
+    db = SessionLocal()
+    try:
+        with profile.activate():
+            db.execute(text("SELECT 1"))
+            with profile.span("merge", "src"):
+                profiling.add(rows=5)
+                with profiling.span("upsert"):
+                    db.execute(text("SELECT 1"))
+                    db.commit()
+    finally:
+        db.close()
+    # Outside a profiled block nothing is charged
+    profiling.add(rows=100)
+
+    tree = profile.to_dict()
+    assert tree["db_round_trips"] == 3
+    source = tree["children"][0]
+    assert (source["name"], source["source"]) == ("src", "src")
+    merge = source["children"][0]
+    assert (merge["name"], merge["rows"], merge["calls"], merge["db_round_trips"]) == ("merge", 5, 1, 2)
+    assert merge["children"][0]["name"] == "upsert"
+    assert tree["wall_seconds"] >= merge["wall_seconds"] > 0
+
+def test_spans_aggregate_across_calls_and_threads():
+    profile = profiling.RunProfile("b" * 32)
+
+    def stage():
+        for _ in range(3):
+            with profile.span("transform", "src"):
+                sum(range(20000))
+
+    with profile.activate():
+        worker = threading.Thread(target=stage)
+        worker.start()
+        worker.join()
+    profile.record("extract", "src", wall=0.5, cpu=0.1, rows=7)
+
+    tree = profile.to_dict()
+    stages = {span["name"]: span for span in tree["children"][0]["children"]}
+    assert stages["transform"]["calls"] == 3
+    assert (stages["extract"]["wall_seconds"], stages["extract"]["rows"]) == (0.5, 7)
+    # The worker's CPU time counts towards the run as well
+    assert tree["cpu_seconds"] >= stages["transform"]["cpu_seconds"] + 0.1
+    totals = profiling.stage_totals(tree)
+    assert totals["extract"]["rows"] == 7
+    assert set(profiling.flatten(tree)) == {"src", "src/transform", "src/extract"}
+
+def test_otel_export(tmp_path):
+    profile = profiling.RunProfile("c" * 32)
+    with profile.activate():
+        with profile.span("merge", "src"):
+            pass
+    path = tmp_path / "spans.jsonl"
+    profile.export_otel(str(path))
+    spans = json.loads(path.read_text())["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    by_name = {span["name"]: span for span in spans}
+    assert set(by_name) == {"etl.run", "etl.src", "etl.merge"}
+    assert all(span["traceId"] == "c" * 32 for span in spans)
+    assert by_name["etl.merge"]["parentSpanId"] == by_name["etl.src"]["spanId"]
+    assert int(by_name["etl.run"]["endTimeUnixNano"]) >= int(by_name["etl.run"]["startTimeUnixNano"])
+
+class ProfiledConnector(SourceConnector):
+    name = "profile_src"
+    priority = 5
+
+    def fetch(self, validators=None):
+        return [{"symbol": "PROFX", "price": 1.0}]
+
+    def load_raw(self, db, data, run_id=None):
+        pass
+
+    def transform(self, data):
+        return [CryptoAssetCreate(id="PROFX", symbol="PROFX", name="Prof", price_usd=item["price"], source=self.name) for item in data]
+
+def test_run_profile_endpoint_and_stage_diff(db_session):
+    connectors.register(ProfiledConnector())
+    try:
+        first = runner.run_etl(sources=["profile_src"])
+        second = runner.run_etl(sources=["profile_src"])
+    finally:
+        connectors.unregister("profile_src")
+        db_session.query(CryptoAsset).filter(CryptoAsset.id == "PROFX").delete()
+        db_session.query(ETLCheckpoint).filter(ETLCheckpoint.source == "profile_src").delete()
+        db_session.commit()
+        runner.change_tracker.clear()
+
+    response = client.get(f"/runs/{first}/profile", headers=HEADERS)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == "success"
+    assert set(body["stages"]) == {"extract", "raw_load", "transform", "merge"}
+    assert body["stages"]["extract"]["rows"] == 1
+    assert body["profile"]["db_round_trips"] > 0
+    source = next(span for span in body["profile"]["children"] if span["source"] == "profile_src")
+    merge = next(span for span in source["children"] if span["name"] == "merge")
+    assert "upsert" in {span["name"] for span in merge["children"]}
+
+    second_id = client.get(f"/runs/{second}/profile", headers=HEADERS).json()["id"]
+    comparison = client.get(f"/compare-runs?run_id_1={body['id']}&run_id_2={second_id}", headers=HEADERS).json()
+    assert "duration_diff" in comparison["diff"]
+    assert "wall_seconds_diff" in comparison["stages"]["merge"]
+    assert "profile_src/merge" in comparison["spans"]
+
+    assert client.get("/runs/does-not-exist/profile", headers=HEADERS).status_code == 404
@@ -0,0 +1,95 @@
+import asyncio
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+
+from app.core import replicas
+from app.core.database import Base, async_url
+from app.main import app
+from app.models import CryptoAsset
+
+client = TestClient(app)
+HEADERS = {"X-API-Key": "test-key"}
+
+PRIMARY_URL = os.getenv("DATABASE_URL", "postgresql://user:password@db:5432/crypto_db")
+# The "replica" is a second database on the same server, which is enough to
+# tell which one served a read
+REPLICA_URL = make_url(PRIMARY_URL).set(database="crypto_db_replica").render_as_string(hide_password=False)
+DOWN_URL = make_url(PRIMARY_URL).set(port=1).render_as_string(hide_password=False)
+
+def _reset_assets(url: str, asset_id: str):
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.query(CryptoAsset).delete()
+    db.add(CryptoAsset(id=asset_id, symbol=asset_id, name=asset_id, price_usd=1, market_cap=1, source="test"))
+    db.commit()
+    db.close()
+    engine.dispose()
+
+@pytest.fixture
+def replica_db(db_session):
+    admin = create_engine(PRIMARY_URL, isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        if not conn.execute(text("SELECT 1 FROM pg_database WHERE datname = 'crypto_db_replica'")).scalar():
+            conn.execute(text("CREATE DATABASE crypto_db_replica"))
+    admin.dispose()
+    _reset_assets(REPLICA_URL, "ON_REPLICA")
+    _reset_assets(PRIMARY_URL, "ON_PRIMARY")
+
+def _served_by():
+    body = client.get("/data?count=none", headers=HEADERS).json()
+    return [asset["id"] for asset in body["data"]]
+
+def test_reads_go_to_replica(replica_db, monkeypatch):
+    monkeypatch.setattr(replicas, "router", replicas.ReplicaRouter([REPLICA_URL]))
+    assert _served_by() == ["ON_REPLICA"]
+
+def test_read_your_writes_uses_primary(replica_db, monkeypatch):
+    monkeypatch.setattr(replicas, "router", replicas.ReplicaRouter([REPLICA_URL]))
+    # A plain database is not a standby, so it can't prove it has our writes
+    body = client.get("/data?count=none", headers={**HEADERS, "X-Read-Your-Writes": "true"}).json()
+    assert [asset["id"] for asset in body["data"]] == ["ON_PRIMARY"]
+
+def test_failover_to_primary_when_replicas_are_down(replica_db, monkeypatch):
+    monkeypatch.setattr(replicas, "router", replicas.ReplicaRouter([DOWN_URL]))
+    assert _served_by() == ["ON_PRIMARY"]
+    assert replicas.router.status()[0]["healthy"] is False
+
+    health = client.get("/health", headers=HEADERS).json()
+    assert health["replicas"][0]["healthy"] is False
+
+def test_round_robin_skips_unhealthy(replica_db):
+    router = replicas.ReplicaRouter([REPLICA_URL, DOWN_URL, REPLICA_URL])
+
+    async def pick(n):
+        return [(await router.choose()) for _ in range(n)]
+
+    chosen = asyncio.run(pick(4))
+    assert all(replica is not None and replica.healthy for replica in chosen)
+    # Round robin still alternates between the two healthy entries
+    assert {id(replica) for replica in chosen} == {id(router.replicas[0]), id(router.replicas[2])}
+
+def test_record_primary_write(db_session):
+    replicas.record_primary_write(db_session)
+    first = replicas.last_write_lsn()
+    assert first > 0
+    replicas.record_primary_write(db_session)
+    assert replicas.last_write_lsn() >= first
+
+def test_parse_lsn():
+    assert replicas.parse_lsn("0/16B3748") == 0x16B3748
+    assert replicas.parse_lsn("1/0") == 1 << 32
+    assert replicas.parse_lsn(None) is None
+
+def test_async_url_translates_libpq_options(caplog):
+    url = make_url(async_url("postgresql://u:p@db:5432/crypto?sslmode=require&target_session_attrs=read-write&connect_timeout=5"))
+    assert url.drivername == "postgresql+asyncpg"
+    assert url.password == "p"
+    assert dict(url.query) == {"ssl": "require", "target_session_attrs": "read-write"}
+    assert "connect_timeout" in caplog.text
+    assert make_url(async_url("postgresql://u@db/crypto")).query == {}
@@ -0,0 +1,75 @@
+import gzip
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+
+from app.ingestion import connectors, retention
+from app.main import app
+from app.models import RawCSV
+
+client = TestClient(app)
+HEADERS = {"X-API-Key": "test-key"}
+NOW = datetime.now(timezone.utc)
+OLD = datetime(2001, 2, 3, 12, 0, tzinfo=timezone.utc)
+RUN_ID = "retention-test"
+
+def _csv():
+    return next(c for c in connectors.get_connectors() if c.name == "csv")
+
+def _seed(db_session, old=5, recent=2):
+    db_session.query(RawCSV).filter(RawCSV.run_id == RUN_ID).delete(synchronize_session=False)
+    for i in range(old):
+        db_session.add(RawCSV(symbol=f"OLD{i}", raw_data={"symbol": f"OLD{i}"}, run_id=RUN_ID, ingested_at=OLD + timedelta(days=i % 2)))
+    for i in range(recent):
+        db_session.add(RawCSV(symbol=f"NEW{i}", raw_data={"symbol": f"NEW{i}"}, run_id=RUN_ID, ingested_at=NOW))
+    db_session.commit()
+
+def _remaining(db_session):
+    return sorted(row.symbol for row in db_session.query(RawCSV).filter(RawCSV.run_id == RUN_ID))
+
+def test_dry_run_deletes_nothing(db_session):
+    _seed(db_session)
+    result = retention.prune_source(db_session, _csv(), dry_run=True)
+    assert result["rows"] == 5
+    assert result["bytes"] > 0
+    assert len(_remaining(db_session)) == 7
+
+def test_prune_in_batches_and_archive(db_session, tmp_path):
+    _seed(db_session)
+    result = retention.prune_source(db_session, _csv(), archive_dir=str(tmp_path), batch_size=2)
+    assert result["rows"] == 5
+    assert result["archived"] == 5
+    assert result["bytes"] > 0
+    assert _remaining(db_session) == ["NEW0", "NEW1"]
+
+    # One file per ingestion day, appended to batch by batch
+    files = sorted(os.listdir(tmp_path / "raw_csv"))
+    assert files == ["2001-02-03.jsonl.gz", "2001-02-04.jsonl.gz"]
+    with gzip.open(tmp_path / "raw_csv" / files[0], "rt") as f:
+        rows = [json.loads(line) for line in f]
+    assert sorted(row["symbol"] for row in rows) == ["OLD0", "OLD2", "OLD4"]
+    assert rows[0]["raw_data"] == {"symbol": rows[0]["symbol"]}
+    assert rows[0]["ingested_at"].startswith("2001-02-03")
+
+def test_per_source_ttl_override(db_session, monkeypatch):
+    _seed(db_session)
+    monkeypatch.setenv("RAW_RETENTION_CSV_DAYS", "0")
+    assert retention.prune_source(db_session, _csv())["rows"] == 0
+    assert len(_remaining(db_session)) == 7
+    monkeypatch.setenv("RAW_RETENTION_CSV_DAYS", "36500")
+    assert retention.prune_source(db_session, _csv())["rows"] == 0
+
+def test_run_retention_exports_metrics(db_session):
+    _seed(db_session)
+    before = retention.stats()["reclaimed"].get("csv", {}).get("rows", 0)
+    results = retention.run_retention(db_session, sources=["csv"], archive_dir="")
+    assert results["csv"]["rows"] == 5
+    assert retention.stats()["reclaimed"]["csv"]["rows"] == before + 5
+
+    body = client.get("/metrics", headers=HEADERS).text
+    assert 'raw_retention_rows_deleted_total{source="csv"}' in body
+    assert 'raw_retention_bytes_reclaimed_total{source="csv"}' in body
+    db_session.query(RawCSV).filter(RawCSV.run_id == RUN_ID).delete(synchronize_session=False)
+    db_session.commit()
@@ -0,0 +1,126 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.ingestion import runner, scheduler as scheduler_module
+from app.ingestion.scheduler import CronSchedule, IntervalSchedule, RunInProgress, Scheduler, lock_key, parse_schedule
+from app.main import app
+from app.models import ETLStatus
+
+client = TestClient(app)
+HEADERS = {"X-API-Key": "test-key"}
+
+def _ts(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+def _utc(ts):
+    return datetime.fromtimestamp(ts, tz=timezone.utc)
+
+def test_parse_schedule():
+    assert isinstance(parse_schedule("300"), IntervalSchedule)
+    assert isinstance(parse_schedule("*/5 * * * *"), CronSchedule)
+    assert parse_schedule("off") is None
+    for bad in ("* * *", "61 * * * *", "*/0 * * * *", "-5"):
+        with pytest.raises(ValueError):
+            parse_schedule(bad)
+
+def test_cron_next_after():
+    every_15 = CronSchedule("*/15 * * * *")
+    assert _utc(every_15.next_after(_ts(2025, 1, 1, 10, 7, 30))) == datetime(2025, 1, 1, 10, 15, tzinfo=timezone.utc)
+    assert _utc(every_15.next_after(_ts(2025, 1, 1, 10, 45))) == datetime(2025, 1, 1, 11, 0, tzinfo=timezone.utc)
+    # Mondays at 03:00; 2025-01-01 is a Wednesday
+    monday = CronSchedule("0 3 * * 1")
+    assert _utc(monday.next_after(_ts(2025, 1, 1))) == datetime(2025, 1, 6, 3, 0, tzinfo=timezone.utc)
+    # Day and weekday both set: either matches
+    either = CronSchedule("0 0 15 * 0")
+    assert _utc(either.next_after(_ts(2025, 1, 1))) == datetime(2025, 1, 5, tzinfo=timezone.utc)
+    leap = CronSchedule("0 12 29 2 *")
+    assert _utc(leap.next_after(_ts(2025, 1, 1))) == datetime(2028, 2, 29, 12, 0, tzinfo=timezone.utc)
+
+class FakeRun:
+    """Stands in for run_etl: blocks until released or cancelled."""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.cancelled = []
+
+    def __call__(self, sources, run_id, cancel):
+        self.calls.append(sources)
+        while not self.release.is_set():
+            if cancel.wait(0.01):
+                self.cancelled.append(run_id)
+                return run_id
+        return run_id
+
+def test_trigger_is_single_flight_per_source():
+    fake = FakeRun()
+    sched = Scheduler(schedules={}, run=fake)
+    run_id = sched.trigger(["csv"])
+    with pytest.raises(RunInProgress) as e:
+        sched.trigger(["csv", "coingecko"])
+    assert e.value.run_id == run_id
+    # Sources that are not busy can still run alongside
+    other = sched.trigger(["coingecko"])
+    assert sched.running() == {"csv": run_id, "coingecko": other}
+    fake.release.set()
+    assert sched.wait(run_id, 5) and sched.wait(other, 5)
+    assert sched.running() == {}
+    assert sched.trigger(["csv"]) is not None
+
+def test_advisory_lock_blocks_other_nodes(db_session):
+    # Another node holding the csv lock
+    db_session.execute(text("SELECT pg_advisory_lock(:key)"), {"key": lock_key("csv")})
+    try:
+        fake = FakeRun()
+        fake.release.set()
+        sched = Scheduler(schedules={}, run=fake)
+        with pytest.raises(RunInProgress) as e:
+            sched.trigger(["csv", "coingecko"])
+        assert e.value.sources == ["csv"] and e.value.run_id is None
+        run_id = sched.trigger(["csv", "coingecko"], skip_busy=True)
+        sched.wait(run_id, 5)
+        assert fake.calls == [["coingecko"]]
+    finally:
+        db_session.execute(text("SELECT pg_advisory_unlock_all()"))
+        db_session.commit()
+
+def test_loop_runs_on_schedule_and_stop_cancels():
+    fake = FakeRun()
+    fake.release.set()
+    sched = Scheduler(schedules={"csv": IntervalSchedule(0.05)}, jitter=0, run=fake)
+    sched.start()
+    time.sleep(0.3)
+    fake.release.clear()
+    time.sleep(0.1)
+    sched.stop(timeout=5)
+    assert len(fake.calls) >= 2
+    assert all(sources == ["csv"] for sources in fake.calls)
+    assert fake.cancelled
+    assert sched.running() == {}
+
+def test_etl_run_endpoint_returns_run_id_and_409(monkeypatch):
+    fake = FakeRun()
+    monkeypatch.setattr(scheduler_module.scheduler, "run", fake)
+    response = client.post("/etl/run", headers=HEADERS)
+    assert response.status_code == 200
+    run_id = response.json()["run_id"]
+
+    response = client.post("/etl/run?source=csv", headers=HEADERS)
+    assert response.status_code == 409
+    assert response.json()["detail"]["run_id"] == run_id
+
+    assert client.post("/etl/run?source=nope", headers=HEADERS).status_code == 400
+    fake.release.set()
+    assert scheduler_module.scheduler.wait(run_id, 5)
+
+def test_run_etl_records_cancellation(db_session):
+    cancel = threading.Event()
+    cancel.set()
+    run_id = runner.run_etl(sources=["csv"], cancel=cancel)
+    status = db_session.query(ETLStatus).filter(ETLStatus.run_id == run_id).order_by(ETLStatus.id.desc()).first()
+    assert status.status == "cancelled"
@@ -0,0 +1,105 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.models import CryptoAsset
+from app.services import search_service
+
+client = TestClient(app)
+HEADERS = {"X-API-Key": "test-key"}
+
+ASSETS = [
+    ("bitcoin", "BTC", "Bitcoin", 1e12),
+    ("ethereum", "ETH", "Ethereum", 4e11),
+    ("bitcoin-cash", "BCH", "Bitcoin Cash", 9e9),
+    ("bitget-token", "BGB", "Bitget Token", 5e9),
+    ("wrapped-bitcoin", "wbtc", "Wrapped Bitcoin", 8e9),
+    ("btc-clone", "BTCC", "Clone", None),
+]
+
+def _index():
+    ranked = sorted(ASSETS, key=lambda a: (a[3] if a[3] is not None else float("-inf"), a[0]), reverse=True)
+    return search_service.SearchIndex(ranked)
+
+def test_exact_then_prefix_by_market_cap():
+    results = _index().search("btc")
+    # Case-insensitive; an exact symbol beats a prefix match with any market cap
+    assert [(r["id"], r["match"]) for r in results[:2]] == [("bitcoin", "exact"), ("btc-clone", "prefix")]
+    assert _index().search("WBTC")[0]["id"] == "wrapped-bitcoin"
+
+    results = _index().search("Bit")
+    # Names, ids and words in names all match as prefixes, biggest market cap first
+    assert [r["id"] for r in results[:4]] == ["bitcoin", "bitcoin-cash", "wrapped-bitcoin", "bitget-token"]
+    assert {r["match"] for r in results[:4]} == {"prefix"}
+
+def test_fuzzy_matches_typos():
+    results = _index().search("etherum")
+    assert results[0]["id"] == "ethereum"
+    assert results[0]["match"] == "fuzzy"
+    assert 0.3 <= results[0]["score"] < 1
+    assert _index().search("zzzz") == []
+
+def test_limit_and_empty_query():
+    assert len(_index().search("b", limit=2)) == 2
+    try:
+        _index().search("   ")
+        assert False, "expected InvalidSearch"
+    except search_service.InvalidSearch:
+        pass
+
+def test_search_endpoint_refreshes_after_invalidate(db_session):
+    db_session.query(CryptoAsset).filter(CryptoAsset.id.like("srch-%")).delete(synchronize_session=False)
+    db_session.add_all([
+        CryptoAsset(id="srch-small", symbol="SRCHS", name="Searchcoin Small", price_usd=1.0, market_cap=10.0, source="csv"),
+        CryptoAsset(id="srch-big", symbol="srchb", name="Searchcoin Big", price_usd=1.0, market_cap=1000.0, source="csv"),
+    ])
+    db_session.commit()
+    try:
+        search_service.search_index.clear()
+        # The first index is built in the background; meanwhile Postgres answers
+        response = client.get("/search", params={"q": "SRCH"}, headers=HEADERS)
+        if search_service._trgm_ready:
+            assert response.status_code == 200 and response.json()["backend"] == "pg_trgm"
+            assert [r["id"] for r in response.json()["results"]] == ["srch-big", "srch-small"]
+        else:
+            assert response.status_code == 503
+        search_service.search_index.join()
+        response = client.get("/search", params={"q": "SRCH"}, headers=HEADERS)
+        assert response.status_code == 200
+        body = response.json()
+        assert body["backend"] == "memory"
+        assert [r["id"] for r in body["results"]] == ["srch-big", "srch-small"]
+
+        db_session.query(CryptoAsset).filter(CryptoAsset.id == "srch-big").delete()
+        db_session.commit()
+        # Still served from the index built before the delete until it is invalidated
+        assert len(client.get("/search", params={"q": "srch"}, headers=HEADERS).json()["results"]) == 2
+        search_service.search_index.invalidate()
+        # ... and then while the rebuild runs in the background
+        assert len(client.get("/search", params={"q": "srch"}, headers=HEADERS).json()["results"]) == 2
+        search_service.search_index.join()
+        assert [r["id"] for r in client.get("/search", params={"q": "srch"}, headers=HEADERS).json()["results"]] == ["srch-small"]
+
+        assert client.get("/search", params={"q": ""}, headers=HEADERS).status_code == 422
+        assert client.get("/search", params={"q": "  "}, headers=HEADERS).status_code == 400
+    finally:
+        db_session.query(CryptoAsset).filter(CryptoAsset.id.like("srch-%")).delete(synchronize_session=False)
+        db_session.commit()
+
+def test_pg_trgm_backend_matches_memory_ranking(db_session):
+    if not search_service.ensure_trgm_indexes(db_session.get_bind()):
+        pytest.skip("pg_trgm is not available")
+    db_session.query(CryptoAsset).filter(CryptoAsset.id.like("srch-%")).delete(synchronize_session=False)
+    db_session.add_all([
+        CryptoAsset(id="srch-eth", symbol="SRCHETH", name="Srchethereum", price_usd=1.0, market_cap=5.0, source="csv"),
+        CryptoAsset(id="srch-cash", symbol="SRCHC", name="Srch Cash", price_usd=1.0, market_cap=50.0, source="csv"),
+    ])
+    db_session.commit()
+    try:
+        results = search_service.search_database(db_session, "SRCH")
+        assert [(r["id"], r["match"]) for r in results[:2]] == [("srch-cash", "prefix"), ("srch-eth", "prefix")]
+        assert search_service.search_database(db_session, "cash")[0]["id"] == "srch-cash"
+        assert search_service.search_database(db_session, "srchetherum")[0]["match"] == "fuzzy"
+    finally:
+        db_session.query(CryptoAsset).filter(CryptoAsset.id.like("srch-%")).delete(synchronize_session=False)
+        db_session.commit()
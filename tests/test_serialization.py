@@ -0,0 +1,34 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core import serialization
+from app.schemas.schemas import CryptoAssetResponse
+
+def test_dumps_matches_pydantic_encoding():
+    asset = {
+        "symbol": "BTC", "name": "Bitcoin", "price_usd": 1.5, "market_cap": None,
+        "id": "bitcoin", "source": "coingecko", "last_updated": datetime(2025, 1, 2, 3, 4, 5, 678, tzinfo=timezone.utc),
+    }
+    assert serialization.dumps(asset) == CryptoAssetResponse(**asset).model_dump_json().encode()
+    assert serialization.dumps({"value": Decimal("1.5")}) == b'{"value":1.5}'
+
+def test_compression_skips_event_streams():
+    app = FastAPI(default_response_class=serialization.FastJSONResponse)
+    app.add_middleware(serialization.CompressionMiddleware, minimum_size=100)
+
+    @app.get("/big")
+    def big():
+        return {"rows": ["x" * 10] * 100}
+
+    @app.get("/stream/big")
+    def stream():
+        return {"rows": ["x" * 10] * 100}
+
+    client = TestClient(app)
+    response = client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.json() == {"rows": ["x" * 10] * 100}
+    assert "content-encoding" not in client.get("/stream/big", headers={"Accept-Encoding": "gzip"}).headers
@@ -0,0 +1,127 @@
+import asyncio
+import json
+
+from sqlalchemy import text
+
+from app.core import metrics
+from app.core.database import engine
+from app.ingestion import loader
+from app.models import CryptoAsset
+from app.services.stream_service import PriceHub
+
+async def _next(stream, timeout: float = 5.0) -> bytes:
+    return await asyncio.wait_for(stream.__anext__(), timeout)
+
+def _data(chunk: bytes) -> list:
+    return json.loads(chunk.split(b"data: ", 1)[1])
+
+def test_fan_out_by_symbol_skips_unchanged_prices():
+    async def scenario():
+        hub = PriceHub()
+        everything = hub.events(hub.subscribe())
+        btc_only = hub.events(hub.subscribe(["btc"]))
+        assert (await _next(everything)).startswith(b"retry:")
+        assert b"BTC" in await _next(btc_only)
+
+        hub.publish("2025-01-01T00:00:00+00:00", [["bitcoin", "BTC", 100.0, 1e9], ["ethereum", "ETH", 10.0, None]])
+        assert [d["id"] for d in _data(await _next(everything))] == ["bitcoin", "ethereum"]
+        assert _data(await _next(btc_only)) == [
+            {"id": "bitcoin", "symbol": "BTC", "price_usd": 100.0, "market_cap": 1e9, "last_updated": "2025-01-01T00:00:00+00:00"}
+        ]
+
+        # A rewrite with the same values is not pushed
+        hub.publish("2025-01-01T01:00:00+00:00", [["bitcoin", "BTC", 100.0, 1e9], ["ethereum", "ETH", 11.0, None]])
+        assert [d["price_usd"] for d in _data(await _next(everything))] == [11.0]
+        assert hub.subscribers == 2
+        await everything.aclose()
+        await btc_only.aclose()
+        assert hub.subscribers == 0
+
+    asyncio.run(scenario())
+
+def test_slow_client_drop_policies():
+    async def scenario(policy):
+        hub = PriceHub(max_events=2, policy=policy)
+        stream = hub.events(hub.subscribe())
+        await _next(stream)
+        for price in (1.0, 2.0, 3.0):
+            hub.publish("ts", [["slowcoin", "SLOW", price, None]])
+        chunks = [await _next(stream)]
+        if policy == "drop_oldest":
+            chunks += [await _next(stream), await _next(stream)]
+        await stream.aclose()
+        return chunks
+
+    dropped, first, second = asyncio.run(scenario("drop_oldest"))
+    assert dropped.startswith(b"event: dropped") and _data(dropped) == {"dropped": 1}
+    assert [_data(c)[0]["price_usd"] for c in (first, second)] == [2.0, 3.0]
+
+    (overflow,) = asyncio.run(scenario("disconnect"))
+    assert overflow.startswith(b"event: overflow")
+
+def test_dropped_metric_counts_the_discarded_events():
+    def dropped_after(policy):
+        hub = PriceHub(max_events=2, policy=policy)
+        subscriber = hub.subscribe()
+        before = metrics.STREAM_DROPPED.value(policy=policy)
+        # Two changes, then one: the events have different sizes
+        hub.publish("ts", [["dropcoin", "DROP", 1.0, None], ["dropeth", "DROPE", 1.0, None]])
+        hub.publish("ts", [["dropcoin", "DROP", 2.0, None]])
+        hub.publish("ts", [["dropcoin", "DROP", 3.0, None]])
+        hub.unsubscribe(subscriber)
+        return metrics.STREAM_DROPPED.value(policy=policy) - before, subscriber
+
+    # The oldest (two-change) event is the one discarded
+    lost, subscriber = dropped_after("drop_oldest")
+    assert lost == 2 and subscriber.dropped == 2
+    # Everything queued plus the event that overflowed
+    lost, subscriber = dropped_after("disconnect")
+    assert lost == 4 and subscriber.closed
+
+def _clear(db_session):
+    db_session.query(CryptoAsset).filter(CryptoAsset.id.like("stream-%")).delete(synchronize_session=False)
+    db_session.commit()
+
+def _row(i, price=1.0):
+    return {"id": f"stream-{i}", "symbol": f"STRM{i}", "name": f"Stream {i}", "price_usd": price, "market_cap": None, "source": "csv"}
+
+def test_load_notifies_written_rows_in_chunks(db_session):
+    _clear(db_session)
+    listener = engine.raw_connection()
+    try:
+        listener.set_isolation_level(0)
+        listener.cursor().execute(f"LISTEN {loader.PRICE_CHANNEL}")
+        loader.load_unified_data(db_session, [_row(i) for i in range(400)], history=False)
+        listener.poll()
+        payloads = [n.payload for n in listener.notifies]
+    finally:
+        listener.close()
+        _clear(db_session)
+    assert len(payloads) > 1
+    assert all(len(payload) < 8000 for payload in payloads)
+    rows = [row for payload in payloads for row in json.loads(payload)["rows"]]
+    assert sorted(row[0] for row in rows) == sorted(f"stream-{i}" for i in range(400))
+
+def test_listen_delivers_commits_to_subscribers(db_session):
+    _clear(db_session)
+
+    async def scenario():
+        hub = PriceHub()
+        stream = hub.events(hub.subscribe(["STRM1"]))
+        await _next(stream)
+        listener = asyncio.get_running_loop().create_task(hub.listen())
+        try:
+            # Give the listener time to connect before the commit
+            await asyncio.sleep(0.5)
+            await asyncio.to_thread(loader.load_unified_data, db_session, [_row(1, 5.0), _row(2, 6.0)], history=False)
+            return _data(await _next(stream))
+        finally:
+            listener.cancel()
+            await stream.aclose()
+
+    try:
+        deltas = asyncio.run(scenario())
+    finally:
+        _clear(db_session)
+    assert [(d["id"], d["price_usd"]) for d in deltas] == [("stream-1", 5.0)]
+    assert deltas[0]["last_updated"]